@@ -0,0 +1,178 @@
+"""Measuring helpers shared by the benchmarks of both tasks.
+
+The benchmarks of task5 and task6 define only their workloads and import
+the measuring from here. They run from their own directories, so they add
+the directory of this file to the import path first.
+
+A timed case is a function of the map size and the number of sessions
+that prepares a step and returns it with the number of operations it
+does. Every case is timed for a range of sizes and, where it matters, of
+session counts. The results are printed or written as JSON, and can be
+compared against a baseline file: a case slower than its baseline by more
+than the threshold is a regression, and the run exits with 1.
+
+functions:
+    allocated
+    measure
+    run
+    compare
+    main
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+Case = Callable[[int, int], tuple[Callable[[], None], int]]
+# A case and whether it depends on the map size and on the number of sessions.
+Cases = dict[str, tuple[Case, bool, bool]]
+
+THRESHOLD = 0.25
+# The size recorded for the cases that do not depend on it.
+FIXED_SIZE = 3
+
+
+def allocated(build: Callable[[], object]) -> tuple[int, object]:
+    """Get the bytes allocated by a function and keep what it built alive.
+
+    Args:
+        build (Callable[[], object]): The function that builds the objects.
+
+    Returns:
+        tuple[int, object]: The bytes still allocated after the call and
+            what the function returned.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    built = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used, built
+
+
+def measure(step: Callable[[], None], ops: int, repeat: int) -> float:
+    """Get the nanoseconds per operation of the fastest of repeated runs.
+
+    Args:
+        step (Callable[[], None]): The step to time.
+        ops (int): The number of operations of a step.
+        repeat (int): The runs of the step.
+
+    Returns:
+        float: The nanoseconds per operation.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        began = time.perf_counter()
+        step()
+        best = min(best, time.perf_counter() - began)
+    return best / ops * 1e9
+
+
+def run(
+    cases: Cases,
+    sizes: list[int],
+    sessions: list[int],
+    names: list[str] | None = None,
+    repeat: int = 5,
+) -> dict:
+    """Time the cases.
+
+    Args:
+        cases (Cases): The cases of a benchmark by name.
+        sizes (list[int]): The map sizes, for the cases that depend on them.
+        sessions (list[int]): The numbers of sessions, for the cases that
+            play many games.
+        names (list[str] | None): The names of the cases to time, all if
+            not given.
+        repeat (int): The runs of each case, the fastest one counts.
+
+    Returns:
+        dict: The environment and a result for every case, size and
+            number of sessions.
+    """
+    results = []
+    for name in names or cases:
+        case, by_size, by_sessions = cases[name]
+        for size in sizes if by_size else [FIXED_SIZE]:
+            for count in sessions if by_sessions else [1]:
+                step, ops = case(size, count)
+                results.append(
+                    {
+                        "case": name,
+                        "size": size,
+                        "sessions": count,
+                        "ns_per_op": round(measure(step, ops, repeat), 1),
+                    }
+                )
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = THRESHOLD) -> list[str]:
+    """Find the cases slower than their baseline.
+
+    Args:
+        current (dict): The results of run.
+        baseline (dict): Stored results of run.
+        threshold (float): The allowed slowdown, 0.25 is 25% slower.
+
+    Returns:
+        list[str]: A description of every regression.
+    """
+    key = lambda result: (result["case"], result["size"], result["sessions"])
+    stored = {key(result): result["ns_per_op"] for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = stored.get(key(result))
+        if before and result["ns_per_op"] > before * (1 + threshold):
+            regressions.append(
+                f"{result['case']} size={result['size']} sessions={result['sessions']}: "
+                f"{before:.0f} -> {result['ns_per_op']:.0f} ns/op"
+            )
+    return regressions
+
+
+def main(cases: Cases, sizes: list[int], sessions: list[int], description: str) -> None:
+    """Run the cases of a benchmark from the command line.
+
+    Args:
+        cases (Cases): The cases of the benchmark by name.
+        sizes (list[int]): The default map sizes.
+        sessions (list[int]): The default numbers of sessions.
+        description (str): The description of the command.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--cases", nargs="+", choices=cases)
+    parser.add_argument("--sizes", type=int, nargs="+", default=sizes)
+    parser.add_argument("--sessions", type=int, nargs="+", default=sessions)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results as JSON to a file")
+    parser.add_argument("--baseline", help="compare against a stored baseline")
+    parser.add_argument("--save-baseline", metavar="PATH", help="store the results as a baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+    results = run(cases, args.sizes, args.sessions, args.cases, args.repeat)
+    text = json.dumps(results, indent=2)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(text + "\n")
+    if not args.output:
+        print(text)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
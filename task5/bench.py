@@ -0,0 +1,88 @@
+"""The timed cases of moving between rooms and fighting, run and compared by benchkit.py.
+
+Usage:
+    python bench.py --output results.json
+    python bench.py --baseline bench_baseline.json
+    python bench.py --save-baseline bench_baseline.json
+"""
+from __future__ import annotations
+
+import contextlib
+import io
+import os
+import sys
+from random import Random
+from typing import Callable
+
+import game
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import benchkit  # noqa: E402
+
+SIZES = [3, 100, 10000]
+SESSIONS = [1, 100, 1000]
+DIRECTIONS = ["north", "south", "east", "west"]
+
+
+def _world(size: int) -> list[game.Room]:
+    """Build a corridor of rooms linked both ways, with an enemy in every room."""
+    rooms = [game.Room(f"Room {i}") for i in range(size)]
+    for room, next_room in zip(rooms, rooms[1:]):
+        room.link_room(next_room, "south")
+        next_room.link_room(room, "north")
+    for i, room in enumerate(rooms):
+        enemy = game.Enemy(f"Enemy {i}", "")
+        enemy.set_weakness("cheese" if i % 2 else "book")
+        room.set_character(enemy)
+    return rooms
+
+
+def room_move(size: int, sessions: int) -> tuple[Callable[[], None], int]:
+    """Move the players of many sessions through one world, in turns."""
+    rooms = _world(size)
+    rng = Random(0)
+    directions = [rng.choice(DIRECTIONS) for _ in range(4096)]
+    current = [rooms[rng.randrange(size)] for _ in range(sessions)]
+    moves = max(4000, sessions)
+
+    def step() -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(moves):
+                session = i % sessions
+                current[session] = current[session].move(directions[i & 4095])
+
+    return step, moves
+
+
+def enemy_fight(size: int, sessions: int) -> tuple[Callable[[], None], int]:
+    """Fight the enemies of a world in many sessions, in turns."""
+    rooms = _world(size)
+    states = [game.GameState() for _ in range(sessions)]
+    rng = Random(0)
+    fights = [
+        (rooms[rng.randrange(size)].character, rng.choice(["cheese", "book"]))
+        for _ in range(4096)
+    ]
+    count = max(4000, sessions)
+
+    def step() -> None:
+        for i in range(count):
+            enemy, item = fights[i & 4095]
+            enemy.fight(item, states[i % sessions])
+
+    return step, count
+
+
+CASES: benchkit.Cases = {
+    "room_move": (room_move, True, True),
+    "enemy_fight": (enemy_fight, True, True),
+}
+
+
+def main() -> None:
+    """Run the benchmarks from the command line."""
+    benchkit.main(CASES, SIZES, SESSIONS, "Benchmark the hot paths.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""The bytes per object of big task5 worlds of linked rooms.
+
+Reports the bytes per room, enemy and item with the slotted classes and
+with subclasses that have a __dict__ again.
+
+Usage:
+    python bench_memory.py --max 1000000
+"""
+import argparse
+import os
+import sys
+
+import game
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchkit import allocated  # noqa: E402
+
+DictRoom = type("DictRoom", (game.Room,), {})
+DictEnemy = type("DictEnemy", (game.Enemy,), {})
+DictItem = type("DictItem", (game.Item,), {})
+
+
+def _per_object(build, count: int) -> float:
+    """Get the bytes allocated per object by a function that builds a list."""
+    return allocated(build)[0] / count
+
+
+def _linked_rooms(count: int, room_class: type) -> list:
+    """Build a corridor of rooms linked both ways."""
+    rooms = [room_class("Room") for _ in range(count)]
+    for room, next_room in zip(rooms, rooms[1:]):
+        room.link_room(next_room, "south")
+        next_room.link_room(room, "north")
+    return rooms
+
+
+def bench(count: int) -> dict[str, float]:
+    """Measure the bytes per room, enemy and item.
+
+    Args:
+        count (int): The number of rooms.
+
+    Returns:
+        dict[str, float]: The bytes per object.
+    """
+    stats = {}
+    for label, room_class, enemy_class, item_class in (
+        ("slots", game.Room, game.Enemy, game.Item),
+        ("dict", DictRoom, DictEnemy, DictItem),
+    ):
+        stats[f"{label}_room"] = _per_object(lambda: _linked_rooms(count, room_class), count)
+        stats[f"{label}_enemy"] = _per_object(
+            lambda: [enemy_class("Enemy", "") for _ in range(count)], count
+        )
+        stats[f"{label}_item"] = _per_object(
+            lambda: [item_class("item") for _ in range(count)], count
+        )
+    return stats
+
+
+def main() -> None:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--min", type=int, default=1000)
+    parser.add_argument("--max", type=int, default=100000)
+    args = parser.parse_args()
+    count = args.min
+    while count <= args.max:
+        print(f"{count} rooms, bytes per object:")
+        for name, value in bench(count).items():
+            print(f"  {name}: {value:.1f}")
+        count *= 10
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,51 @@
 """A module with classes for the explorer game."""
 from __future__ import annotations
 
+from threading import Lock
+
+
+class GameState:
+    """The state of one game session.
+
+    It can be updated from many threads at once. The defeats can also be
+    counted in a parent state, shared by many sessions
+
+    Attributes:
+        defeated_times (int): The number of times an enemy has been defeated
+        parent (GameState | None): The state every defeat is also counted in
+
+    Methods:
+        add_defeat: Count a defeated enemy
+        get_defeated: Get the number of times an enemy has been defeated
+    """
+
+    __slots__ = ("defeated_times", "parent", "_lock")
+
+    def __init__(self, parent: GameState | None = None) -> None:
+        self.defeated_times = 0
+        self.parent = parent
+        self._lock = Lock()
+
+    def add_defeat(self) -> int:
+        """Count a defeated enemy.
+
+        Returns:
+            int: The number of times an enemy has been defeated
+        """
+        if self.parent is not None:
+            self.parent.add_defeat()
+        with self._lock:
+            self.defeated_times += 1
+            return self.defeated_times
+
+    def get_defeated(self) -> int:
+        """Get the number of times an enemy has been defeated in this session.
+
+        Returns:
+            int: The number of times an enemy has been defeated
+        """
+        return self.defeated_times
+
 
 class Room:
     """A class for a room in the game.
@@ -22,12 +67,13 @@ class Room:
         get_item: Get the item in the room
     """
 
-    description: str = ""
-    character: Enemy | None = None
-    item: Item | None = None
+    __slots__ = ("name", "description", "character", "item", "linked_rooms")
 
     def __init__(self, name: str) -> None:
         self.name = name
+        self.description: str = ""
+        self.character: Enemy | None = None
+        self.item: Item | None = None
         self.linked_rooms: dict[str, Room] = {}
 
     def set_description(self, description: str) -> None:
@@ -116,8 +162,6 @@ class Enemy:
         description (str): The description of the enemy
         conversation (str): The conversation of the enemy
         weakness (str): The weakness of the enemy
-        defeated_times (int), a class variable: The number of times
-                the enemy has been defeated
 
     Methods:
         set_conversation: Set the conversation of the enemy
@@ -125,12 +169,12 @@ class Enemy:
         fight: Fight the enemy
         describe: Describe the enemy
         talk: Talk to the enemy
-        get_defeated: Get the number of times any enemy has been defeated
     """
 
+    __slots__ = ("name", "description", "conversation", "weakness")
+
     conversation: str
     weakness: str
-    defeated_times: int = 0
 
     def __init__(self, name: str, description: str) -> None:
         self.name = name
@@ -152,17 +196,18 @@ class Enemy:
         """
         self.weakness = weakness
 
-    def fight(self, fight_with: str) -> bool:
+    def fight(self, fight_with: str, state: GameState) -> bool:
         """Fight the enemy.
 
         Args:
             fight_with (str): The item to fight with
+            state (GameState): The session to count the defeat in
 
         Returns:
             bool: Whether the enemy was defeated
         """
         if fight_with == self.weakness:
-            Enemy.defeated_times += 1
+            state.add_defeat()
             return True
         return False
 
@@ -180,14 +225,6 @@ class Enemy:
         """
         print(f"Enemy says: {self.conversation}")
 
-    def get_defeated(self) -> int:
-        """Get the number of times any enemy has been defeated.
-
-        Returns:
-            int: The number of times any enemy has been defeated
-        """
-        return Enemy.defeated_times
-
 
 class Item:
     """A class for an item in the game.
@@ -202,6 +239,8 @@ class Item:
         get_name: Get the name of the item
     """
 
+    __slots__ = ("name", "description")
+
     description: str
 
     def __init__(self, name: str) -> None:
@@ -0,0 +1,294 @@
+"""A command interpreter for the explorer game.
+
+Commands are registered in a table with their aliases. Every unambiguous
+prefix of a name or an alias is put in the table too, so a command is
+found with one dictionary lookup: "tal" is talk, "f" is fight, and "t",
+which could be talk or take, is reported as ambiguous.
+
+classes:
+    Session
+    Interpreter
+
+functions:
+    create_interpreter
+    run_batch
+"""
+from __future__ import annotations
+
+import time
+from typing import Callable, Iterable, Iterator
+
+import game
+
+Handler = Callable[["Session", str], None]
+
+
+class Session:
+    """The state of one game played through the interpreter.
+
+    Attributes:
+        current_room (game.Room): The room the player is in
+        backpack (list[str]): The names of the items the player has
+        state (game.GameState): The defeats of the session
+        finished (bool): Whether the game has ended
+        moved (bool): Whether the player has entered another room since the
+            room was last described
+        enemies (int): The number of enemies in the rooms reachable from the
+            start, all of them must be defeated to win
+        pending (Iterator[str] | None): The command lines still to run in a
+            batch, a command can take its argument from the next one
+    """
+
+    __slots__ = ("current_room", "backpack", "state", "finished", "moved", "enemies", "pending")
+
+    def __init__(self, current_room: game.Room) -> None:
+        self.current_room = current_room
+        self.backpack: list[str] = []
+        self.state = game.GameState()
+        self.finished = False
+        self.moved = True
+        self.enemies = _count_enemies(current_room)
+        self.pending: Iterator[str] | None = None
+
+
+def _count_enemies(start: game.Room) -> int:
+    """Count the enemies in the rooms reachable from a room."""
+    seen = {id(start)}
+    stack = [start]
+    enemies = 0
+    while stack:
+        room = stack.pop()
+        if room.character is not None:
+            enemies += 1
+        for linked in room.linked_rooms.values():
+            if id(linked) not in seen:
+                seen.add(id(linked))
+                stack.append(linked)
+    return enemies
+
+
+class Interpreter:
+    """A table of commands.
+
+    Attributes:
+        commands (dict[str, Handler]): The handlers by command name
+        lookup (dict[str, str | None]): The command name of every name, alias
+            and unambiguous prefix, None for ambiguous prefixes
+
+    Methods:
+        register: Add a command
+        resolve: Find the command a word stands for
+        execute: Run a command line
+    """
+
+    def __init__(self) -> None:
+        self.commands: dict[str, Handler] = {}
+        self.lookup: dict[str, str | None] = {}
+        self._words: dict[str, str] = {}
+
+    def register(self, name: str, handler: Handler, aliases: Iterable[str] = ()) -> None:
+        """Add a command.
+
+        Args:
+            name (str): The name of the command
+            handler (Handler): The function run with the session and the
+                rest of the line
+            aliases (Iterable[str]): Other names of the command
+        """
+        self.commands[name] = handler
+        for word in (name, *aliases):
+            self._words[word] = name
+        self.lookup = {}
+        for word, command in self._words.items():
+            for end in range(1, len(word)):
+                prefix = word[:end]
+                if self.lookup.get(prefix, command) != command:
+                    self.lookup[prefix] = None
+                else:
+                    self.lookup[prefix] = command
+        # Whole words win over the prefixes of other words.
+        self.lookup.update(self._words)
+
+    def resolve(self, word: str) -> str | None:
+        """Find the command a word stands for.
+
+        Args:
+            word (str): A name, an alias or a prefix of one
+
+        Raises:
+            KeyError: If the word is an ambiguous prefix
+
+        Returns:
+            str | None: The command name, None if there is no such command
+        """
+        command = self.lookup.get(word, "")
+        if command is None:
+            raise KeyError(word)
+        return command or None
+
+    def execute(self, session: Session, line: str) -> None:
+        """Run a command line.
+
+        Args:
+            session (Session): The game to run it in
+            line (str): The command and its argument
+        """
+        word, _, argument = line.strip().partition(" ")
+        word = word.lower()
+        try:
+            command = self.resolve(word)
+        except KeyError:
+            matches = sorted({name for key, name in self._words.items() if key.startswith(word)})
+            print(f"Did you mean {' or '.join(matches)}?")
+            return
+        if command is None:
+            print("I don't know how to " + line.strip())
+            return
+        self.commands[command](session, argument.strip())
+
+
+def _move(direction: str) -> Handler:
+    """Create the handler of a direction.
+
+    Args:
+        direction (str): The direction
+
+    Returns:
+        Handler: The handler moving the player in it
+    """
+
+    def move(session: Session, argument: str) -> None:
+        room = session.current_room.move(direction)
+        if room is not session.current_room:
+            session.current_room = room
+            session.moved = True
+
+    return move
+
+
+def _go(session: Session, argument: str) -> None:
+    """Move in the direction given as the argument."""
+    _move(argument)(session, "")
+
+
+def _look(session: Session, argument: str) -> None:
+    """Describe the room, its inhabitant and its item."""
+    session.current_room.get_details()
+    inhabitant = session.current_room.get_character()
+    if inhabitant is not None:
+        inhabitant.describe()
+    item = session.current_room.get_item()
+    if item is not None:
+        item.describe()
+
+
+def _talk(session: Session, argument: str) -> None:
+    """Talk to the inhabitant, if there is one."""
+    inhabitant = session.current_room.get_character()
+    if inhabitant is not None:
+        inhabitant.talk()
+
+
+def _fight(session: Session, argument: str) -> None:
+    """Fight the inhabitant with an item from the backpack."""
+    inhabitant = session.current_room.get_character()
+    if inhabitant is None:
+        print("There is no one here to fight with")
+        return
+    fight_with = argument
+    if not fight_with and session.pending is not None:
+        # In a batch the weapon is on the next line, as it was typed after the prompt.
+        print("What will you fight with?")
+        fight_with = next(session.pending, "").strip()
+    if not fight_with:
+        print("Fight with what? Use: fight <item>")
+        return
+    if fight_with not in session.backpack:
+        print("You don't have a " + fight_with)
+        return
+    if inhabitant.fight(fight_with, session.state):
+        print("Hooray, you won the fight!")
+        session.current_room.character = None
+        if session.state.get_defeated() == session.enemies:
+            print("Congratulations, you have vanquished the enemy horde!")
+            session.finished = True
+    else:
+        print("Oh dear, you lost the fight.")
+        print("That's the end of the game")
+        session.finished = True
+
+
+def _take(session: Session, argument: str) -> None:
+    """Put the item of the room in the backpack."""
+    item = session.current_room.get_item()
+    if item is None:
+        print("There's nothing here to take!")
+        return
+    print("You put the " + item.get_name() + " in your backpack")
+    session.backpack.append(item.get_name())
+    session.current_room.set_item(None)
+
+
+def _inventory(session: Session, argument: str) -> None:
+    """List the items in the backpack."""
+    print("You have: " + (", ".join(session.backpack) or "nothing"))
+
+
+def _quit(session: Session, argument: str) -> None:
+    """End the game."""
+    session.finished = True
+
+
+def create_interpreter() -> Interpreter:
+    """Create the interpreter with the commands of the game.
+
+    Returns:
+        Interpreter: The interpreter
+    """
+    interpreter = Interpreter()
+    for direction in ("north", "south", "east", "west"):
+        interpreter.register(direction, _move(direction), (direction[0],))
+    interpreter.register("go", _go)
+    interpreter.register("look", _look)
+    interpreter.register("talk", _talk)
+    interpreter.register("fight", _fight, ("attack",))
+    interpreter.register("take", _take, ("get",))
+    interpreter.register("inventory", _inventory, ("backpack",))
+    interpreter.register("quit", _quit, ("exit",))
+    interpreter.register(
+        "help",
+        lambda session, argument: print("Commands: " + ", ".join(sorted(interpreter.commands))),
+    )
+    return interpreter
+
+
+def run_batch(
+    interpreter: Interpreter, session: Session, lines: Iterable[str]
+) -> tuple[int, float]:
+    """Run commands one after another without prompts or redraws.
+
+    A fight without a weapon takes it from the next line.
+
+    Args:
+        interpreter (Interpreter): The interpreter
+        session (Session): The game to run them in
+        lines (Iterable[str]): The command lines, empty ones are skipped
+
+    Returns:
+        tuple[int, float]: The number of commands run and the seconds it took
+    """
+    execute = interpreter.execute
+    count = 0
+    pending = iter(lines)
+    session.pending = pending
+    began = time.perf_counter()
+    try:
+        for line in pending:
+            if session.finished:
+                break
+            if line.strip():
+                execute(session, line)
+                count += 1
+    finally:
+        session.pending = None
+    return count, time.perf_counter() - began
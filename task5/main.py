@@ -1,99 +1,72 @@
-import game
-
-kitchen = game.Room("Kitchen")
-kitchen.set_description("A dank and dirty room buzzing with flies.")
-
-dining_hall = game.Room("Dining Hall")
-dining_hall.set_description("A large room with ornate golden decorations on each wall.")
-
-ballroom = game.Room("Ballroom")
-ballroom.set_description(
-    "A vast room with a shiny wooden floor. Huge candlesticks guard the entrance."
-)
-
-kitchen.link_room(dining_hall, "south")
-dining_hall.link_room(kitchen, "north")
-dining_hall.link_room(ballroom, "west")
-ballroom.link_room(dining_hall, "east")
-
-dave = game.Enemy("Dave", "A smelly zombie")
-dave.set_conversation("What's up, dude! I'm hungry.")
-dave.set_weakness("cheese")
-dining_hall.set_character(dave)
-
-tabitha = game.Enemy(
-    "Tabitha", "An enormous spider with countless eyes and furry legs."
-)
-tabitha.set_conversation("Sssss....I'm so bored...")
-tabitha.set_weakness("book")
-ballroom.set_character(tabitha)
-
-cheese = game.Item("cheese")
-cheese.set_description("A large and smelly block of cheese")
-ballroom.set_item(cheese)
-
-book = game.Item("book")
-book.set_description("A really good book entitled 'Knitting for dummies'")
-dining_hall.set_item(book)
-
-current_room = kitchen
-backpack = []
+"""The explorer game: defeat both enemies of the house."""
+import argparse
+import contextlib
+import os
+import sys
 
-dead = False
-
-while dead == False:
-
-    print("\n")
-    current_room.get_details()
-
-    inhabitant = current_room.get_character()
-    if inhabitant is not None:
-        inhabitant.describe()
-
-    item = current_room.get_item()
-    if item is not None:
-        item.describe()
-
-    command = input("> ")
-
-    if command in ["north", "south", "east", "west"]:
-        # Move in the given direction
-        current_room = current_room.move(command)
-    elif command == "talk":
-        # Talk to the inhabitant - check whether there is one!
-        if inhabitant is not None:
-            inhabitant.talk()
-    elif command == "fight":
-        if inhabitant is not None:
-            # Fight with the inhabitant, if there is one
-            print("What will you fight with?")
-            fight_with = input()
+import game
+import world
+from interpreter import Session, create_interpreter, run_batch
+
+WORLD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worlds", "house.json")
+
+
+def create_world(path: str = WORLD) -> game.Room:
+    """Load the rooms, enemies and items of a new game.
+
+    Args:
+        path (str): The world file, the house by default
+
+    Returns:
+        game.Room: The room to start in
+    """
+    return world.load_world(path)
+
+
+def play(path: str = WORLD) -> None:
+    """Play the game in the terminal.
+
+    Args:
+        path (str): The world file, the house by default
+    """
+    interpreter = create_interpreter()
+    session = Session(create_world(path))
+    while not session.finished:
+        if session.moved:
+            print("\n")
+            interpreter.execute(session, "look")
+            session.moved = False
+        try:
+            line = input("> ")
+        except EOFError:
+            break
+        interpreter.execute(session, line)
+
+
+def main() -> None:
+    """Play the game, or run a batch of commands from a file or a pipe."""
+    parser = argparse.ArgumentParser(description="Defeat both enemies of the house.")
+    parser.add_argument("--batch", metavar="PATH", help="run the commands of a file, - for stdin")
+    parser.add_argument("--world", default=WORLD, help="the world file to play in")
+    parser.add_argument("--quiet", action="store_true", help="do not print the game in a batch")
+    args = parser.parse_args()
+    if args.batch is None and sys.stdin.isatty():
+        play(args.world)
+        return
+    if args.batch in (None, "-"):
+        lines = sys.stdin.readlines()
+    else:
+        with open(args.batch, encoding="utf-8") as file:
+            lines = file.readlines()
+    session = Session(create_world(args.world))
+    if args.quiet:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            count, elapsed = run_batch(create_interpreter(), session, lines)
+    else:
+        count, elapsed = run_batch(create_interpreter(), session, lines)
+    rate = count / elapsed if elapsed else 0.0
+    print(f"{count} commands in {elapsed:.6f} s, {rate:.0f} commands/sec", file=sys.stderr)
 
-            # Do I have this item?
-            if fight_with in backpack:
 
-                if inhabitant.fight(fight_with) == True:
-                    # What happens if you win?
-                    print("Hooray, you won the fight!")
-                    current_room.character = None
-                    if inhabitant.get_defeated() == 2:
-                        print("Congratulations, you have vanquished the enemy horde!")
-                        dead = True
-                else:
-                    # What happens if you lose?
-                    print("Oh dear, you lost the fight.")
-                    print("That's the end of the game")
-                    dead = True
-            else:
-                print("You don't have a " + fight_with)
-        else:
-            print("There is no one here to fight with")
-    elif command == "take":
-        if item is not None:
-            print("You put the " + item.get_name() + " in your backpack")
-            backpack.append(item.get_name())
-            current_room.set_item(None)
-        else:
-            print("There's nothing here to take!")
-    else:
-        print("I don't know how to " + command)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""A multi-threaded stress test of the game sessions.
+
+Plays thousands of sessions in parallel threads through the interpreter,
+each in its own world and with its own GameState, and checks that every
+session counted exactly its own two defeats. The state of every session
+counts into one shared GameState too, which must end up with the total.
+
+Usage:
+    python stress.py --sessions 5000 --threads 64
+"""
+import argparse
+import contextlib
+import functools
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import game
+import interpreter
+from main import create_world
+
+WINNING_MOVES = ["south", "take", "west", "take", "fight book", "east", "fight cheese"]
+
+
+def play_session(shared: game.GameState, commands: interpreter.Interpreter) -> int:
+    """Play a winning session without any input.
+
+    Args:
+        shared (game.GameState): The state every session also counts into
+        commands (interpreter.Interpreter): The interpreter running the moves
+
+    Raises:
+        RuntimeError: If the winning moves do not win the session
+
+    Returns:
+        int: The number of defeats counted in the session's own state
+    """
+    session = interpreter.Session(create_world())
+    session.state = game.GameState(shared)
+    interpreter.run_batch(commands, session, WINNING_MOVES)
+    if not session.finished or session.state.get_defeated() != 2:
+        raise RuntimeError(f"The session ended in the {session.current_room.name} unwon.")
+    return session.state.get_defeated()
+
+
+def main() -> None:
+    """Run the stress test from the command line."""
+    parser = argparse.ArgumentParser(description="Play many sessions in threads.")
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=64)
+    args = parser.parse_args()
+    sys.setswitchinterval(1e-6)
+    shared = game.GameState()
+    began = time.perf_counter()
+    play = functools.partial(play_session, commands=interpreter.create_interpreter())
+    try:
+        # The sessions print what happens, nobody reads it.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            with ThreadPoolExecutor(args.threads) as pool:
+                results = list(pool.map(play, [shared] * args.sessions))
+    except RuntimeError as error:
+        print(f"a session failed: {error}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - began
+    wrong = sum(1 for defeated in results if defeated != 2)
+    print(f"sessions: {args.sessions}, threads: {args.threads}, {elapsed:.3f} s")
+    print(f"sessions with a wrong counter: {wrong}")
+    print(f"shared counter: {shared.get_defeated()} of {2 * args.sessions}")
+    if wrong or shared.get_defeated() != 2 * args.sessions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
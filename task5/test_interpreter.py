@@ -0,0 +1,61 @@
+"""Tests of interpreter.py: the command table and a fight in a batch of commands."""
+from __future__ import annotations
+
+import os
+
+import pytest
+
+import world
+from interpreter import Session, create_interpreter, run_batch
+
+HOUSE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worlds", "house.json")
+
+
+def _session() -> Session:
+    return Session(world.load_world(HOUSE, use_cache=False))
+
+
+def test_prefixes_resolve_to_their_command() -> None:
+    interpreter = create_interpreter()
+    assert interpreter.resolve("tal") == "talk"
+    assert interpreter.resolve("f") == "fight"
+    assert interpreter.resolve("s") == "south"
+    assert interpreter.resolve("dance") is None
+    with pytest.raises(KeyError):
+        interpreter.resolve("t")
+
+
+def test_a_fight_in_a_batch_takes_the_weapon_from_the_next_line(capsys) -> None:
+    session = _session()
+    lines = ["south", "take", "west", "take", "fight", "book", "", "east", "attack", "cheese"]
+    count, _ = run_batch(create_interpreter(), session, lines)
+    output = capsys.readouterr().out
+    assert session.finished
+    assert session.state.get_defeated() == session.enemies == 2
+    # The weapons are arguments of the fights, not commands of their own.
+    assert count == 7
+    assert "I don't know how to" not in output
+    assert "You don't have a" not in output
+    assert session.pending is None
+
+
+def test_a_fight_at_the_end_of_a_batch_asks_for_the_weapon(capsys) -> None:
+    session = _session()
+    run_batch(create_interpreter(), session, ["south", "take", "west", "fight"])
+    assert "Fight with what? Use: fight <item>" in capsys.readouterr().out
+    assert not session.finished
+    assert session.current_room.get_character() is not None
+
+
+def test_a_fight_without_a_weapon_outside_a_batch_does_not_prompt(capsys, monkeypatch) -> None:
+    def prompt(*_):
+        raise AssertionError("The fight prompted for the weapon.")
+
+    monkeypatch.setattr("builtins.input", prompt)
+    session = _session()
+    interpreter = create_interpreter()
+    for line in ("south", "take", "west", "fight"):
+        interpreter.execute(session, line)
+    assert "Fight with what? Use: fight <item>" in capsys.readouterr().out
+    interpreter.execute(session, "fight book")
+    assert session.state.get_defeated() == 1
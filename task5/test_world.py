@@ -0,0 +1,118 @@
+"""Tests of world.py: validation, the compiled cache and the paused collector."""
+from __future__ import annotations
+
+import gc
+import json
+import os
+import threading
+
+import pytest
+
+import world
+
+WORLD = {
+    "start": "Kitchen",
+    "rooms": {
+        "Kitchen": {"description": "A kitchen.", "links": {"south": "Hall"}},
+        "Hall": {"description": "A hall.", "links": {"north": "Kitchen"}},
+    },
+    "enemies": [
+        {"name": "Dave", "description": "A zombie", "conversation": "Hi", "weakness": "cheese",
+         "room": "Hall"}
+    ],
+    "items": [{"name": "cheese", "description": "Smelly", "room": "Kitchen"}],
+}
+
+
+def _write(path, data: dict) -> str:
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    return str(path)
+
+
+def test_the_first_load_writes_the_cache_and_the_next_one_reads_it(tmp_path, monkeypatch):
+    path = _write(tmp_path / "world.json", WORLD)
+    start = world.load_world(path)
+    assert os.path.exists(path + world.CACHE_SUFFIX)
+    assert start.name == "Kitchen"
+    assert start.linked_rooms["south"].character.name == "Dave"
+
+    def parse(*_):
+        raise AssertionError("The cached world was parsed again.")
+
+    monkeypatch.setattr(world.json, "load", parse)
+    again = world.load_world(path)
+    assert again.item.name == "cheese"
+    assert again.linked_rooms["south"].linked_rooms["north"] is again
+
+
+def test_a_changed_file_is_not_read_from_the_cache(tmp_path):
+    path = _write(tmp_path / "world.json", WORLD)
+    world.load_world(path)
+    changed = json.loads(json.dumps(WORLD))
+    changed["rooms"]["Kitchen"]["description"] = "A much cleaner kitchen than before."
+    _write(path, changed)
+    assert world._read_cache(path) is None
+    assert world.load_world(path).description == "A much cleaner kitchen than before."
+    assert world._read_cache(path) is not None
+
+
+def test_a_broken_cache_is_a_miss(tmp_path):
+    path = _write(tmp_path / "world.json", WORLD)
+    world.load_world(path)
+    with open(path + world.CACHE_SUFFIX, "r+b") as file:
+        file.truncate(10)
+    assert world._read_cache(path) is None
+    assert world.load_world(path).name == "Kitchen"
+
+
+def test_no_cache_is_written_when_it_is_not_used(tmp_path):
+    path = _write(tmp_path / "world.json", WORLD)
+    world.load_world(path, use_cache=False)
+    assert not os.path.exists(path + world.CACHE_SUFFIX)
+
+
+def test_an_invalid_world_is_refused(tmp_path):
+    invalid = json.loads(json.dumps(WORLD))
+    invalid["enemies"][0]["weakness"] = "book"
+    invalid["items"].append({"description": "No name", "room": "Hall"})
+    path = _write(tmp_path / "world.json", invalid)
+    with pytest.raises(ValueError) as error:
+        world.load_world(path)
+    assert "'Dave' is weak to 'book', which is no item" in str(error.value)
+    assert "One of the items in 'Hall' has no name" in str(error.value)
+
+
+def test_overlapping_loads_leave_the_collector_on(tmp_path, monkeypatch):
+    path = _write(tmp_path / "world.json", WORLD)
+    read_cache = world._read_cache
+    first_reading = threading.Event()
+    second_reading = threading.Event()
+    first_done = threading.Event()
+    readers: list[str] = []
+
+    def slow_read(path: str):
+        readers.append(threading.current_thread().name)
+        # The second load starts while the first one reads, and goes on only
+        # once the first one has returned.
+        if len(readers) == 1:
+            first_reading.set()
+            second_reading.wait()
+        else:
+            second_reading.set()
+            first_done.wait()
+        return read_cache(path)
+
+    def load() -> None:
+        world.load_world(path)
+        first_done.set()
+
+    monkeypatch.setattr(world, "_read_cache", slow_read)
+    assert gc.isenabled()
+    first, second = threading.Thread(target=load), threading.Thread(target=load)
+    first.start()
+    first_reading.wait()
+    second.start()
+    first.join()
+    second.join()
+    assert gc.isenabled()
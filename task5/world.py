@@ -0,0 +1,301 @@
+"""Worlds of the explorer game defined in files.
+
+A world is a JSON file with the rooms and their links, the enemies with
+their weaknesses and the items:
+
+    {
+        "start": "Kitchen",
+        "rooms": {"Kitchen": {"description": "...", "links": {"south": "Hall"}}},
+        "enemies": [{"name": "Dave", "description": "...", "conversation": "...",
+                     "weakness": "cheese", "room": "Hall"}],
+        "items": [{"name": "cheese", "description": "...", "room": "Hall"}]
+    }
+
+The first load validates the world and writes a compiled cache next to it,
+so later loads skip parsing and validation while the file is unchanged.
+
+Usage:
+    python world.py worlds/house.json
+    python world.py --bench 100000
+
+functions:
+    validate
+    compile_world
+    load_world
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import gc
+import json
+import marshal
+import os
+import tempfile
+import threading
+import time
+from typing import Iterator
+
+import game
+
+MAGIC = b"WRLD"
+VERSION = 1
+CACHE_SUFFIX = ".cache"
+
+Compiled = tuple[int, list, list, list, list, list]
+
+
+def validate(data: dict) -> list[str]:
+    """Find the problems of a world definition.
+
+    Args:
+        data (dict): The parsed world file
+
+    Returns:
+        list[str]: The problems, empty if the world is valid
+    """
+    problems = []
+    rooms = data.get("rooms", {})
+    if data.get("start") not in rooms:
+        problems.append(f"The start room {data.get('start')!r} does not exist")
+    for name, room in rooms.items():
+        for direction, target in room.get("links", {}).items():
+            if target not in rooms:
+                problems.append(f"{name!r} links {direction} to a missing room {target!r}")
+    items = {item.get("name") for item in data.get("items", [])}
+    taken = set()
+    for kind in ("enemies", "items"):
+        for thing in data.get(kind, []):
+            if "name" not in thing:
+                problems.append(f"One of the {kind} in {thing.get('room')!r} has no name")
+                continue
+            if thing.get("room") not in rooms:
+                problems.append(f"{thing['name']!r} is in a missing room {thing.get('room')!r}")
+            elif (kind, thing["room"]) in taken:
+                problems.append(f"{thing['room']!r} has more than one of the {kind}")
+            taken.add((kind, thing.get("room")))
+    for enemy in data.get("enemies", []):
+        if "name" in enemy and enemy.get("weakness") not in items - {None}:
+            problems.append(
+                f"{enemy['name']!r} is weak to {enemy.get('weakness')!r}, which is no item"
+            )
+    return problems
+
+
+def compile_world(data: dict) -> Compiled:
+    """Turn a valid world definition into flat lists indexed by room.
+
+    Args:
+        data (dict): The parsed world file
+
+    Returns:
+        Compiled: The start room index, the room names and descriptions,
+            the links, the enemies and the items
+    """
+    names = list(data["rooms"])
+    index = {name: i for i, name in enumerate(names)}
+    descriptions = [data["rooms"][name].get("description", "") for name in names]
+    links = [
+        (index[name], direction, index[target])
+        for name in names
+        for direction, target in data["rooms"][name].get("links", {}).items()
+    ]
+    enemies = [
+        (
+            index[enemy["room"]],
+            enemy["name"],
+            enemy.get("description", ""),
+            enemy.get("conversation", ""),
+            enemy["weakness"],
+        )
+        for enemy in data.get("enemies", [])
+    ]
+    items = [
+        (index[item["room"]], item["name"], item.get("description", ""))
+        for item in data.get("items", [])
+    ]
+    return index[data["start"]], names, descriptions, links, enemies, items
+
+
+def _build(compiled: Compiled) -> game.Room:
+    """Create the objects of a compiled world.
+
+    Args:
+        compiled (Compiled): The compiled world
+
+    Returns:
+        game.Room: The room to start in
+    """
+    start, names, descriptions, links, enemies, items = compiled
+    rooms = [game.Room(name) for name in names]
+    for room, description in zip(rooms, descriptions):
+        room.set_description(description)
+    for source, direction, target in links:
+        rooms[source].link_room(rooms[target], direction)
+    for room, name, description, conversation, weakness in enemies:
+        enemy = game.Enemy(name, description)
+        enemy.set_conversation(conversation)
+        enemy.set_weakness(weakness)
+        rooms[room].set_character(enemy)
+    for room, name, description in items:
+        item = game.Item(name)
+        item.set_description(description)
+        rooms[room].set_item(item)
+    return rooms[start]
+
+
+def _stamp(path: str) -> tuple[int, int]:
+    """Get what identifies a version of a world file."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_cache(path: str) -> Compiled | None:
+    """Read the cache of a world file if it is there and up to date."""
+    try:
+        with open(path + CACHE_SUFFIX, "rb") as file:
+            data = file.read()
+        if data[: len(MAGIC) + 1] != MAGIC + bytes([VERSION]):
+            return None
+        stamp, compiled = marshal.loads(memoryview(data)[len(MAGIC) + 1 :])
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return compiled if tuple(stamp) == _stamp(path) else None
+
+
+def _write_cache(path: str, compiled: Compiled) -> None:
+    """Write the cache of a world file, replacing the old one at once."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(MAGIC + bytes([VERSION]) + marshal.dumps((_stamp(path), compiled)))
+        os.replace(temporary, path + CACHE_SUFFIX)
+    except OSError:
+        pass
+
+
+# The loads that have the garbage collector paused, and whether it was on
+# before the first of them, so overlapping loads in threads turn it back on
+# only when the last one is done.
+_pause_lock = threading.Lock()
+_pauses = 0
+_collecting = False
+
+
+@contextlib.contextmanager
+def _collector_paused() -> Iterator[None]:
+    """Turn the garbage collector off in a block, for any number of threads at once."""
+    global _pauses, _collecting
+    with _pause_lock:
+        if not _pauses:
+            _collecting = gc.isenabled()
+            gc.disable()
+        _pauses += 1
+    try:
+        yield
+    finally:
+        with _pause_lock:
+            _pauses -= 1
+            if not _pauses and _collecting:
+                gc.enable()
+
+
+def load_world(path: str, use_cache: bool = True) -> game.Room:
+    """Load a world from a file.
+
+    Args:
+        path (str): The path to the JSON file of the world
+        use_cache (bool): Whether to read and write the compiled cache
+
+    Raises:
+        ValueError: If the world is not valid
+
+    Returns:
+        game.Room: The room to start in
+    """
+    # Building the rooms allocates a lot of objects and none of them are
+    # garbage yet, so the collector would only walk them over and over.
+    with _collector_paused():
+        compiled = _read_cache(path) if use_cache else None
+    if compiled is None:
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        problems = validate(data)
+        if problems:
+            raise ValueError(f"{path} is not a valid world:\n" + "\n".join(problems))
+        compiled = compile_world(data)
+        if use_cache:
+            _write_cache(path, compiled)
+    with _collector_paused():
+        return _build(compiled)
+
+
+def _big_world(rooms: int) -> dict:
+    """Generate a corridor of rooms with an enemy and an item in every other room."""
+    names = [f"Room {i}" for i in range(rooms)]
+    data: dict = {"start": names[0], "rooms": {}, "enemies": [], "items": []}
+    for i, name in enumerate(names):
+        links = {}
+        if i > 0:
+            links["north"] = names[i - 1]
+        if i + 1 < rooms:
+            links["south"] = names[i + 1]
+        data["rooms"][name] = {"description": f"The room number {i}.", "links": links}
+        if i % 2:
+            data["enemies"].append(
+                {
+                    "name": f"Enemy {i}",
+                    "description": "An enemy",
+                    "conversation": "Hello",
+                    "weakness": f"item {i - 1}",
+                    "room": name,
+                }
+            )
+        else:
+            data["items"].append({"name": f"item {i}", "description": "An item", "room": name})
+    return data
+
+
+def bench(rooms: int) -> dict[str, float]:
+    """Time loading a big world from its file and from the cache.
+
+    Args:
+        rooms (int): The number of rooms of the world
+
+    Returns:
+        dict[str, float]: The milliseconds of each load
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "world.json")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(_big_world(rooms), file)
+        began = time.perf_counter()
+        load_world(path)
+        parsed = time.perf_counter() - began
+        began = time.perf_counter()
+        load_world(path)
+        cached = time.perf_counter() - began
+    return {"parse_ms": parsed * 1000, "cache_ms": cached * 1000}
+
+
+def main() -> None:
+    """Check and compile world files from the command line."""
+    parser = argparse.ArgumentParser(description="Check and compile world files.")
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--bench", type=int, metavar="ROOMS")
+    args = parser.parse_args()
+    for path in args.paths:
+        load_world(path, use_cache=False)
+        load_world(path)
+        print(f"{path}: valid, compiled to {path + CACHE_SUFFIX}")
+    if args.bench:
+        stats = bench(args.bench)
+        print(
+            f"{args.bench} rooms: parsed and validated in {stats['parse_ms']:.1f} ms, "
+            f"from the cache in {stats['cache_ms']:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
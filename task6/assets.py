@@ -1,6 +1,7 @@
 """This module contains all the assets for the game.
 
 classes:
+    Bitmap
     Room
     Character
     Player(Character)
@@ -10,6 +11,12 @@ classes:
 """
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from chunks import ChunkedBitmap
+    from matchups import Matchups
+
 KILL_MESSAGES = {
     "cat": "Your mosquitto has annoyed the cat. It does not want to fight any more",
     "mosquitto": "The mosquittos drown in the milk. They can no longer fly",
@@ -26,6 +33,157 @@ DEATH_MESSAGES = {
 }
 
 
+class Bitmap:
+    """A set of small non-negative integers stored as bits.
+
+    It grows when a bit past its size is set. Copies share their bytes
+    until one of them is changed.
+
+    Attributes:
+        size (int): The number of bits.
+        count (int): The number of bits that are set.
+
+    Methods:
+        get: Check a bit.
+        set: Set a bit.
+        discard: Clear a bit.
+        copy: Copy the bitmap, copying the bytes only on the next change.
+        shares: Check if a copy still shares the bytes of the bitmap.
+        to_bytes: Get the bytes of the bits.
+        as_int: Get the bits as an integer.
+        from_bytes: Create a bitmap from the bytes of its bits.
+    """
+
+    __slots__ = ("size", "count", "_bits", "_owned")
+
+    def __init__(self, size: int = 0) -> None:
+        self.size: int = size
+        self.count: int = 0
+        self._bits = bytearray((size + 7) >> 3)
+        self._owned: bool = True
+
+    def get(self, index: int) -> bool:
+        """Check a bit.
+
+        Args:
+            index (int): The index of the bit.
+
+        Returns:
+            bool: True if the bit is set, False otherwise.
+        """
+        if index >= self.size:
+            return False
+        return bool(self._bits[index >> 3] & (1 << (index & 7)))
+
+    def set(self, index: int) -> bool:
+        """Set a bit.
+
+        Args:
+            index (int): The index of the bit.
+
+        Returns:
+            bool: True if the bit was not set before, False otherwise.
+        """
+        mask = 1 << (index & 7)
+        if index < self.size and self._bits[index >> 3] & mask:
+            return False
+        if not self._owned:
+            self._bits = bytearray(self._bits)
+            self._owned = True
+        if index >= self.size:
+            self._bits.extend(bytes(((index + 8) >> 3) - len(self._bits)))
+            self.size = index + 1
+        self._bits[index >> 3] |= mask
+        self.count += 1
+        return True
+
+    def discard(self, index: int) -> bool:
+        """Clear a bit.
+
+        Args:
+            index (int): The index of the bit.
+
+        Returns:
+            bool: True if the bit was set before, False otherwise.
+        """
+        mask = 1 << (index & 7)
+        if index >= self.size or not self._bits[index >> 3] & mask:
+            return False
+        if not self._owned:
+            self._bits = bytearray(self._bits)
+            self._owned = True
+        self._bits[index >> 3] &= ~mask
+        self.count -= 1
+        return True
+
+    def copy(self) -> Bitmap:
+        """Copy the bitmap.
+
+        The bytes are shared until either of the bitmaps is changed.
+
+        Returns:
+            Bitmap: The copy.
+        """
+        bitmap = Bitmap.__new__(Bitmap)
+        bitmap.size = self.size
+        bitmap.count = self.count
+        bitmap._bits = self._bits
+        bitmap._owned = self._owned = False
+        return bitmap
+
+    def shares(self, other: Bitmap) -> bool:
+        """Check if a copy still shares the bytes of the bitmap.
+
+        Args:
+            other (Bitmap): A copy of the bitmap, or the bitmap it was copied from.
+
+        Returns:
+            bool: True if neither of them has changed since the copy.
+        """
+        return self._bits is other._bits
+
+    def to_bytes(self, length: int | None = None) -> bytes:
+        """Get the bytes of the bits, the first bit in the lowest bit of the first byte.
+
+        Args:
+            length (int | None): The number of bytes, cut or padded with
+                zeros. All the bytes of the bitmap if not given.
+
+        Returns:
+            bytes: The bytes.
+        """
+        if length is None:
+            return bytes(self._bits)
+        bits = bytes(self._bits[:length])
+        return bits + bytes(length - len(bits))
+
+    def as_int(self) -> int:
+        """Get the bits as an integer, bit i of it being the bit of index i.
+
+        Returns:
+            int: The integer.
+        """
+        return int.from_bytes(self._bits, "little")
+
+    @classmethod
+    def from_bytes(cls, data: bytes, size: int | None = None) -> Bitmap:
+        """Create a bitmap from the bytes of its bits, as returned by to_bytes.
+
+        Args:
+            data (bytes): The bytes.
+            size (int | None): The number of bits, 8 per byte if not given.
+
+        Returns:
+            Bitmap: The bitmap, which owns a copy of the bytes.
+        """
+        bitmap = cls.__new__(cls)
+        bitmap._bits = bytearray(data)
+        bitmap.size = 8 * len(data) if size is None else size
+        bitmap.count = int.from_bytes(data, "little").bit_count()
+        bitmap._owned = True
+        return bitmap
+
+
 class Room:
     """A room in the game.
 
@@ -41,13 +199,14 @@ class Room:
         set_character: Set the character(enemy or friend) in the room.
     """
 
-    character: Character | None = None
-    item: Item | None = None
+    __slots__ = ("name", "description", "neighbours", "item", "character")
 
     def __init__(self, name: str, description: str) -> None:
         self.name: str = name
         self.description: str = description
         self.neighbours: dict[str, Room] = {}
+        self.item: Item | None = None
+        self.character: Character | None = None
 
     def add_neighbour(self, direction: str, room: Room) -> None:
         """Add a neighbouring room.
@@ -77,6 +236,8 @@ class EndRoom(Room):
         cleared_rooms_needed (int): The number of rooms that need to be cleared to enter.
     """
 
+    __slots__ = ("cleared_rooms_needed",)
+
     def __init__(self, name: str, description: str, cleared_rooms_needed: int) -> None:
         super().__init__(name, description)
         self.cleared_rooms_needed: int = cleared_rooms_needed
@@ -90,7 +251,7 @@ class EndRoom(Room):
         Returns:
             bool: True if the player can enter the room, False otherwise.
         """
-        return len(player.cleared_rooms) >= self.cleared_rooms_needed
+        return player.cleared_count() >= self.cleared_rooms_needed
 
 
 class Character:
@@ -100,6 +261,8 @@ class Character:
         name (str): The name of the character.
     """
 
+    __slots__ = ("name",)
+
     def __init__(self, name: str) -> None:
         self.name: str = name
 
@@ -110,46 +273,89 @@ class Player(Character):
     Attributes:
         name (str): The name of the character.
         weapons (list[Weapon]): The player's weapons.
-        cleared_rooms (list[Room]): The rooms that have been cleared.
+        cleared_rooms (Bitmap | ChunkedBitmap): The indices of the rooms that have been
+            cleared.
         current_room (tuple[int, int]): The player's current room.
 
     Methods:
         clear_room: Clear a room.
+        has_cleared: Check if a room has been cleared.
+        cleared_count: Get the number of cleared rooms.
+        fork: Copy the player cheaply.
         fight: Fight against an enemy.
         pick_up_item: Pick up an item.
     """
 
+    __slots__ = ("weapons", "cleared_rooms", "current_room")
+
     def __init__(self, name: str, current_room: tuple[int, int] = (0, 0)) -> None:
         super().__init__(name)
         self.weapons: list[Weapon] = []
-        self.cleared_rooms: list[Room] = []
+        self.cleared_rooms: Bitmap | ChunkedBitmap = Bitmap()
         self.current_room: tuple[int, int] = current_room
 
-    def clear_room(self, room: Room) -> None:
+    def clear_room(self, index: int) -> bool:
         """Clear a room.
 
         Args:
-            room (Room): The room to clear.
+            index (int): The index of the room on the map.
+
+        Returns:
+            bool: True if the room was not cleared before, False otherwise.
+        """
+        return self.cleared_rooms.set(index)
+
+    def has_cleared(self, index: int) -> bool:
+        """Check if a room has been cleared.
+
+        Args:
+            index (int): The index of the room on the map.
+
+        Returns:
+            bool: True if the room has been cleared, False otherwise.
+        """
+        return self.cleared_rooms.get(index)
+
+    def cleared_count(self) -> int:
+        """Get the number of cleared rooms.
+
+        Returns:
+            int: The number of cleared rooms.
         """
-        self.cleared_rooms.append(room)
+        return self.cleared_rooms.count
+
+    def fork(self) -> Player:
+        """Copy the player.
+
+        The weapons are shared, as they do not change once picked up, and
+        the cleared rooms are copied on write.
 
-    def fight(self, enemy: Enemy, weapon_id: int = 0) -> bool:
+        Returns:
+            Player: The copy.
+        """
+        player = Player(self.name, self.current_room)
+        player.weapons = list(self.weapons)
+        player.cleared_rooms = self.cleared_rooms.copy()
+        return player
+
+    def fight(
+        self, enemy: Enemy, weapon_id: int = 0, matchups: Matchups | None = None
+    ) -> bool:
         """Fight against an enemy.
 
         Args:
             enemy (Enemy): The enemy to fight.
+            weapon_id (int): The index of the weapon to use.
+            matchups (Matchups | None): The compiled weapon rules. The weapon's
+                can_kill is compared if not given.
 
         Returns:
             bool: True if the player wins, False otherwise.
         """
-        print("You are fighting against the " + enemy.name)
-        print("You are using the " + self.weapons[weapon_id].name)
-        if self.weapons[weapon_id].can_kill == enemy.weapon.name:
-            print(KILL_MESSAGES[enemy.weapon.name])
-            return True
-        print(DEATH_MESSAGES[f"{self.weapons[weapon_id].name}-{enemy.weapon.name}"])
-        print("You lose!")
-        return False
+        if matchups is None:
+            return self.weapons[weapon_id].can_kill == enemy.weapon.name
+        ids = matchups.ids
+        return matchups.wins(ids[self.weapons[weapon_id].name], ids[enemy.weapon.name])
 
     def pick_up_item(self, room: Room) -> bool:
         """Pick up an item.
@@ -162,15 +368,10 @@ class Player(Character):
         """
         if room.item is not None:
             if room.item.name == "cake":
-                print("==================")
-                print("The cake is a lie.")
-                print("==================")
                 return True
             if isinstance(room.item, Weapon) and not room.item.picked_up:
                 self.weapons.append(room.item)
                 room.item.picked_up = True
-        else:
-            print("There is no item in this room.")
         return False
 
 
@@ -183,6 +384,8 @@ class Enemy(Character):
         defeated (bool): Whether the enemy has been defeated.
     """
 
+    __slots__ = ("weapon", "defeated")
+
     def __init__(self, name: str, weapon: Weapon) -> None:
         super().__init__(name)
         self.weapon: Weapon = weapon
@@ -200,6 +403,8 @@ class Friend(Character):
         talk: Talk to the friendly character.
     """
 
+    __slots__ = ("dialogue",)
+
     def __init__(self, name: str, dialogue: str) -> None:
         super().__init__(name)
         self.dialogue: str = dialogue
@@ -221,6 +426,8 @@ class Item:
         picked_up (bool): Whether the item has been picked up.
     """
 
+    __slots__ = ("name", "picked_up")
+
     def __init__(self, name: str) -> None:
         self.name: str = name
         self.picked_up: bool = False
@@ -234,6 +441,8 @@ class Weapon(Item):
         can_kill (str): The name of weapon that this weapon can kill.
     """
 
+    __slots__ = ("can_kill",)
+
     def __init__(self, name: str, can_kill: str = "") -> None:
         super().__init__(name)
         self.can_kill: str = can_kill
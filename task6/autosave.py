@@ -0,0 +1,324 @@
+"""Saving games in the background while they are played.
+
+A game captures its state with snapshot.dumps after each move, which
+takes microseconds, and hands it to an Autosaver. A writer thread writes
+what was handed over once per flush interval with a single fsync. A
+session saved many times within one interval is written once.
+
+Every slot of the file has two copies, written in turns, each with a
+sequence number and a CRC. If the process dies in the middle of a write,
+the torn copy fails its CRC and the other one is restored.
+
+File, little-endian:
+    header: magic (4s), version (H), width (H), height (H), slots (I), record (I)
+    per slot, two copies of: sequence (Q), crc (I), a snapshot.dumps record
+
+Usage:
+    python autosave.py saves.autosave
+    python autosave.py --bench --sessions 1000 --moves 100
+
+classes:
+    Autosaver
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import struct
+import threading
+import time
+import zlib
+from random import Random
+
+import snapshot
+from assets import Player
+from engine import Engine
+from grid import CHANGE
+from main import Game, Map
+
+MAGIC = b"S6AS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHII")
+COPY = struct.Struct("<QI")
+
+
+class Autosaver:
+    """A file of saved games written by a background thread.
+
+    Attributes:
+        path (str): The file.
+        width (int): The number of columns of the maps.
+        height (int): The number of rows of the maps.
+        slots (int): The number of sessions the file can hold.
+        interval (float): The seconds between flushes.
+
+    Methods:
+        save: Hand over the state of a game.
+        restore: Restore the last saved game of a slot.
+        resume: Restore the unfinished game of a slot as a Game.
+        flush: Write everything handed over and wait for the disk.
+        stats: Get the metrics of the writer.
+        close: Flush and stop the writer.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        width: int = 3,
+        height: int = 3,
+        slots: int = 1024,
+        interval: float = 1.0,
+    ) -> None:
+        """Open an autosave file, creating or repairing it if needed.
+
+        Args:
+            path (str): The file.
+            width (int): The number of columns of the maps.
+            height (int): The number of rows of the maps.
+            slots (int): The number of sessions of a new file.
+            interval (float): The seconds between flushes.
+
+        Raises:
+            ValueError: If the file is an autosave file of other maps.
+        """
+        self.path: str = path
+        self.width: int = width
+        self.height: int = height
+        self.interval: float = interval
+        self._record = len(snapshot.dumps(Map(Player(""), Random(0), width, height).engine))
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        header = os.pread(self._fd, HEADER.size, 0)
+        if len(header) < HEADER.size or not any(header):
+            # A new file, or one whose creation did not get to the header.
+            self.slots: int = slots
+            os.pwrite(self._fd, HEADER.pack(MAGIC, VERSION, width, height, slots, self._record), 0)
+            os.fsync(self._fd)
+        else:
+            magic, version, file_width, file_height, self.slots, record = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                os.close(self._fd)
+                raise ValueError(f"{path} is not an autosave file of this version.")
+            if (file_width, file_height, record) != (width, height, self._record):
+                os.close(self._fd)
+                raise ValueError(f"{path} holds games of {file_width}x{file_height} maps.")
+        size = self._offset(self.slots, 0)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._sequences: list[int] = [max(self._read(slot)[0], 0) for slot in range(self.slots)]
+        self._last: dict[int, bytes] = {}
+        self._pending: dict[int, bytes] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._metrics = {
+            "saves": 0,
+            "unchanged": 0,
+            "coalesced": 0,
+            "max_queue_depth": 0,
+            "flushes": 0,
+            "records_written": 0,
+            "flush_seconds": 0.0,
+            "max_flush_seconds": 0.0,
+        }
+        self._writer = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._writer.start()
+
+    def _offset(self, slot: int, copy: int) -> int:
+        """Get the offset of a copy of a slot."""
+        return HEADER.size + (2 * slot + copy) * (COPY.size + self._record)
+
+    def _read(self, slot: int) -> tuple[int, bytes | None]:
+        """Read the newest intact copy of a slot.
+
+        Returns:
+            tuple[int, bytes | None]: Its sequence number and record, or -1
+                and None if the slot has never been saved completely.
+        """
+        best: tuple[int, bytes | None] = (-1, None)
+        for copy in (0, 1):
+            data = os.pread(self._fd, COPY.size + self._record, self._offset(slot, copy))
+            if len(data) < COPY.size + self._record:
+                continue
+            sequence, crc = COPY.unpack_from(data)
+            record = data[COPY.size :]
+            if sequence and zlib.crc32(record, sequence) == crc and sequence > best[0]:
+                best = (sequence, record)
+        return best
+
+    def save(self, slot: int, engine: Engine) -> None:
+        """Hand over the state of a game, to be written on the next flush.
+
+        Args:
+            slot (int): The slot of the game.
+            engine (Engine): The game.
+        """
+        if not 0 <= slot < self.slots:
+            raise IndexError(f"There is no slot {slot}.")
+        data = snapshot.dumps(engine)
+        with self._lock:
+            self._metrics["saves"] += 1
+            if self._last.get(slot) == data:
+                self._metrics["unchanged"] += 1
+                return
+            self._last[slot] = data
+            if slot in self._pending:
+                self._metrics["coalesced"] += 1
+            self._pending[slot] = data
+            depth = len(self._pending)
+            if depth > self._metrics["max_queue_depth"]:
+                self._metrics["max_queue_depth"] = depth
+
+    def restore(self, slot: int) -> Engine:
+        """Restore the last saved game of a slot.
+
+        Args:
+            slot (int): The slot.
+
+        Raises:
+            KeyError: If the slot has never been saved.
+
+        Returns:
+            Engine: The game.
+        """
+        with self._lock:
+            data = self._pending.get(slot)
+        if data is None:
+            data = self._read(slot)[1]
+        if data is None:
+            raise KeyError(f"Slot {slot} has not been saved.")
+        return snapshot.loads(data)
+
+    def resume(self, slot: int) -> Game | None:
+        """Restore the unfinished game of a slot, saving it here from then on.
+
+        Args:
+            slot (int): The slot.
+
+        Returns:
+            Game | None: The game, None if there is none or it has ended.
+        """
+        try:
+            engine = self.restore(slot)
+        except KeyError:
+            return None
+        if engine.finished:
+            return None
+        game = snapshot.game_of(engine)
+        game.map.autosave = self
+        game.map.slot = slot
+        return game
+
+    def flush(self) -> None:
+        """Write everything handed over so far and wait for the disk."""
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            began = time.perf_counter()
+            for slot, data in batch.items():
+                sequence = self._sequences[slot] + 1
+                copy = COPY.pack(sequence, zlib.crc32(data, sequence))
+                os.pwrite(self._fd, copy + data, self._offset(slot, sequence & 1))
+                self._sequences[slot] = sequence
+            os.fsync(self._fd)
+            elapsed = time.perf_counter() - began
+        with self._lock:
+            metrics = self._metrics
+            metrics["flushes"] += 1
+            metrics["records_written"] += len(batch)
+            metrics["flush_seconds"] += elapsed
+            metrics["max_flush_seconds"] = max(metrics["max_flush_seconds"], elapsed)
+
+    def _run(self) -> None:
+        """Flush once per interval until closed."""
+        while not self._closed.wait(self.interval):
+            self.flush()
+
+    def stats(self) -> dict[str, float]:
+        """Get the metrics of the writer.
+
+        Returns:
+            dict[str, float]: The saves handed over, skipped as unchanged and
+                coalesced, the current and the largest queue depth, the
+                flushes, the records written and the flush latency.
+        """
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["queue_depth"] = len(self._pending)
+        flushes = stats["flushes"]
+        stats["mean_flush_ms"] = 1000 * stats.pop("flush_seconds") / flushes if flushes else 0.0
+        stats["max_flush_ms"] = 1000 * stats.pop("max_flush_seconds")
+        return stats
+
+    def close(self) -> None:
+        """Flush what is left, stop the writer and close the file."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._writer.join()
+        self.flush()
+        os.close(self._fd)
+
+    def __enter__(self) -> Autosaver:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+
+def bench(sessions: int, moves: int, interval: float) -> dict[str, float]:
+    """Play random moves in many games with autosaving.
+
+    Args:
+        sessions (int): The number of games.
+        moves (int): The moves per game.
+        interval (float): The seconds between flushes.
+
+    Returns:
+        dict[str, float]: The metrics of the writer and the microseconds each
+            save costs the game loop.
+    """
+    path = f"bench-{os.getpid()}.autosave"
+    rng = Random(0)
+    engines = [Map(Player("Bench"), Random(seed)).engine for seed in range(sessions)]
+    try:
+        with Autosaver(path, slots=sessions, interval=interval) as autosaver:
+            spent = 0.0
+            for _ in range(moves):
+                for slot, engine in enumerate(engines):
+                    engine.move(rng.choice(list(CHANGE)))
+                    if engine.pending is not None:
+                        engine.decline()
+                    began = time.perf_counter()
+                    autosaver.save(slot, engine)
+                    spent += time.perf_counter() - began
+            autosaver.flush()
+            stats = autosaver.stats()
+    finally:
+        os.remove(path)
+    stats["save_us"] = 1e6 * spent / (sessions * moves)
+    return stats
+
+
+def main() -> None:
+    """Play a game that is saved as it goes, or run the benchmark."""
+    parser = argparse.ArgumentParser(description="Play with autosaving.")
+    parser.add_argument("path", nargs="?", default="game.autosave")
+    parser.add_argument("--slot", type=int, default=0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--moves", type=int, default=100)
+    args = parser.parse_args()
+    if args.bench:
+        for name, value in bench(args.sessions, args.moves, args.interval).items():
+            print(f"{name}: {value:.2f}")
+        return
+    with Autosaver(args.path, interval=args.interval) as autosaver:
+        game = autosaver.resume(args.slot) or Game(autosave=autosaver, slot=args.slot)
+        game.start()
+
+
+if __name__ == "__main__":
+    main()
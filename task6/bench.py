@@ -0,0 +1,156 @@
+"""The timed cases of the maps, the fights and the renderer, run and compared by benchkit.py.
+
+Usage:
+    python bench.py --output results.json
+    python bench.py --baseline bench_baseline.json
+    python bench.py --save-baseline bench_baseline.json
+"""
+from __future__ import annotations
+
+import contextlib
+import io
+import os
+import sys
+from random import Random
+from typing import Callable
+
+import main as game_main
+from assets import Enemy, Player, Room, Weapon
+from grid import CHANGE
+from main import Map
+from renderer import Renderer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import benchkit  # noqa: E402
+
+SIZES = [3, 10, 30, 100]
+SESSIONS = [1, 100, 1000]
+
+
+def _maps(size: int, sessions: int) -> list[Map]:
+    """Build seeded maps, one per session."""
+    return [Map(Player("Bench"), Random(seed), size, size) for seed in range(sessions)]
+
+
+@contextlib.contextmanager
+def _stubbed_io():
+    """Swallow the output of the game and decline every fight it asks about."""
+    game_main.input = lambda prompt="": "n"
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        del game_main.input
+
+
+def map_init(size: int, sessions: int) -> tuple[Callable[[], None], int]:
+    """Generate a map: the grid, the shuffle and the compiled rules."""
+    seeds = range(max(1, 2000 // (size * size)))
+
+    def step() -> None:
+        for seed in seeds:
+            Map(Player("Bench"), Random(seed), size, size)
+
+    return step, len(seeds)
+
+
+def map_move(size: int, sessions: int) -> tuple[Callable[[], None], int]:
+    """Move in many maps in turns, declining every fight."""
+    maps = _maps(size, sessions)
+    rng = Random(0)
+    directions = [rng.choice(list(CHANGE)) for _ in range(4096)]
+    moves = max(2000, sessions)
+
+    def step() -> None:
+        with _stubbed_io():
+            for i in range(moves):
+                maps[i % sessions].move(directions[i & 4095])
+
+    return step, moves
+
+
+def map_enter_room(size: int, sessions: int) -> tuple[Callable[[], None], int]:
+    """Enter the rooms next to the player in many maps, declining every fight."""
+    maps = _maps(size, sessions)
+    rng = Random(0)
+    deltas = [CHANGE[rng.choice(list(CHANGE))] for _ in range(4096)]
+    moves = max(2000, sessions)
+
+    def step() -> None:
+        with _stubbed_io():
+            for i in range(moves):
+                game_map = maps[i % sessions]
+                x, y = game_map.player.current_room
+                dx, dy = deltas[i & 4095]
+                game_map.enter_room((x + dx, y + dy))
+
+    return step, moves
+
+
+def player_fight(size: int, sessions: int) -> tuple[Callable[[], None], int]:
+    """Fight enemies with the compiled rules."""
+    game_map = Map(Player("Bench"), Random(0), size, size)
+    player = game_map.player
+    player.weapons += [Weapon("cat", "milk"), Weapon("milk", "mosquitto")]
+    enemies = [Enemy("Enemy", Weapon(name)) for name in ("cat", "milk", "mosquitto")]
+    matchups = game_map.engine.matchups
+    fights = [(enemies[i % 3], i % 3) for i in range(3000)]
+
+    def step() -> None:
+        fight = player.fight
+        for enemy, weapon_id in fights:
+            fight(enemy, weapon_id, matchups)
+
+    return step, len(fights)
+
+
+def pick_up_item(size: int, sessions: int) -> tuple[Callable[[], None], int]:
+    """Pick up weapons from rooms."""
+    player = Player("Bench")
+    rooms = []
+    for _ in range(3000):
+        room = Room("Room", "")
+        room.item = Weapon("cat", "milk")
+        rooms.append(room)
+
+    def step() -> None:
+        player.weapons = []
+        for room in rooms:
+            room.item.picked_up = False
+            player.pick_up_item(room)
+
+    return step, len(rooms)
+
+
+def render(size: int, sessions: int) -> tuple[Callable[[], None], int]:
+    """Render the whole map of the game loop."""
+    engine = Map(Player("Bench"), Random(0), size, size).engine
+    engine.move("south")
+    renderer = Renderer(engine, io.StringIO(), size, size)
+    frames = max(1, 20000 // (size * size))
+
+    def step() -> None:
+        renderer.stream = io.StringIO()
+        for _ in range(frames):
+            renderer.render()
+
+    return step, frames
+
+
+CASES: benchkit.Cases = {
+    "map_init": (map_init, True, False),
+    "map_move": (map_move, True, True),
+    "map_enter_room": (map_enter_room, True, True),
+    "player_fight": (player_fight, False, False),
+    "pick_up_item": (pick_up_item, False, False),
+    "render": (render, True, False),
+}
+
+
+def main() -> None:
+    """Run the benchmarks from the command line."""
+    benchkit.main(CASES, SIZES, SESSIONS, "Benchmark the hot paths.")
+
+
+if __name__ == "__main__":
+    main()
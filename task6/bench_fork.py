@@ -0,0 +1,67 @@
+"""A benchmark of forking a game against copy.deepcopy.
+
+Usage:
+    python bench_fork.py --sizes 3 100 1000
+"""
+import argparse
+import copy
+import time
+from random import Random
+
+from main import Game
+
+
+def _per_call(function, repeat: int) -> float:
+    """Get the mean time of a call in microseconds."""
+    began = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - began) / repeat * 1e6
+
+
+def bench(size: int, repeat: int) -> dict[str, float]:
+    """Compare a fork and a deep copy of a size x size game.
+
+    Args:
+        size (int): The width and the height of the map.
+        repeat (int): The number of forks to time.
+
+    Returns:
+        dict[str, float]: The microseconds per fork, per fork and move, and
+            per deep copy.
+    """
+    game = Game(size, size)
+    game.map.engine.move("south")
+    engine = game.map.engine
+    rng = Random(0)
+
+    def fork_and_move() -> None:
+        fork = engine.fork()
+        fork.move(rng.choice(fork.directions()))
+
+    deepcopy_repeat = max(1, repeat // (size * size))
+    return {
+        "fork_us": _per_call(engine.fork, repeat),
+        "fork_and_move_us": _per_call(fork_and_move, repeat),
+        "deepcopy_us": _per_call(lambda: copy.deepcopy(game), deepcopy_repeat),
+    }
+
+
+def main() -> None:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 30, 300])
+    parser.add_argument("--repeat", type=int, default=10000)
+    args = parser.parse_args()
+    for size in args.sizes:
+        stats = bench(size, args.repeat)
+        print(
+            f"{size}x{size}: fork {stats['fork_us']:.2f} us, "
+            f"fork and move {stats['fork_and_move_us']:.2f} us, "
+            f"deepcopy {stats['deepcopy_us']:.2f} us "
+            f"({stats['deepcopy_us'] / stats['fork_us']:.0f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
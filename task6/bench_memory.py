@@ -0,0 +1,88 @@
+"""A tracemalloc benchmark of the memory of big worlds.
+
+Reports the bytes per room and per entity of a world of linked Room
+objects, with the slotted classes and with subclasses that have a
+__dict__ again, and the bytes per cell of the array-backed Grid.
+
+Usage:
+    python bench_memory.py --max 1000000
+"""
+import argparse
+import math
+import os
+import sys
+from random import Random
+
+from assets import Enemy, Player, Room, Weapon
+from main import Map
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchkit import allocated  # noqa: E402
+
+DictRoom = type("DictRoom", (Room,), {})
+DictEnemy = type("DictEnemy", (Enemy,), {})
+DictWeapon = type("DictWeapon", (Weapon,), {})
+
+
+def _linked_world(rooms: int, room_class: type) -> list:
+    """Build a square of linked rooms, like the original 3x3 map."""
+    side = math.isqrt(rooms)
+    world = [room_class("Room", "") for _ in range(side * side)]
+    for y in range(side):
+        for x in range(side):
+            room = world[y * side + x]
+            if y + 1 < side:
+                room.add_neighbour("south", world[(y + 1) * side + x])
+            if y > 0:
+                room.add_neighbour("north", world[(y - 1) * side + x])
+            if x + 1 < side:
+                room.add_neighbour("west", world[y * side + x + 1])
+            if x > 0:
+                room.add_neighbour("east", world[y * side + x - 1])
+    return world
+
+
+def bench(rooms: int) -> dict[str, float]:
+    """Measure the bytes per room and per entity of a world.
+
+    Args:
+        rooms (int): The number of rooms.
+
+    Returns:
+        dict[str, float]: The bytes per room, enemy and weapon.
+    """
+    weapon = Weapon("cat")
+    stats = {}
+    for label, room_class, enemy_class, weapon_class in (
+        ("slots", Room, Enemy, Weapon),
+        ("dict", DictRoom, DictEnemy, DictWeapon),
+    ):
+        used, world = allocated(lambda: _linked_world(rooms, room_class))
+        stats[f"{label}_room"] = used / len(world)
+        used, _ = allocated(lambda: [enemy_class("Enemy", weapon) for _ in range(rooms)])
+        stats[f"{label}_enemy"] = used / rooms
+        used, _ = allocated(lambda: [weapon_class("cat", "milk") for _ in range(rooms)])
+        stats[f"{label}_weapon"] = used / rooms
+    side = max(2, math.isqrt(rooms))
+    used, _ = allocated(lambda: Map(Player("Bench"), Random(0), side, side))
+    stats["grid_cell"] = used / (side * side)
+    return stats
+
+
+def main() -> None:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--min", type=int, default=1000)
+    parser.add_argument("--max", type=int, default=100000)
+    args = parser.parse_args()
+    rooms = args.min
+    while rooms <= args.max:
+        stats = bench(rooms)
+        print(f"{rooms} rooms, bytes per object:")
+        for name, value in stats.items():
+            print(f"  {name}: {value:.1f}")
+        rooms *= 10
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,633 @@
+"""An open-ended map generated in chunks as the player explores it.
+
+The world is split into square chunks. A chunk is generated from the seed
+and its coordinates only, when a cell of it is first looked at, so the
+chunks nobody came near cost no memory. At most max_chunks chunks are kept
+generated, the least recently used one is dropped when a new one is
+needed, and of a dropped chunk only its defeated and picked up bits are
+kept, as bytes, and only if any of them are set.
+
+The top row and the left column of every chunk are roads without enemies,
+and every chunk has a cat and a milk on its roads. Together with the
+player's mosquito that is a weapon that wins against every enemy, so the
+whole world can always be explored. The end room is in the end chunk and
+needs cleared_rooms_needed rooms to be cleared, like on the fixed map.
+
+Usage:
+    python chunks.py --seed 1
+    python chunks.py --bench 100000
+
+classes:
+    ChunkedBitmap
+    ChunkedWorld
+    ChunkedMap
+"""
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+from array import array
+from collections import OrderedDict
+from random import Random
+
+from assets import Bitmap, Character, EndRoom, Enemy, Item, Player, Room, Weapon
+from grid import CHANGE, NONE, Grid, copy_character, copy_item
+from main import Map
+from renderer import Renderer
+
+# Chunk coordinates are packed into one number, so they must stay below this.
+CHUNKS_PER_SIDE = 1 << 20
+
+
+class ChunkedBitmap:
+    """A set of cell indices of a ChunkedWorld, with a small Bitmap per chunk.
+
+    It can be the cleared rooms of a player: it has get, set, discard, copy
+    and shares like Bitmap, but not its bytes (to_bytes, as_int and
+    from_bytes), which would be as long as the whole world. Snapshots,
+    autosaves and state deltas therefore take the players of fixed maps only.
+    Like the world, it keeps at most max_chunks chunks as bitmaps, and only
+    the bytes of the least recently changed ones.
+
+    Attributes:
+        cells (int): The number of cells of a chunk.
+        max_chunks (int): The number of chunks kept as bitmaps.
+        count (int): The number of bits that are set.
+
+    Methods:
+        get: Check a bit.
+        set: Set a bit.
+        discard: Clear a bit.
+        copy: Copy the bitmap, copying the chunks only on the next change.
+        shares: Check if a copy still shares the chunks of the bitmap.
+        stored_bytes: Get the bytes kept for the compacted chunks.
+    """
+
+    __slots__ = ("cells", "max_chunks", "count", "_chunks", "_stored")
+
+    def __init__(self, cells: int, max_chunks: int = 64) -> None:
+        self.cells: int = cells
+        self.max_chunks: int = max_chunks
+        self.count: int = 0
+        self._chunks: OrderedDict[int, Bitmap] = OrderedDict()
+        self._stored: dict[int, bytes] = {}
+
+    def get(self, index: int) -> bool:
+        """Check a bit.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            bool: True if the bit is set, False otherwise.
+        """
+        key, local = divmod(index, self.cells)
+        bitmap = self._chunks.get(key)
+        if bitmap is not None:
+            return bitmap.get(local)
+        stored = self._stored.get(key)
+        return stored is not None and bool(stored[local >> 3] & (1 << (local & 7)))
+
+    def _bitmap(self, key: int) -> Bitmap:
+        """Get the bitmap of a chunk, compacting the least recently changed one if needed."""
+        chunks = self._chunks
+        bitmap = chunks.get(key)
+        if bitmap is not None:
+            chunks.move_to_end(key)
+            return bitmap
+        stored = self._stored.pop(key, None)
+        if stored is None:
+            bitmap = Bitmap(self.cells)
+        else:
+            bitmap = Bitmap.from_bytes(stored, self.cells)
+        chunks[key] = bitmap
+        if len(chunks) > self.max_chunks:
+            old_key, old = chunks.popitem(last=False)
+            if old.count:
+                self._stored[old_key] = old.to_bytes()
+        return bitmap
+
+    def set(self, index: int) -> bool:
+        """Set a bit.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            bool: True if the bit was not set before, False otherwise.
+        """
+        key, local = divmod(index, self.cells)
+        if self._bitmap(key).set(local):
+            self.count += 1
+            return True
+        return False
+
+    def discard(self, index: int) -> bool:
+        """Clear a bit.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            bool: True if the bit was set before, False otherwise.
+        """
+        if not self.get(index):
+            return False
+        key, local = divmod(index, self.cells)
+        self._bitmap(key).discard(local)
+        self.count -= 1
+        return True
+
+    def copy(self) -> ChunkedBitmap:
+        """Copy the bitmap, sharing the bytes of every chunk until it changes.
+
+        Returns:
+            ChunkedBitmap: The copy.
+        """
+        bitmap = ChunkedBitmap(self.cells, self.max_chunks)
+        bitmap.count = self.count
+        bitmap._chunks = OrderedDict((key, chunk.copy()) for key, chunk in self._chunks.items())
+        bitmap._stored = dict(self._stored)
+        return bitmap
+
+    def shares(self, other: ChunkedBitmap) -> bool:
+        """Check if a copy still shares the chunks of the bitmap.
+
+        Args:
+            other (ChunkedBitmap): A copy of the bitmap, or the bitmap it was copied from.
+
+        Returns:
+            bool: True if neither of them has changed since the copy.
+        """
+        if self._stored != other._stored or self._chunks.keys() != other._chunks.keys():
+            return False
+        return all(chunk.shares(other._chunks[key]) for key, chunk in self._chunks.items())
+
+    def stored_bytes(self) -> int:
+        """Get the bytes kept for the compacted chunks."""
+        return sum(len(bits) for bits in self._stored.values())
+
+
+class _Chunk:
+    """The cells of a generated chunk."""
+
+    __slots__ = ("kind_ids", "character_ids", "item_ids", "defeated", "picked_up", "views")
+
+    def __init__(self, cells: int) -> None:
+        self.kind_ids = array("H", bytes(2 * cells))
+        self.character_ids = array("i", [NONE]) * cells
+        self.item_ids = array("i", [NONE]) * cells
+        self.defeated = Bitmap(cells)
+        self.picked_up = Bitmap(cells)
+        self.views: dict[int, Room] = {}
+
+
+class _Bits:
+    """The defeated or the picked up bits of all the chunks of a world."""
+
+    __slots__ = ("world", "name")
+
+    def __init__(self, world: ChunkedWorld, name: str) -> None:
+        self.world = world
+        self.name = name
+
+    def get(self, index: int) -> bool:
+        key, local = divmod(index, self.world.cells)
+        return getattr(self.world._chunk(key), self.name).get(local)
+
+    def set(self, index: int) -> bool:
+        key, local = divmod(index, self.world.cells)
+        return getattr(self.world._chunk(key), self.name).set(local)
+
+    def discard(self, index: int) -> bool:
+        key, local = divmod(index, self.world.cells)
+        return getattr(self.world._chunk(key), self.name).discard(local)
+
+
+class ChunkedWorld:
+    """A map of chunks generated on demand, with the interface of Grid.
+
+    Only the defeated and picked up bits of a dropped chunk are kept, and it
+    is generated again from the seed, so the characters stay in the cells
+    they were generated in: there is no move_character, and the roaming
+    characters of scheduler.World need a Grid. Defeated enemies can be
+    revived.
+
+    Attributes:
+        seed (int): The seed of the world.
+        chunk_size (int): The number of columns and rows of a chunk.
+        cells (int): The number of cells of a chunk.
+        width (int): The number of columns of the world.
+        height (int): The number of rows of the world.
+        room_kinds (list[tuple[str, str]]): The names and descriptions of rooms.
+        characters (list[Character]): The character templates.
+        items (list[Item]): The item templates.
+        defeated: The cells where the enemy has been defeated.
+        picked_up: The cells where the item has been picked up.
+        end (int): The index of the end room cell.
+        cleared_rooms_needed (int): The number of rooms to clear to enter the end room.
+        max_chunks (int): The number of chunks kept generated at once.
+        generated (int): The number of chunks generated so far.
+
+    Methods:
+        index: Get the index of a cell.
+        position: Get the coordinates of a cell.
+        in_bounds: Check if the coordinates are in the world.
+        neighbours: Get the neighbouring cells.
+        name: Get the name of the room in a cell.
+        description: Get the description of the room in a cell.
+        character: Get the character template of a cell.
+        item: Get the item template of a cell.
+        defeat: Mark the enemy of a cell as defeated.
+        revive: Bring the defeated enemy of a cell back.
+        pick_up: Mark the item of a cell as picked up.
+        room: Get a room view of a cell.
+        loaded: Get the number of generated chunks in memory.
+        stored_bytes: Get the bytes kept for the dropped chunks.
+        fork: Copy the world.
+    """
+
+    def __init__(
+        self,
+        seed: int,
+        chunk_size: int = 8,
+        max_chunks: int = 64,
+        end_chunk: tuple[int, int] = (2, 2),
+        cleared_rooms_needed: int = 50,
+    ) -> None:
+        if chunk_size < 3:
+            raise ValueError("The chunks must be at least 3x3.")
+        self.seed: int = seed
+        self.chunk_size: int = chunk_size
+        self.cells: int = chunk_size * chunk_size
+        self.width: int = CHUNKS_PER_SIDE * chunk_size
+        self.height: int = CHUNKS_PER_SIDE * chunk_size
+        template = Map(Player(""), Random(0), 4, 4).rooms
+        self.room_kinds: list[tuple[str, str]] = template.room_kinds
+        self.characters: list[Character] = template.characters
+        self.items: list[Item] = template.items
+        self._classify(template)
+        self.end: int = self.index(
+            end_chunk[0] * chunk_size + chunk_size - 1, end_chunk[1] * chunk_size + chunk_size - 1
+        )
+        self.cleared_rooms_needed: int = cleared_rooms_needed
+        self.max_chunks: int = max_chunks
+        self.generated: int = 0
+        self.defeated = _Bits(self, "defeated")
+        self.picked_up = _Bits(self, "picked_up")
+        self._chunks: OrderedDict[int, _Chunk] = OrderedDict()
+        self._stored: dict[int, bytes] = {}
+
+    def _classify(self, template: Grid) -> None:
+        """Sort the rooms of a generated map into the kinds chunks are built from."""
+        self._start = (template.kind_ids[0], template.character_ids[0], template.item_ids[0])
+        end = template.end
+        self._end = (template.kind_ids[end], template.character_ids[end], template.item_ids[end])
+        self._weapon_rooms: dict[str, tuple[int, int, int]] = {}
+        self._safe: list[tuple[int, int, int]] = []
+        self._rooms: list[tuple[int, int, int]] = []
+        for index in range(1, end):
+            cell = (template.kind_ids[index], template.character_ids[index], template.item_ids[index])
+            if cell in self._rooms:
+                continue
+            self._rooms.append(cell)
+            item = template.item(index)
+            if isinstance(item, Weapon):
+                self._weapon_rooms[item.name] = cell
+            if not isinstance(template.character(index), Enemy):
+                self._safe.append(cell)
+
+    def __len__(self) -> int:
+        return self.width * self.height
+
+    def index(self, x: int, y: int) -> int:
+        """Get the index of a cell: its chunk's key, then its place in the chunk.
+
+        Args:
+            x (int): The column.
+            y (int): The row.
+
+        Returns:
+            int: The index of the cell.
+        """
+        size = self.chunk_size
+        chunk_x, local_x = divmod(x, size)
+        chunk_y, local_y = divmod(y, size)
+        return (chunk_y * CHUNKS_PER_SIDE + chunk_x) * self.cells + local_y * size + local_x
+
+    def position(self, index: int) -> tuple[int, int]:
+        """Get the coordinates of a cell.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            tuple[int, int]: The column and the row.
+        """
+        key, local = divmod(index, self.cells)
+        chunk_y, chunk_x = divmod(key, CHUNKS_PER_SIDE)
+        local_y, local_x = divmod(local, self.chunk_size)
+        return chunk_x * self.chunk_size + local_x, chunk_y * self.chunk_size + local_y
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        """Check if the coordinates are in the world.
+
+        Args:
+            x (int): The column.
+            y (int): The row.
+
+        Returns:
+            bool: True if there is a cell, False otherwise.
+        """
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def neighbours(self, x: int, y: int) -> dict[str, tuple[int, int]]:
+        """Get the neighbouring cells.
+
+        Args:
+            x (int): The column.
+            y (int): The row.
+
+        Returns:
+            dict[str, tuple[int, int]]: The coordinates of the cell in each direction.
+        """
+        return {
+            direction: (x + dx, y + dy)
+            for direction, (dx, dy) in CHANGE.items()
+            if 0 <= x + dx < self.width and 0 <= y + dy < self.height
+        }
+
+    def _generate(self, key: int) -> _Chunk:
+        """Generate a chunk from the seed and its coordinates."""
+        chunk_y, chunk_x = divmod(key, CHUNKS_PER_SIDE)
+        rng = Random(f"{self.seed}:{chunk_x}:{chunk_y}")
+        size = self.chunk_size
+        chunk = _Chunk(self.cells)
+        for local in range(self.cells):
+            local_y, local_x = divmod(local, size)
+            if local_x == 0 or local_y == 0:
+                cell = rng.choice(self._safe)
+            else:
+                cell = rng.choice(self._rooms)
+            chunk.kind_ids[local], chunk.character_ids[local], chunk.item_ids[local] = cell
+        for local, name in ((1, "cat"), (size, "milk")):
+            cell = self._weapon_rooms[name]
+            chunk.kind_ids[local], chunk.character_ids[local], chunk.item_ids[local] = cell
+        if key == 0:
+            chunk.kind_ids[0], chunk.character_ids[0], chunk.item_ids[0] = self._start
+            chunk.picked_up.set(0)
+        end_key, end_local = divmod(self.end, self.cells)
+        if key == end_key:
+            cell = self._end
+            chunk.kind_ids[end_local], chunk.character_ids[end_local] = cell[0], cell[1]
+            chunk.item_ids[end_local] = cell[2]
+        stored = self._stored.pop(key, None)
+        if stored is not None:
+            half = len(stored) // 2
+            chunk.defeated = Bitmap.from_bytes(stored[:half], self.cells)
+            chunk.picked_up = Bitmap.from_bytes(stored[half:], self.cells)
+        self.generated += 1
+        return chunk
+
+    def _chunk(self, key: int) -> _Chunk:
+        """Get a chunk, generating it and dropping the least recently used one if needed."""
+        chunks = self._chunks
+        chunk = chunks.get(key)
+        if chunk is not None:
+            chunks.move_to_end(key)
+            return chunk
+        chunk = chunks[key] = self._generate(key)
+        if len(chunks) > self.max_chunks:
+            old_key, old = chunks.popitem(last=False)
+            if old.defeated.count or old.picked_up.count:
+                self._stored[old_key] = old.defeated.to_bytes() + old.picked_up.to_bytes()
+        return chunk
+
+    def _cell(self, index: int) -> tuple[_Chunk, int]:
+        """Get the chunk of a cell and the cell's place in it."""
+        key, local = divmod(index, self.cells)
+        return self._chunk(key), local
+
+    def name(self, index: int) -> str:
+        """Get the name of the room in a cell."""
+        chunk, local = self._cell(index)
+        return self.room_kinds[chunk.kind_ids[local]][0]
+
+    def description(self, index: int) -> str:
+        """Get the description of the room in a cell."""
+        chunk, local = self._cell(index)
+        return self.room_kinds[chunk.kind_ids[local]][1]
+
+    def character(self, index: int) -> Character | None:
+        """Get the character template of a cell, None if there is none."""
+        chunk, local = self._cell(index)
+        character_id = chunk.character_ids[local]
+        return None if character_id == NONE else self.characters[character_id]
+
+    def item(self, index: int) -> Item | None:
+        """Get the item template of a cell, None if there is none."""
+        chunk, local = self._cell(index)
+        item_id = chunk.item_ids[local]
+        return None if item_id == NONE else self.items[item_id]
+
+    def defeat(self, index: int) -> None:
+        """Mark the enemy of a cell as defeated."""
+        chunk, local = self._cell(index)
+        chunk.defeated.set(local)
+        view = chunk.views.get(local)
+        if view is not None and isinstance(view.character, Enemy):
+            view.character.defeated = True
+
+    def revive(self, index: int) -> None:
+        """Bring the defeated enemy of a cell back."""
+        chunk, local = self._cell(index)
+        chunk.defeated.discard(local)
+        view = chunk.views.get(local)
+        if view is not None and isinstance(view.character, Enemy):
+            view.character.defeated = False
+
+    def pick_up(self, index: int) -> None:
+        """Mark the item of a cell as picked up."""
+        chunk, local = self._cell(index)
+        chunk.picked_up.set(local)
+        view = chunk.views.get(local)
+        if view is not None and view.item is not None:
+            view.item.picked_up = True
+
+    def room(self, x: int, y: int) -> Room:
+        """Get a room view of a cell, reused while its chunk stays generated.
+
+        Args:
+            x (int): The column.
+            y (int): The row.
+
+        Returns:
+            Room: The room in the cell.
+        """
+        index = self.index(x, y)
+        chunk, local = self._cell(index)
+        view = chunk.views.get(local)
+        if view is not None:
+            return view
+        name, description = self.room_kinds[chunk.kind_ids[local]]
+        if index == self.end:
+            view = EndRoom(name, description, self.cleared_rooms_needed)
+        else:
+            view = Room(name, description)
+        character = self.character(index)
+        if character is not None:
+            view.character = copy_character(character)
+            if isinstance(view.character, Enemy):
+                view.character.defeated = chunk.defeated.get(local)
+        item = self.item(index)
+        if item is not None:
+            view.item = copy_item(item)
+            view.item.picked_up = chunk.picked_up.get(local)
+        chunk.views[local] = view
+        return view
+
+    def loaded(self) -> int:
+        """Get the number of generated chunks in memory."""
+        return len(self._chunks)
+
+    def stored_bytes(self) -> int:
+        """Get the bytes kept for the dropped chunks."""
+        return sum(len(bits) for bits in self._stored.values())
+
+    def fork(self) -> ChunkedWorld:
+        """Copy the world.
+
+        The copy starts with no generated chunks and the state of every
+        chunk stored, so it costs about as much as the stored bytes.
+
+        Returns:
+            ChunkedWorld: The copy.
+        """
+        world = ChunkedWorld.__new__(ChunkedWorld)
+        world.__dict__.update(self.__dict__)
+        world.defeated = _Bits(world, "defeated")
+        world.picked_up = _Bits(world, "picked_up")
+        world._chunks = OrderedDict()
+        world._stored = dict(self._stored)
+        for key, chunk in self._chunks.items():
+            if chunk.defeated.count or chunk.picked_up.count:
+                world._stored[key] = chunk.defeated.to_bytes() + chunk.picked_up.to_bytes()
+        return world
+
+
+class ChunkedMap(Map):
+    """An open-ended map of the game, played like Map.
+
+    Attributes:
+        rooms (ChunkedWorld): The world of chunks.
+        player (Player): The player character.
+        starting_room (Room): The starting room.
+        engine (Engine): The I/O-free rules of the game.
+    """
+
+    def __init__(
+        self,
+        player: Player,
+        seed: int,
+        chunk_size: int = 8,
+        max_chunks: int = 64,
+        end_chunk: tuple[int, int] = (2, 2),
+        cleared_rooms_needed: int = 50,
+    ) -> None:
+        """Initialize the map.
+
+        Args:
+            player (Player): The player character.
+            seed (int): The seed the chunks are generated from.
+            chunk_size (int): The number of columns and rows of a chunk.
+            max_chunks (int): The number of chunks kept generated at once.
+            end_chunk (tuple[int, int]): The chunk with the end room in its
+                bottom right corner.
+            cleared_rooms_needed (int): The number of rooms to clear to
+                enter the end room.
+        """
+        world = ChunkedWorld(seed, chunk_size, max_chunks, end_chunk, cleared_rooms_needed)
+        player.cleared_rooms = ChunkedBitmap(world.cells, max_chunks)
+        self._start(world, player)
+
+
+def bench(steps: int, seed: int = 0, max_chunks: int = 64) -> dict[str, float]:
+    """Walk far into a world and measure what it costs.
+
+    Args:
+        steps (int): The number of moves.
+        seed (int): The seed of the world.
+        max_chunks (int): The number of chunks kept generated at once.
+
+    Returns:
+        dict[str, float]: The moves per second, the chunks generated, kept
+            and stored, and the memory used.
+    """
+    rng = Random(seed)
+    tracemalloc.start()
+    # The end room is put out of reach, so the walk does not stop there.
+    far = CHUNKS_PER_SIDE - 1
+    game_map = ChunkedMap(Player("Bench"), seed, max_chunks=max_chunks, end_chunk=(far, far))
+    engine = game_map.engine
+    # Drift to the south west, so the walk keeps reaching new chunks.
+    directions = ["south", "west", "south", "west", "north", "east"]
+    moves = 0
+    began = time.perf_counter()
+    for moves in range(1, steps + 1):
+        engine.move(rng.choice(directions))
+        if engine.pending is not None:
+            enemy = engine.grid.character(engine.grid.index(*engine.pending))
+            assert isinstance(enemy, Enemy)
+            weapon = next(
+                (i for i, weapon in enumerate(engine.player.weapons)
+                 if weapon.can_kill == enemy.weapon.name),
+                None,
+            )
+            if weapon is None:
+                engine.decline()
+            else:
+                engine.fight(weapon)
+        if engine.finished:
+            break
+    elapsed = time.perf_counter() - began
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    world = game_map.rooms
+    return {
+        "moves_per_sec": moves / elapsed,
+        "generated": world.generated,
+        "loaded": world.loaded(),
+        "stored": len(world._stored),
+        "stored_bytes": world.stored_bytes(),
+        "cleared_stored_bytes": engine.player.cleared_rooms.stored_bytes(),
+        "memory_kb": memory / 1024,
+        "position": str(engine.player.current_room),
+    }
+
+
+def main() -> None:
+    """Play an open-ended game, or run the benchmark."""
+    parser = argparse.ArgumentParser(description="Explore an open-ended map.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=8)
+    parser.add_argument("--max-chunks", type=int, default=64)
+    parser.add_argument("--bench", type=int, metavar="STEPS")
+    args = parser.parse_args()
+    if args.bench:
+        for name, value in bench(args.bench, args.seed, args.max_chunks).items():
+            print(f"{name}: {value}")
+        return
+    game_map = ChunkedMap(
+        Player("Abdul Ali Al-Ahmed"), args.seed, args.chunk_size, args.max_chunks
+    )
+    print("You are Abdul Ali Al-Ahmed, somewhere in an endless dungeon.")
+    print(game_map.starting_room.description)
+    renderer = Renderer(game_map.engine)
+    while True:
+        renderer.render()
+        game_map.move(input("Where do you want to go?\n"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""An I/O-free core of the game.
+
+The engine takes commands (move, fight with a weapon, decline a fight) and
+returns the events they caused, so a session can be driven by anything:
+a terminal, a bot or a server.
+
+classes:
+    Event
+    Engine
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from assets import Enemy, Friend, Player, Weapon
+from grid import CHANGE, Grid
+from matchups import Matchups, compile_rules
+
+if TYPE_CHECKING:
+    from chunks import ChunkedWorld
+
+REJECTED = "rejected"
+ENTERED = "entered"
+DENIED = "denied"
+ENEMY = "enemy"
+BUSY = "busy"
+DECLINED = "declined"
+INVALID_WEAPON = "invalid_weapon"
+FIGHT_WON = "fight_won"
+FIGHT_LOST = "fight_lost"
+TALK = "talk"
+PICKED_UP = "picked_up"
+MOVED = "moved"
+WON = "won"
+
+
+class Event:
+    """A result of a command.
+
+    Attributes:
+        kind (str): The kind of the event, one of the module constants.
+        message (str): The text to show to the player.
+        data (dict): Additional details of the event.
+    """
+
+    def __init__(self, kind: str, message: str = "", **data: object) -> None:
+        self.kind: str = kind
+        self.message: str = message
+        self.data: dict[str, object] = data
+
+    def __repr__(self) -> str:
+        return f"Event({self.kind!r}, {self.message!r})"
+
+
+class Engine:
+    """The rules of the game without any input or output.
+
+    Attributes:
+        grid (Grid | ChunkedWorld): The map of the game.
+        player (Player): The player character.
+        matchups (Matchups): The compiled weapon rules.
+        pending (tuple[int, int] | None): The room with an enemy waiting for a
+            fight or a decline.
+        finished (bool): Whether the game has ended.
+        won (bool): Whether the player has won.
+
+    Methods:
+        directions: Get the directions that lead to a room.
+        move: Move in a direction.
+        enter: Enter a room.
+        fight: Fight the pending enemy.
+        decline: Decline to fight the pending enemy.
+        fork: Copy the game cheaply.
+    """
+
+    def __init__(
+        self, grid: Grid | ChunkedWorld, player: Player, matchups: Matchups | None = None
+    ) -> None:
+        self.grid = grid
+        self.player = player
+        self.matchups = matchups or compile_rules(
+            [item for item in grid.items if isinstance(item, Weapon)]
+            + [enemy.weapon for enemy in grid.characters if isinstance(enemy, Enemy)]
+            + player.weapons
+        )
+        self.pending: tuple[int, int] | None = None
+        self.finished: bool = False
+        self.won: bool = False
+        self.player.clear_room(grid.index(*player.current_room))
+
+    def directions(self) -> list[str]:
+        """Get the directions that lead to a room from the current one.
+
+        Returns:
+            list[str]: The directions the player can try to move in.
+        """
+        return list(self.grid.neighbours(*self.player.current_room))
+
+    def move(self, direction: str) -> list[Event]:
+        """Move in a direction.
+
+        Args:
+            direction (str): The direction to move in.
+
+        Returns:
+            list[Event]: The events caused by the move.
+        """
+        if direction not in CHANGE:
+            return [Event(REJECTED, "You can't go there.")]
+        return self.enter(
+            (
+                self.player.current_room[0] + CHANGE[direction][0],
+                self.player.current_room[1] + CHANGE[direction][1],
+            )
+        )
+
+    def enter(self, room_id: tuple[int, int]) -> list[Event]:
+        """Enter a room.
+
+        The player is moved to the room only if it was entered. If there is
+        an enemy in the room, the engine waits for fight or decline.
+
+        Args:
+            room_id (tuple[int, int]): The room's id.
+
+        Returns:
+            list[Event]: The events caused by entering.
+        """
+        if self.finished:
+            return [Event(REJECTED, "The game is over.")]
+        if self.pending is not None:
+            return [Event(BUSY, "You need to fight or leave first.")]
+        grid = self.grid
+        if not grid.in_bounds(*room_id):
+            return [Event(REJECTED, "You can't go there.", room_id=room_id)]
+        index = grid.index(*room_id)
+        events = [
+            Event(
+                ENTERED,
+                f"You are entering {grid.name(index)}.\n{grid.description(index)}",
+                room_id=room_id,
+            )
+        ]
+        if index == grid.end:
+            if not grid.room(*room_id).can_enter(self.player):
+                events.append(
+                    Event(
+                        DENIED,
+                        "You can't go there. You need to clear all the rooms first.",
+                        room_id=room_id,
+                    )
+                )
+                return events
+            self.player.clear_room(index)
+        character = grid.character(index)
+        if isinstance(character, Enemy) and not grid.defeated.get(index):
+            self.pending = room_id
+            events.append(
+                Event(ENEMY, f"There is a {character.name} in the room.", room_id=room_id)
+            )
+            return events
+        if isinstance(character, Friend):
+            events.append(Event(TALK, character.talk()))
+        self._finish(room_id, events)
+        return events
+
+    def fight(self, weapon_id: int) -> list[Event]:
+        """Fight the pending enemy.
+
+        Args:
+            weapon_id (int): The index of the player's weapon to use.
+
+        Returns:
+            list[Event]: The events caused by the fight.
+        """
+        if self.pending is None:
+            return [Event(REJECTED, "There is no one to fight.")]
+        room_id = self.pending
+        self.pending = None
+        if not 0 <= weapon_id < len(self.player.weapons):
+            return [Event(INVALID_WEAPON, "Invalid weapon.", room_id=room_id)]
+        index = self.grid.index(*room_id)
+        enemy = self.grid.character(index)
+        assert isinstance(enemy, Enemy)
+        weapon = self.player.weapons[weapon_id]
+        intro = f"You are fighting against the {enemy.name}\nYou are using the {weapon.name}"
+        message = self.matchups.message(
+            self.matchups.ids[weapon.name], self.matchups.ids[enemy.weapon.name]
+        )
+        if not self.player.fight(enemy, weapon_id, self.matchups):
+            self.finished = True
+            return [
+                Event(
+                    FIGHT_LOST,
+                    f"{intro}\n{message}\nYou lose!",
+                    room_id=room_id,
+                    weapon=weapon.name,
+                    enemy_weapon=enemy.weapon.name,
+                )
+            ]
+        self.grid.defeat(index)
+        events = [
+            Event(
+                FIGHT_WON,
+                f"{intro}\n{message}",
+                room_id=room_id,
+                weapon=weapon.name,
+                enemy_weapon=enemy.weapon.name,
+            )
+        ]
+        self._finish(room_id, events)
+        return events
+
+    def decline(self) -> list[Event]:
+        """Decline to fight the pending enemy and stay where you are.
+
+        Returns:
+            list[Event]: The events caused by declining.
+        """
+        if self.pending is None:
+            return [Event(REJECTED, "There is no one to fight.")]
+        room_id = self.pending
+        self.pending = None
+        return [Event(DECLINED, room_id=room_id)]
+
+    def fork(self) -> Engine:
+        """Copy the game to try commands on it without changing this one.
+
+        Only what has changed since the fork gets copied, so a fork costs
+        about as much as the player's weapons list.
+
+        Returns:
+            Engine: The copy.
+        """
+        engine = Engine(self.grid.fork(), self.player.fork(), self.matchups)
+        engine.pending = self.pending
+        engine.finished = self.finished
+        engine.won = self.won
+        return engine
+
+    def _finish(self, room_id: tuple[int, int], events: list[Event]) -> None:
+        """Clear an entered room, move the player there and pick up the item.
+
+        Args:
+            room_id (tuple[int, int]): The room's id.
+            events (list[Event]): The list to add the events to.
+        """
+        grid = self.grid
+        index = grid.index(*room_id)
+        self.player.clear_room(index)
+        self.player.current_room = room_id
+        events.append(Event(MOVED, room_id=room_id))
+        item = grid.item(index)
+        if item is None or grid.picked_up.get(index):
+            return
+        if self.player.pick_up_item(grid.room(*room_id)):
+            self.finished = True
+            self.won = True
+            events.append(
+                Event(
+                    WON,
+                    "==================\nThe cake is a lie.\n==================",
+                    room_id=room_id,
+                )
+            )
+            return
+        grid.pick_up(index)
+        events.append(Event(PICKED_UP, f"You picked up {item.name}.", item=item.name))
@@ -0,0 +1,552 @@
+"""An append-only log of the events of all the games, and its columnar export.
+
+Every event is written as a fixed-size binary record: the time, the
+session, the number of the command in the session, the kind, the room,
+and for fights and pick-ups the player's weapon, the enemy's weapon and
+the item. The strings are stored as codes into a table of names kept in
+the header of every segment, so a segment can be read on its own. The
+header also has the id of the run of the program that wrote it, as the
+session ids start again in every run.
+
+Records are collected in a buffer and written with one system call per
+batch, or when flush_interval seconds have passed since the last write.
+The log is split into segments of at most max_bytes; a new segment is
+also started when a name appears that the table of the current one does
+not have.
+
+The exporter turns the segments into one file per field, each a plain
+little-endian typed array, with the names in a JSON file next to them.
+They can be memory-mapped and aggregated over without parsing anything.
+
+Usage:
+    python main.py --log logs
+    python eventlog.py export logs columns
+    python eventlog.py stats columns
+    python eventlog.py bench
+
+classes:
+    EventLog
+    Logged
+
+functions:
+    log_events
+    read_segment
+    export
+    stats
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from typing import TYPE_CHECKING, Iterator
+
+from engine import (
+    BUSY,
+    DECLINED,
+    DENIED,
+    ENEMY,
+    ENTERED,
+    FIGHT_LOST,
+    FIGHT_WON,
+    INVALID_WEAPON,
+    MOVED,
+    PICKED_UP,
+    REJECTED,
+    TALK,
+    WON,
+    Engine,
+    Event,
+)
+
+if TYPE_CHECKING:
+    from main import Map
+
+MAGIC = b"S6EL"
+VERSION = 2
+# magic, version, number of names, run.
+HEADER = struct.Struct("<4sHHQ")
+NAME = struct.Struct("<B")
+# time_ns, session, sequence, kind, weapon, enemy weapon, item, x, y.
+RECORD = struct.Struct("<qIIBBBBii")
+FIELDS = [
+    ("time_ns", "q"),
+    ("session", "I"),
+    ("sequence", "I"),
+    ("kind", "B"),
+    ("weapon", "B"),
+    ("enemy_weapon", "B"),
+    ("item", "B"),
+    ("x", "i"),
+    ("y", "i"),
+]
+# The code of a missing name, and of a missing room in x and y.
+MISSING = 255
+NO_ROOM = -1
+KINDS = [
+    REJECTED, ENTERED, DENIED, ENEMY, BUSY, DECLINED, INVALID_WEAPON,
+    FIGHT_WON, FIGHT_LOST, TALK, PICKED_UP, MOVED, WON,
+]
+
+
+class EventLog:
+    """An append-only log of events, in rotated segment files.
+
+    It is meant to be written from one thread, like the game loop or the
+    event loop of the server.
+
+    Attributes:
+        directory (str): The directory of the segments.
+        max_bytes (int): The size after which a new segment is started.
+        batch_bytes (int): The size of the buffer written at once.
+        flush_interval (float): The seconds after which the buffer is
+            written even if it is not full.
+        run (int): The id of the run in the header of every segment, so
+            that the session and the sequence of an event together with it
+            are unique across the runs appending to one directory.
+        names (list[str]): The names of the current segment.
+        events (int): The number of events logged.
+        writes (int): The number of batches written.
+        segments (int): The number of segments started.
+
+    Methods:
+        append: Log the events of a command.
+        flush: Write the buffered events.
+        close: Write the buffered events and close the segment.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 64 << 20,
+        batch_bytes: int = 64 << 10,
+        names: list[str] | None = None,
+        flush_interval: float = 1.0,
+        run: int | None = None,
+    ) -> None:
+        """Open the log, after the segments already in the directory.
+
+        Args:
+            directory (str): The directory of the segments, created if needed.
+            max_bytes (int): The size after which a new segment is started.
+            batch_bytes (int): The size of the buffer written at once.
+            names (list[str] | None): The weapon and item names to put in
+                the table of every segment, on top of the event kinds.
+            flush_interval (float): The seconds after which the buffer is
+                written by the next append even if it is not full. A program
+                that can go quiet calls flush as often, see GameServer.
+            run (int | None): The id of the run, the time the log is opened
+                in nanoseconds if not given.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.batch_bytes: int = batch_bytes
+        self.flush_interval: float = flush_interval
+        self.run: int = time.time_ns() if run is None else run
+        self.names: list[str] = list(KINDS) + [n for n in names or [] if n not in KINDS]
+        self.events: int = 0
+        self.writes: int = 0
+        self.segments: int = 0
+        self._codes: dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        self._sequences: dict[int, int] = {}
+        self._buffer = bytearray()
+        self._flushed: int = time.monotonic_ns()
+        self._size: int = 0
+        self._fd: int | None = None
+        numbers = [int(name[7:13]) for name in os.listdir(directory) if _is_segment(name)]
+        self._number: int = max(numbers, default=-1) + 1
+
+    def __enter__(self) -> EventLog:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def _open(self) -> None:
+        """Start a new segment with the current table of names."""
+        if self._fd is not None:
+            os.close(self._fd)
+        path = os.path.join(self.directory, f"events-{self._number:06d}.log")
+        self._number += 1
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        header = bytearray(HEADER.pack(MAGIC, VERSION, len(self.names), self.run))
+        for name in self.names:
+            encoded = name.encode()
+            header += NAME.pack(len(encoded)) + encoded
+        os.write(self._fd, header)
+        self._size = len(header)
+        self.segments += 1
+
+    def _code(self, name: object) -> int:
+        """Get the code of a name, adding it to the table if it is new."""
+        if name is None:
+            return MISSING
+        code = self._codes.get(name)
+        if code is None:
+            if len(self.names) >= MISSING:
+                raise ValueError("The log cannot hold more than 255 names.")
+            # The records buffered so far use the old table: write them to
+            # the current segment and start one with the new table.
+            self.flush()
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+            if self._fd is not None:
+                self._open()
+        return code
+
+    def append(self, session: int, events: list[Event]) -> None:
+        """Log the events of a command.
+
+        Args:
+            session (int): The session the command was played in.
+            events (list[Event]): The events of the command.
+        """
+        if not events:
+            return
+        sequence = self._sequences.get(session, 0)
+        self._sequences[session] = sequence + 1
+        now = time.time_ns()
+        code, pack, buffer = self._code, RECORD.pack, self._buffer
+        for event in events:
+            data = event.data
+            room = data.get("room_id")
+            x, y = (NO_ROOM, NO_ROOM) if room is None else room
+            buffer += pack(
+                now,
+                session,
+                sequence,
+                code(event.kind),
+                code(data.get("weapon")),
+                code(data.get("enemy_weapon")),
+                code(data.get("item")),
+                x,
+                y,
+            )
+        self.events += len(events)
+        if (
+            len(buffer) >= self.batch_bytes
+            or time.monotonic_ns() - self._flushed >= self.flush_interval * 1e9
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered events, starting a new segment if the current one is full."""
+        self._flushed = time.monotonic_ns()
+        if not self._buffer:
+            return
+        if self._fd is None or self._size + len(self._buffer) > self.max_bytes:
+            self._open()
+        data = memoryview(self._buffer)
+        while data:
+            data = data[os.write(self._fd, data) :]
+        data.release()
+        self._size += len(self._buffer)
+        self._buffer.clear()
+        self.writes += 1
+
+    def close(self) -> None:
+        """Write the buffered events and close the segment."""
+        self.flush()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _is_segment(name: str) -> bool:
+    """Check if a file name is the name of a segment."""
+    return len(name) == 17 and name.startswith("events-") and name.endswith(".log")
+
+
+class Logged:
+    """An engine that logs the events of the commands it is given.
+
+    Everything else is passed through to the logged engine, so it can be
+    used wherever the engine is.
+
+    Attributes:
+        engine (Engine): The logged game.
+        log (EventLog): The log.
+        session (int): The session of the game in the log.
+
+    Methods:
+        move: Move in a direction.
+        enter: Enter a room.
+        fight: Fight the pending enemy.
+        decline: Decline to fight the pending enemy.
+    """
+
+    def __init__(self, engine: Engine, log: EventLog, session: int = 0) -> None:
+        self.engine = engine
+        self.log: EventLog = log
+        self.session: int = session
+
+    def __getattr__(self, name: str) -> object:
+        return getattr(self.engine, name)
+
+    def move(self, direction: str) -> list[Event]:
+        """Move in a direction, see Engine.move."""
+        events = self.engine.move(direction)
+        self.log.append(self.session, events)
+        return events
+
+    def enter(self, room_id: tuple[int, int]) -> list[Event]:
+        """Enter a room, see Engine.enter."""
+        events = self.engine.enter(room_id)
+        self.log.append(self.session, events)
+        return events
+
+    def fight(self, weapon_id: int) -> list[Event]:
+        """Fight the pending enemy, see Engine.fight."""
+        events = self.engine.fight(weapon_id)
+        self.log.append(self.session, events)
+        return events
+
+    def decline(self) -> list[Event]:
+        """Decline to fight the pending enemy, see Engine.decline."""
+        events = self.engine.decline()
+        self.log.append(self.session, events)
+        return events
+
+
+def log_events(game_map: Map, log: EventLog, session: int = 0) -> Logged:
+    """Start logging the events of a map's game.
+
+    Args:
+        game_map (Map): The map whose engine to wrap.
+        log (EventLog): The log.
+        session (int): The session of the game in the log.
+
+    Returns:
+        Logged: The engine the map uses from now on.
+    """
+    engine = Logged(game_map.engine, log, session)
+    game_map.engine = engine
+    return engine
+
+
+def read_segment(path: str) -> tuple[list[str], int, memoryview]:
+    """Read a segment.
+
+    Args:
+        path (str): The segment file.
+
+    Raises:
+        ValueError: If it is not a segment of this version.
+
+    Returns:
+        tuple[list[str], int, memoryview]: The table of names, the run and
+            the records. A record cut short by a crash is left out.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not an event log segment.")
+    magic, version, count, run = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not an event log segment of version {VERSION}.")
+    offset = HEADER.size
+    names = []
+    for _ in range(count):
+        (length,) = NAME.unpack_from(data, offset)
+        names.append(data[offset + 1 : offset + 1 + length].decode())
+        offset += 1 + length
+    records = memoryview(data)[offset:]
+    return names, run, records[: len(records) - len(records) % RECORD.size]
+
+
+def _segments(directory: str) -> Iterator[str]:
+    """Get the paths of the segments of a log, oldest first."""
+    for name in sorted(os.listdir(directory)):
+        if _is_segment(name):
+            yield os.path.join(directory, name)
+
+
+def _columns(records: memoryview, remap: list[int]) -> dict[str, bytes]:
+    """Split records into little-endian columns, with the name codes remapped."""
+    try:
+        import numpy
+    except ImportError:
+        columns = {field: array(code) for field, code in FIELDS}
+        for values in RECORD.iter_unpack(records):
+            for (field, _), value in zip(FIELDS, values):
+                columns[field].append(value)
+        for field in ("kind", "weapon", "enemy_weapon", "item"):
+            columns[field] = array("B", [remap[code] for code in columns[field]])
+        if sys.byteorder == "big":
+            for column in columns.values():
+                column.byteswap()
+        return {field: column.tobytes() for field, column in columns.items()}
+    dtype = numpy.dtype([(field, "<" + code) for field, code in FIELDS])
+    table = numpy.asarray(remap, dtype=numpy.uint8)
+    rows = numpy.frombuffer(records, dtype=dtype)
+    columns = {}
+    for field, _ in FIELDS:
+        column = rows[field]
+        if field in ("kind", "weapon", "enemy_weapon", "item"):
+            column = table[column]
+        columns[field] = numpy.ascontiguousarray(column).tobytes()
+    return columns
+
+
+def export(directory: str, output: str) -> int:
+    """Turn the segments of a log into one file per field.
+
+    The columns are appended segment by segment, so a log of any size is
+    exported with the memory of one segment. The name codes of all the
+    segments are mapped onto one table, written to names.json with the
+    types of the columns and the number of rows. The run of every event is
+    written to a column of its own.
+
+    Args:
+        directory (str): The directory of the segments.
+        output (str): The directory of the columns, created if needed.
+
+    Returns:
+        int: The number of events exported.
+    """
+    os.makedirs(output, exist_ok=True)
+    names: list[str] = []
+    codes: dict[str, int] = {}
+    fields = [("run", "Q")] + FIELDS
+    files = {field: open(os.path.join(output, f"{field}.bin"), "wb") for field, _ in fields}
+    rows = 0
+    try:
+        for path in _segments(directory):
+            segment_names, run, records = read_segment(path)
+            remap = [codes.setdefault(name, len(codes)) for name in segment_names]
+            if len(codes) >= MISSING:
+                raise ValueError("The segments hold more than 255 names together.")
+            names = list(codes)
+            remap += [MISSING] * (MISSING + 1 - len(remap))
+            count = len(records) // RECORD.size
+            files["run"].write(struct.pack("<Q", run) * count)
+            for field, column in _columns(records, remap).items():
+                files[field].write(column)
+            rows += count
+    finally:
+        for file in files.values():
+            file.close()
+    meta = {
+        "version": VERSION,
+        "rows": rows,
+        "names": names,
+        "missing": MISSING,
+        "fields": {field: "<" + code for field, code in fields},
+    }
+    with open(os.path.join(output, "names.json"), "w", encoding="utf-8") as file:
+        json.dump(meta, file, indent=2)
+    return rows
+
+
+def stats(output: str) -> dict[str, object]:
+    """Aggregate exported columns: events by kind and fights by weapons.
+
+    Args:
+        output (str): The directory of the columns.
+
+    Returns:
+        dict[str, object]: The number of events of every kind, and the
+            fights won and lost for every pair of the player's and the
+            enemy's weapons.
+    """
+    import numpy
+
+    with open(os.path.join(output, "names.json"), encoding="utf-8") as file:
+        meta = json.load(file)
+    names = meta["names"] + ["?"] * (MISSING + 1 - len(meta["names"]))
+
+    def column(field: str) -> numpy.ndarray:
+        return numpy.memmap(
+            os.path.join(output, f"{field}.bin"), dtype=meta["fields"][field], mode="r"
+        )
+
+    kind = column("kind")
+    counts = numpy.bincount(kind, minlength=MISSING + 1)
+    by_kind = {names[code]: int(count) for code, count in enumerate(counts) if count}
+    fights: dict[str, dict[str, int]] = {}
+    weapon, enemy_weapon = column("weapon"), column("enemy_weapon")
+    for outcome in (FIGHT_WON, FIGHT_LOST):
+        if outcome not in names:
+            continue
+        chosen = kind == names.index(outcome)
+        pairs = weapon[chosen].astype(numpy.int64) * 256 + enemy_weapon[chosen]
+        values, amounts = numpy.unique(pairs, return_counts=True)
+        for pair, amount in zip(values.tolist(), amounts.tolist()):
+            key = f"{names[pair // 256]} vs {names[pair % 256]}"
+            fights.setdefault(key, {})[outcome] = amount
+    return {"events": meta["rows"], "by_kind": by_kind, "fights": fights}
+
+
+def bench(events: int = 1_000_000, sessions: int = 1000) -> dict[str, float]:
+    """Log and export events of simulated sessions in a temporary directory.
+
+    Args:
+        events (int): The number of events.
+        sessions (int): The number of sessions they are spread over.
+
+    Returns:
+        dict[str, float]: The events per second of logging and of exporting,
+            the bytes per event and the numbers of segments and writes.
+    """
+    sample = [
+        [Event(ENTERED, "", room_id=(3, 4)), Event(MOVED, room_id=(3, 4))],
+        [Event(ENEMY, "", room_id=(5, 1))],
+        [Event(FIGHT_WON, "", room_id=(5, 1), weapon="cat", enemy_weapon="milk")],
+        [Event(PICKED_UP, "", item="milk")],
+        [Event(DENIED, "", room_id=(9, 9))],
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        logs = os.path.join(directory, "logs")
+        log = EventLog(logs, max_bytes=16 << 20)
+        began = time.perf_counter()
+        logged = 0
+        i = 0
+        while logged < events:
+            batch = sample[i % len(sample)]
+            log.append(i % sessions, batch)
+            logged += len(batch)
+            i += 1
+        log.close()
+        logging = time.perf_counter() - began
+        size = sum(os.path.getsize(path) for path in _segments(logs))
+        began = time.perf_counter()
+        rows = export(logs, os.path.join(directory, "columns"))
+        exporting = time.perf_counter() - began
+    return {
+        "log_events_per_sec": logged / logging,
+        "export_events_per_sec": rows / exporting,
+        "bytes_per_event": size / logged,
+        "segments": log.segments,
+        "writes": log.writes,
+    }
+
+
+def main() -> None:
+    """Export or aggregate a log from the command line."""
+    parser = argparse.ArgumentParser(description="Export and aggregate event logs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    exporting = commands.add_parser("export", help="turn a log into columns")
+    exporting.add_argument("log")
+    exporting.add_argument("output")
+    aggregating = commands.add_parser("stats", help="aggregate exported columns")
+    aggregating.add_argument("output")
+    benchmarking = commands.add_parser("bench", help="measure logging and exporting")
+    benchmarking.add_argument("--events", type=int, default=1_000_000)
+    args = parser.parse_args()
+    if args.command == "export":
+        print(f"{export(args.log, args.output)} events exported.")
+    elif args.command == "stats":
+        print(json.dumps(stats(args.output), indent=2))
+    else:
+        for name, value in bench(args.events).items():
+            print(f"{name}: {value:.1f}")
+
+
+if __name__ == "__main__":
+    main()
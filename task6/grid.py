@@ -0,0 +1,336 @@
+"""A map of any size backed by flat typed arrays.
+
+A cell stores only ids: the kind of the room, the character and the item,
+which index into small tables of templates, and a bit in the defeated and
+picked up bitmaps. Which rooms are cleared is kept by the player.
+Neighbours are computed from the coordinates. Room objects are created
+lazily, only when a cell is inspected.
+
+classes:
+    Grid
+
+functions:
+    copy_character
+    copy_item
+"""
+from __future__ import annotations
+
+from array import array
+
+from assets import Bitmap, Character, EndRoom, Enemy, Item, Room, Weapon
+
+CHANGE = {"north": (0, -1), "south": (0, 1), "east": (-1, 0), "west": (1, 0)}
+
+NONE = -1
+
+
+def copy_character(character: Character) -> Character:
+    """Copy a character template, so that it can be defeated on its own.
+
+    Args:
+        character (Character): The template.
+
+    Returns:
+        Character: The copy, or the template itself if it has no state.
+    """
+    if isinstance(character, Enemy):
+        return Enemy(character.name, character.weapon)
+    return character
+
+
+def copy_item(item: Item) -> Item:
+    """Copy an item template, so that it can be picked up on its own.
+
+    Args:
+        item (Item): The template.
+
+    Returns:
+        Item: The copy.
+    """
+    if isinstance(item, Weapon):
+        return Weapon(item.name, item.can_kill)
+    return Item(item.name)
+
+
+class Grid:
+    """A width x height map of rooms backed by flat arrays.
+
+    Attributes:
+        width (int): The number of columns.
+        height (int): The number of rows.
+        room_kinds (list[tuple[str, str]]): The names and descriptions of rooms.
+        characters (list[Character]): The character templates.
+        items (list[Item]): The item templates.
+        kind_ids (array): The room kind id of every cell.
+        character_ids (array): The character id of every cell, -1 if none.
+        item_ids (array): The item id of every cell, -1 if none.
+        defeated (Bitmap): The cells where the enemy has been defeated.
+        picked_up (Bitmap): The cells where the item has been picked up.
+        end (int): The index of the end room cell.
+        cleared_rooms_needed (int): The number of rooms to clear to enter the end room.
+
+    Methods:
+        index: Get the index of a cell.
+        position: Get the coordinates of a cell.
+        in_bounds: Check if the coordinates are on the map.
+        neighbours: Get the neighbouring cells.
+        add_kind: Register a room kind.
+        add_character: Register a character template.
+        add_item: Register an item template.
+        place: Fill a cell.
+        character: Get the character template of a cell.
+        item: Get the item template of a cell.
+        defeat: Mark the enemy of a cell as defeated.
+        revive: Bring the defeated enemy of a cell back.
+        move_character: Move a character to an empty cell.
+        pick_up: Mark the item of a cell as picked up.
+        room: Get a room view of a cell.
+        fork: Copy the grid cheaply.
+    """
+
+    def __init__(self, width: int, height: int) -> None:
+        size = width * height
+        self.width: int = width
+        self.height: int = height
+        self.room_kinds: list[tuple[str, str]] = []
+        self.characters: list[Character] = []
+        self.items: list[Item] = []
+        self.kind_ids = array("H", bytes(2 * size))
+        self.character_ids = array("i", [NONE]) * size
+        self.item_ids = array("i", [NONE]) * size
+        self.defeated = Bitmap(size)
+        self.picked_up = Bitmap(size)
+        self.end: int = size - 1
+        self.cleared_rooms_needed: int = size - 1
+        self._views: dict[int, Room] = {}
+        # Whether character_ids is not shared with a fork, see move_character.
+        self._owns_characters: bool = True
+
+    def __len__(self) -> int:
+        return self.width * self.height
+
+    def index(self, x: int, y: int) -> int:
+        """Get the index of a cell.
+
+        Args:
+            x (int): The column.
+            y (int): The row.
+
+        Returns:
+            int: The index of the cell in the arrays.
+        """
+        return y * self.width + x
+
+    def position(self, index: int) -> tuple[int, int]:
+        """Get the coordinates of a cell.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            tuple[int, int]: The column and the row.
+        """
+        y, x = divmod(index, self.width)
+        return x, y
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        """Check if the coordinates are on the map.
+
+        Args:
+            x (int): The column.
+            y (int): The row.
+
+        Returns:
+            bool: True if there is a cell, False otherwise.
+        """
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def neighbours(self, x: int, y: int) -> dict[str, tuple[int, int]]:
+        """Get the neighbouring cells.
+
+        Args:
+            x (int): The column.
+            y (int): The row.
+
+        Returns:
+            dict[str, tuple[int, int]]: The coordinates of the cell in each direction.
+        """
+        return {
+            direction: (x + dx, y + dy)
+            for direction, (dx, dy) in CHANGE.items()
+            if 0 <= x + dx < self.width and 0 <= y + dy < self.height
+        }
+
+    def add_kind(self, name: str, description: str) -> int:
+        """Register a room kind.
+
+        Args:
+            name (str): The name of the room.
+            description (str): A description of the room.
+
+        Returns:
+            int: The id of the kind.
+        """
+        self.room_kinds.append((name, description))
+        return len(self.room_kinds) - 1
+
+    def add_character(self, character: Character) -> int:
+        """Register a character template.
+
+        Args:
+            character (Character): The template.
+
+        Returns:
+            int: The id of the character.
+        """
+        self.characters.append(character)
+        return len(self.characters) - 1
+
+    def add_item(self, item: Item) -> int:
+        """Register an item template.
+
+        Args:
+            item (Item): The template.
+
+        Returns:
+            int: The id of the item.
+        """
+        self.items.append(item)
+        return len(self.items) - 1
+
+    def place(
+        self, index: int, kind_id: int, character_id: int = NONE, item_id: int = NONE
+    ) -> None:
+        """Fill a cell.
+
+        Args:
+            index (int): The index of the cell.
+            kind_id (int): The id of the room kind.
+            character_id (int): The id of the character, -1 if none.
+            item_id (int): The id of the item, -1 if none.
+        """
+        self.kind_ids[index] = kind_id
+        self.character_ids[index] = character_id
+        self.item_ids[index] = item_id
+
+    def name(self, index: int) -> str:
+        """Get the name of the room in a cell."""
+        return self.room_kinds[self.kind_ids[index]][0]
+
+    def description(self, index: int) -> str:
+        """Get the description of the room in a cell."""
+        return self.room_kinds[self.kind_ids[index]][1]
+
+    def character(self, index: int) -> Character | None:
+        """Get the character template of a cell.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            Character | None: The template, None if there is no character.
+        """
+        character_id = self.character_ids[index]
+        return None if character_id == NONE else self.characters[character_id]
+
+    def item(self, index: int) -> Item | None:
+        """Get the item template of a cell.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            Item | None: The template, None if there is no item.
+        """
+        item_id = self.item_ids[index]
+        return None if item_id == NONE else self.items[item_id]
+
+    def defeat(self, index: int) -> None:
+        """Mark the enemy of a cell as defeated."""
+        self.defeated.set(index)
+        view = self._views.get(index)
+        if view is not None and isinstance(view.character, Enemy):
+            view.character.defeated = True
+
+    def revive(self, index: int) -> None:
+        """Bring the defeated enemy of a cell back."""
+        self.defeated.discard(index)
+        view = self._views.get(index)
+        if view is not None and isinstance(view.character, Enemy):
+            view.character.defeated = False
+
+    def move_character(self, source: int, target: int) -> None:
+        """Move a character to a cell without one.
+
+        Args:
+            source (int): The index of the cell of the character.
+            target (int): The index of the empty cell.
+        """
+        if not self._owns_characters:
+            # The ids are shared with a fork until one of them moves a character.
+            self.character_ids = array("i", self.character_ids)
+            self._owns_characters = True
+        self.character_ids[target] = self.character_ids[source]
+        self.character_ids[source] = NONE
+        self._views.pop(source, None)
+        self._views.pop(target, None)
+
+    def pick_up(self, index: int) -> None:
+        """Mark the item of a cell as picked up."""
+        self.picked_up.set(index)
+        view = self._views.get(index)
+        if view is not None and view.item is not None:
+            view.item.picked_up = True
+
+    def room(self, x: int, y: int) -> Room:
+        """Get a room view of a cell.
+
+        The view is created on the first call and reused afterwards, so the
+        same cell is always the same Room object.
+
+        Args:
+            x (int): The column.
+            y (int): The row.
+
+        Returns:
+            Room: The room in the cell.
+        """
+        index = self.index(x, y)
+        view = self._views.get(index)
+        if view is not None:
+            return view
+        name, description = self.room_kinds[self.kind_ids[index]]
+        if index == self.end:
+            view = EndRoom(name, description, self.cleared_rooms_needed)
+        else:
+            view = Room(name, description)
+        character = self.character(index)
+        if character is not None:
+            view.character = copy_character(character)
+            if isinstance(view.character, Enemy):
+                view.character.defeated = self.defeated.get(index)
+        item = self.item(index)
+        if item is not None:
+            view.item = copy_item(item)
+            view.item.picked_up = self.picked_up.get(index)
+        self._views[index] = view
+        return view
+
+    def fork(self) -> Grid:
+        """Copy the grid.
+
+        The tables and the arrays of the room kinds and the items, which do
+        not change during a game, are shared. The bitmaps and the character
+        ids, which change when characters move, are copied on write, and the
+        room views are created again when needed.
+
+        Returns:
+            Grid: The copy.
+        """
+        grid = Grid.__new__(Grid)
+        grid.__dict__.update(self.__dict__)
+        grid.defeated = self.defeated.copy()
+        grid.picked_up = self.picked_up.copy()
+        grid._views = {}
+        grid._owns_characters = self._owns_characters = False
+        return grid
@@ -0,0 +1,183 @@
+"""A load generator for the game server.
+
+Opens many sessions at once, sends random commands and reports the command
+latency and how many such sessions one core of the server can host.
+
+Usage:
+    python server.py &
+    python loadgen.py --sessions 1000 --commands 100
+
+functions:
+    run_session
+    run_load
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from random import Random
+
+from engine import CHANGE
+from server import END
+
+
+async def _request(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, line: str
+) -> list[str]:
+    """Send a command and read the event lines of the response."""
+    writer.write(line.encode() + b"\n")
+    await writer.drain()
+    return await _response(reader)
+
+
+async def _response(reader: asyncio.StreamReader) -> list[str]:
+    """Read the event lines up to the end of a response."""
+    lines = []
+    while True:
+        line = (await reader.readline()).decode()
+        if not line:
+            raise ConnectionError("The server closed the session.")
+        if line.rstrip("\n") == END:
+            return lines
+        lines.append(line)
+
+
+async def run_session(
+    host: str, port: int, commands: int, seed: int, latencies: list[float]
+) -> int:
+    """Play a session with random moves, declining every fight.
+
+    Args:
+        host (str): The server address.
+        port (int): The server port.
+        commands (int): The number of commands to send.
+        seed (int): The seed of the random moves.
+        latencies (list[float]): The list to add the command latencies to.
+
+    Returns:
+        int: The number of commands that got a response.
+    """
+    rng = Random(seed)
+    directions = list(CHANGE)
+    reader, writer = await asyncio.open_connection(host, port)
+    done = 0
+    try:
+        if (await _response(reader))[0].startswith("full"):
+            return 0
+        command = f"move {rng.choice(directions)}"
+        for _ in range(commands):
+            began = time.perf_counter()
+            events = await _request(reader, writer, command)
+            latencies.append(time.perf_counter() - began)
+            done += 1
+            if any(event.startswith("enemy") for event in events):
+                command = "decline"
+            else:
+                command = f"move {rng.choice(directions)}"
+        writer.write(b"quit\n")
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+    return done
+
+
+async def _server_cpu(host: str, port: int) -> float:
+    """Ask the server how much CPU time it has used."""
+    reader, writer = await asyncio.open_connection(host, port)
+    await _response(reader)
+    (line,) = await _request(reader, writer, "stats")
+    writer.close()
+    return float(line.split("cpu=")[1])
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    """Get a percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run_load(
+    host: str, port: int, sessions: int, commands: int, seed: int = 0
+) -> dict[str, float]:
+    """Run many sessions at once and measure them.
+
+    Args:
+        host (str): The server address.
+        port (int): The server port.
+        sessions (int): The number of sessions open at once.
+        commands (int): The number of commands per session.
+        seed (int): The seed of the first session.
+
+    Returns:
+        dict[str, float]: The latency percentiles and the throughput.
+    """
+    latencies: list[float] = []
+    cpu_before = await _server_cpu(host, port)
+    began = time.perf_counter()
+    done = await asyncio.gather(
+        *(run_session(host, port, commands, seed + i, latencies) for i in range(sessions))
+    )
+    elapsed = time.perf_counter() - began
+    cpu = await _server_cpu(host, port) - cpu_before
+    latencies.sort()
+    return {
+        "sessions": sessions,
+        "commands": sum(done),
+        "seconds": elapsed,
+        "commands_per_sec": sum(done) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 0.5) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "server_cpu_seconds": cpu,
+        "sessions_per_core": sessions * elapsed / cpu if cpu else 0.0,
+    }
+
+
+async def _spawn_and_run(args: argparse.Namespace) -> dict[str, float]:
+    """Start a server in a subprocess, load it and stop it."""
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+        "--port",
+        str(args.port),
+        "--max-sessions",
+        str(args.sessions + 1),
+        stdout=asyncio.subprocess.PIPE,
+    )
+    assert process.stdout is not None
+    await process.stdout.readline()
+    try:
+        return await run_load(args.host, args.port, args.sessions, args.commands, args.seed)
+    finally:
+        process.terminate()
+        await process.wait()
+
+
+def main() -> None:
+    """Run the load generator from the command line."""
+    parser = argparse.ArgumentParser(description="Load the game server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--commands", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--spawn", action="store_true", help="start a server in a subprocess"
+    )
+    args = parser.parse_args()
+    if args.spawn:
+        stats = asyncio.run(_spawn_and_run(args))
+    else:
+        stats = asyncio.run(
+            run_load(args.host, args.port, args.sessions, args.commands, args.seed)
+        )
+    for name, value in stats.items():
+        print(f"{name}: {value:.4g}" if isinstance(value, float) else f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,101 +7,196 @@ classes:
     Map
     Game
 """
-from random import shuffle
+from __future__ import annotations
 
-from assets import EndRoom, Enemy, Friend, Item, Player, Room, Weapon
+import argparse
+import sys
+from random import Random
+from typing import TYPE_CHECKING
 
-CHANGE = {"north": (0, -1), "south": (0, 1), "east": (-1, 0), "west": (1, 0)}
+from assets import Enemy, Friend, Item, Player, Weapon
+from engine import ENEMY, FIGHT_LOST, MOVED, WON, Engine, Event
+from eventlog import EventLog, log_events
+from grid import NONE, Grid
+from metrics import Metrics, SamplingProfiler, instrument
+from recorder import Recorder
+from renderer import Renderer
+
+if TYPE_CHECKING:
+    from autosave import Autosaver
+    from chunks import ChunkedWorld
+
+# The shuffles of the rooms tried before a map is given up as unwinnable.
+SHUFFLES = 1000
 
 
 class Map:
     """A map of the game.
 
     Attributes:
-        rooms (list[list[Room]]): A 2D list of rooms.
+        rooms (Grid | ChunkedWorld): The rooms.
         player (Player): The player character.
         starting_room (Room): The starting room.
+        engine (Engine): The I/O-free rules of the game.
+        autosave (Autosaver | None): Where the game is saved after each move.
+        slot (int): The slot of the game in the autosave file.
 
     Methods:
         enter_room: Enter a room.
         move: Move to a neighbouring room.
     """
 
-    def __init__(self, player: Player) -> None:
+    def __init__(
+        self,
+        player: Player,
+        rng: Random | None = None,
+        width: int = 3,
+        height: int = 3,
+        autosave: Autosaver | None = None,
+        slot: int = 0,
+    ) -> None:
         """Initialize the map.
 
         Args:
             player (Player): The player character.
+            rng (Random | None): The random generator to shuffle the rooms with.
+                A new unseeded one is used if not given.
+            width (int): The number of columns.
+            height (int): The number of rows.
+            autosave (Autosaver | None): Where to save the game after each move.
+            slot (int): The slot of the game in the autosave file.
+
+        Raises:
+            ValueError: If the map is smaller than 2x2, or none of SHUFFLES
+                shuffles of its rooms could be won.
         """
-        self.rooms: list[list[Room]] = [[] for _ in range(3)]
-        self.player = player
-        self.starting_room = Room(
+        if width < 2 or height < 2:
+            raise ValueError("The map must be at least 2x2.")
+        rng = rng or Random()
+        grid = Grid(width, height)
+        starting_room = grid.add_kind(
             "Starting Room",
             "You are in the starting room. \
 A mosquitto is saying that you should not have drunk the milk.",
         )
-        self.starting_room.item = Weapon("mosquitto", "cat")
-        self.starting_room.item.picked_up = True
-        self.player.weapons.append(self.starting_room.item)
-        self.rooms[0].append(self.starting_room)
-        room = Room("Room.", "Just a room. Oh look! A cat! It says his name is Mykola")
-        room.item = Weapon("cat", "milk")
-        white_room = Room(
-            "A white room",
-            "There is a milk that you drank. You can offer it to a cat in the future.",
+        grid.place(0, starting_room, item_id=grid.add_item(Weapon("mosquitto", "cat")))
+        grid.pick_up(0)
+        room = (
+            grid.add_kind(
+                "Room.", "Just a room. Oh look! A cat! It says his name is Mykola"
+            ),
+            NONE,
+            grid.add_item(Weapon("cat", "milk")),
+        )
+        white_room = (
+            grid.add_kind(
+                "A white room",
+                "There is a milk that you drank. You can offer it to a cat in the future.",
+            ),
+            NONE,
+            grid.add_item(Weapon("milk", "mosquitto")),
         )
-        white_room.item = Weapon("milk", "mosquitto")
         weapon_rooms = [room, white_room]
-        shuffle(weapon_rooms)
-        self.rooms[1].append(weapon_rooms[0])
-        other_rooms = [
-            Room("A bloody red room", "A bloody room. Ouch, something bit me."),
-            Room("A completely empty room", ""),
-            Room(
-                "A cave",
-                "A dark cave. You can hear a HUUGE cat meowing. It wants to eat you.",
+        enemy_rooms = [
+            (
+                grid.add_kind("A bloody red room", "A bloody room. Ouch, something bit me."),
+                grid.add_character(Enemy("A blood master", Weapon("mosquitto"))),
+                NONE,
             ),
-            Room(
-                "A smelly room",
-                "A smelly room. You can smell a mouse.",
+            (grid.add_kind("A completely empty room", ""), NONE, NONE),
+            (
+                grid.add_kind(
+                    "A cave",
+                    "A dark cave. You can hear a HUUGE cat meowing. It wants to eat you.",
+                ),
+                grid.add_character(Enemy("An old babusia with a cat", Weapon("cat"))),
+                NONE,
             ),
-            Room(
-                "A white room",
-                "A white room. There is a cat. Oh, no cat... \
+            (
+                grid.add_kind(
+                    "A smelly room",
+                    "A smelly room. You can smell a mouse.",
+                ),
+                grid.add_character(
+                    Friend(
+                        "A friendly looking mouse. Not suspicious at all",
+                        "Hello, my fellow friend, how are you doing? It is a great pleasure to \
+meet you. I'm totally not suspicious so go to the next room, quickly!",
+                    )
+                ),
+                NONE,
+            ),
+            (
+                grid.add_kind(
+                    "A white room",
+                    "A white room. There is a cat. Oh, no cat... \
 This white substance drives you crazy.",
+                ),
+                grid.add_character(Enemy("Milk", Weapon("milk"))),
+                NONE,
             ),
-            weapon_rooms[1]
         ]
-        end_room = EndRoom("The last room.", "Here is a cake", 8)
-        other_rooms[0].set_character(Enemy("A blood master", Weapon("mosquitto")))
-        other_rooms[2].set_character(Enemy("An old babusia with a cat", Weapon("cat")))
-        other_rooms[3].set_character(
-            Friend(
-                "A friendly looking mouse. Not suspicious at all",
-                "Hello, my fellow friend, how are you doing? It is a great pleasure to \
-meet you. I'm totally not suspicious so go to the next room, quickly!",
-            )
+        grid.place(
+            grid.end,
+            grid.add_kind("The last room.", "Here is a cake"),
+            item_id=grid.add_item(Item("cake")),
         )
-        other_rooms[4].set_character(Enemy("Milk", Weapon("milk")))
-        end_room.item = Item("cake")
-        shuffle(other_rooms)
-        self.rooms[0] += other_rooms[0:2]
-        self.rooms[1] += other_rooms[2:4]
-        self.rooms[2] += other_rooms[4:]
-        self.rooms[2].append(end_room)
-        for i in range(3):
-            for j in range(3):
-                if j < 2:
-                    self.rooms[i][j].add_neighbour("south", self.rooms[i][j + 1])
-                if j > 0:
-                    self.rooms[i][j].add_neighbour("north", self.rooms[i][j - 1])
-                if i < 2:
-                    self.rooms[i][j].add_neighbour("west", self.rooms[i + 1][j])
-                if i > 0:
-                    self.rooms[i][j].add_neighbour("east", self.rooms[i - 1][j])
+        free = [index for index in range(1, grid.end) if index != grid.index(0, 1)]
+        self._start(grid, player, autosave, slot)
+        # Imported here because the solver builds its maps with this class.
+        from solver import solvable
+
+        # A shuffle can lock the only weapon of a kind behind the enemies it
+        # beats, so the rooms are shuffled again until the map can be won.
+        for _ in range(SHUFFLES):
+            rng.shuffle(weapon_rooms)
+            grid.place(grid.index(0, 1), *weapon_rooms[0])
+            if len(free) > 6:
+                kinds = enemy_rooms + [weapon_rooms[1], weapon_rooms[0]]
+            elif len(free) == 6:
+                kinds = enemy_rooms + [weapon_rooms[1]]
+            else:
+                # Too few rooms for every enemy: the second weapon comes first,
+                # as without it the enemies that are left cannot all be beaten.
+                kinds = [weapon_rooms[1]] + enemy_rooms[: len(free) - 1]
+            other_rooms = [kinds[i % len(kinds)] for i in range(len(free))]
+            rng.shuffle(other_rooms)
+            for index, other_room in zip(free, other_rooms):
+                grid.place(index, *other_room)
+            if solvable(self.engine):
+                return
+        raise ValueError(f"No shuffle of a {width}x{height} map could be won.")
+
+    def _start(
+        self,
+        rooms: Grid | ChunkedWorld,
+        player: Player,
+        autosave: Autosaver | None = None,
+        slot: int = 0,
+    ) -> None:
+        """Give the player the weapon of the starting room and create the engine.
+
+        Maps that build their rooms in another way call this instead of
+        __init__, once the starting room is in place.
+
+        Args:
+            rooms (Grid | ChunkedWorld): The rooms, with a weapon in the
+                starting room.
+            player (Player): The player character.
+            autosave (Autosaver | None): Where to save the game after each move.
+            slot (int): The slot of the game in the autosave file.
+        """
+        self.rooms = rooms
+        self.player = player
+        self.starting_room = rooms.room(0, 0)
+        assert isinstance(self.starting_room.item, Weapon)
+        self.player.weapons.append(self.starting_room.item)
+        self.engine = Engine(rooms, player)
+        self.autosave = autosave
+        self.slot = slot
 
     def enter_room(self, room_id: tuple[int, int]) -> bool:
-        """Enter a room.
+        """Enter a room, asking the player about fights in the terminal.
 
         Args:
             room_id (tuple[int, int]): The room's id.
@@ -109,48 +204,11 @@ meet you. I'm totally not suspicious so go to the next room, quickly!",
         Returns:
             bool: True if the room was entered, False otherwise.
         """
-        if room_id[0] > 2 or room_id[1] > 2 or room_id[0] < 0 or room_id[1] < 0:
-            print("You can't go there.")
-            print(room_id)
-            return False
-        room = self.rooms[room_id[1]][room_id[0]]
-        print(f"You are entering {room.name}.")
-        print(room.description)
-        if isinstance(room, EndRoom):
-            if room.can_enter(self.player):
-                if room not in self.player.cleared_rooms:
-                    self.player.clear_room(room)
-            else:
-                print("You can't go there. You need to clear all the rooms first.")
-                return False
-        character = room.character
-        if character and isinstance(character, Enemy) and not character.defeated:
-            print(f"There is a {character.name} in the room.")
-            to_fight = input("Do you want to fight? (y/n) ")
-            if to_fight == "n":
-                return False
-            print("You can use the following weapons:")
-            for i, weapon in enumerate(self.player.weapons):
-                print(f"{i}. {weapon.name}")
-            weapon = input("What weapon do you want to use?\n")
-            if not weapon.isdigit() or not 0 <= int(weapon) < len(self.player.weapons):
-                print("Invalid weapon.")
-                return False
-            win = self.player.fight(character, int(weapon))
-            if not win:
-                exit()
-            character.defeated = True
-        elif room.character and isinstance(room.character, Friend):
-            print(room.character.dialogue)
-        if room not in self.player.cleared_rooms:
-            self.player.clear_room(room)
-        if room.item and not room.item.picked_up:
-            won = self.player.pick_up_item(room)
-            if won:
-                exit()
-            room.item.picked_up = True
-            print(f"You picked up {room.item.name}.")
-        return True
+        try:
+            return self.play(self.engine.enter(room_id))
+        finally:
+            if self.autosave is not None:
+                self.autosave.save(self.slot, self.engine)
 
     def move(self, direction: str) -> None:
         """Move in a direction.
@@ -158,21 +216,40 @@ meet you. I'm totally not suspicious so go to the next room, quickly!",
         Args:
             direction (str): The direction to move in.
         """
-        room = self.rooms[self.player.current_room[0]][self.player.current_room[1]]
-        if direction not in room.neighbours.keys():
-            print("You can't go there.")
-            return
-        self.player.current_room = (
-            self.player.current_room[0] + CHANGE[direction][0],
-            self.player.current_room[1] + CHANGE[direction][1],
-        )
-        result = self.enter_room(self.player.current_room)
-        if not result:
-            self.player.current_room = (
-                self.player.current_room[0] - CHANGE[direction][0],
-                self.player.current_room[1] - CHANGE[direction][1],
-            )
-            return
+        try:
+            self.play(self.engine.move(direction))
+        finally:
+            # play exits when the game ends, and the end is saved too.
+            if self.autosave is not None:
+                self.autosave.save(self.slot, self.engine)
+
+    def play(self, events: list[Event]) -> bool:
+        """Print the events and ask the player when the engine waits for a fight.
+
+        Args:
+            events (list[Event]): The events returned by the engine.
+
+        Returns:
+            bool: True if the player moved, False otherwise.
+        """
+        moved = False
+        for event in events:
+            if event.message:
+                print(event.message)
+            if event.kind in (FIGHT_LOST, WON):
+                exit()
+            if event.kind == MOVED:
+                moved = True
+            if event.kind == ENEMY:
+                to_fight = input("Do you want to fight? (y/n) ")
+                if to_fight == "n":
+                    return self.play(self.engine.decline())
+                print("You can use the following weapons:")
+                for i, weapon in enumerate(self.player.weapons):
+                    print(f"{i}. {weapon.name}")
+                weapon = input("What weapon do you want to use?\n")
+                return self.play(self.engine.fight(int(weapon) if weapon.isdigit() else -1))
+        return moved
 
 
 class Game:
@@ -180,48 +257,106 @@ class Game:
 
     Attributes:
         player (Player): The player.
+        seed (int | None): The seed the map was shuffled with, None if unknown.
+        record (str | None): The file to write the recording of the game to.
         map (Map): The map.
+        recorder (Recorder | None): The recording engine, None if the game
+            is not recorded.
 
     Methods:
         start: Start the game.
     """
 
-    def __init__(self) -> None:
-        """Initialize the game."""
+    def __init__(
+        self,
+        width: int = 3,
+        height: int = 3,
+        autosave: Autosaver | None = None,
+        slot: int = 0,
+        seed: int | None = None,
+        record: str | None = None,
+    ) -> None:
+        """Initialize the game.
+
+        Args:
+            width (int): The number of columns of the map.
+            height (int): The number of rows of the map.
+            autosave (Autosaver | None): Where to save the game after each move.
+            slot (int): The slot of the game in the autosave file.
+            seed (int | None): The seed to shuffle the map with, a random one
+                if not given.
+            record (str | None): The file to write the recording of the game to.
+        """
         self.player = Player("Abdul Ali Al-Ahmed")
-        self.map = Map(self.player)
+        self.seed = Random().getrandbits(64) if seed is None else seed
+        self.record = record
+        self.map = Map(
+            self.player, Random(self.seed), width, height, autosave=autosave, slot=slot
+        )
+        self.recorder: Recorder | None = None
+        if record is not None:
+            self.recorder = self.map.engine = Recorder(self.map.engine, self.seed)
 
     def start(self) -> None:
         """Start the game."""
+        renderer = Renderer(self.map.engine)
+        # Only a terminal can keep the map in place and redraw what changed.
+        draw = renderer.update if sys.stdout.isatty() else renderer.render
+        draw()
         print("You are Abdul Ali Al-Ahmed.")
         print("You are in a dungeon.")
         print("You need to find a cake.")
         print("You have a friendly mosquitto to help in fight.")
         print("Good luck!")
-        self.player.clear_room(self.map.rooms[0][0])
         print(self.map.starting_room.description)
-        while True:
-            print()
-            for i, room_line in enumerate(self.map.rooms):
-                for j, room in enumerate(room_line):
-                    if (j, i) == self.player.current_room:
-                        print("♙", end=" ")
-                    elif room in self.player.cleared_rooms:
-                        print("X", end=" ")
-                    else:
-                        print("O", end=" ")
-                print()
-            print()
-            print("You can go to the following directions:")
-            room = self.map.rooms[self.player.current_room[0]][
-                self.player.current_room[1]
-            ]
-            for direction in room.neighbours:
-                print(f"- {direction}")
-            direction = input("Where do you want to go?\n")
-            self.map.move(direction)
+        try:
+            while True:
+                direction = input("Where do you want to go?\n")
+                self.map.move(direction)
+                draw()
+        finally:
+            renderer.close()
+            # The recorder may be wrapped by the metrics or the event log.
+            if self.recorder is not None and self.record is not None:
+                self.recorder.save(self.record)
+
+
+def main() -> None:
+    """Play the game in the terminal."""
+    parser = argparse.ArgumentParser(description="Play the game.")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--record", metavar="PATH", help="write a recording of the game")
+    parser.add_argument("--metrics", metavar="PATH", help="write the metrics of the game")
+    parser.add_argument("--profile", metavar="PATH", help="write sampled stacks of the game")
+    parser.add_argument("--log", metavar="DIR", help="append the events of the game to a log")
+    args = parser.parse_args()
+    game = Game(seed=args.seed, record=args.record)
+    log = EventLog(args.log) if args.log else None
+    if log is not None:
+        log_events(game.map, log)
+    if not (args.metrics or args.profile):
+        try:
+            game.start()
+        finally:
+            if log is not None:
+                log.close()
+        return
+    measured = Metrics()
+    profiler = SamplingProfiler() if args.profile else None
+    instrument(game.map, measured, profiler)
+    if profiler is not None:
+        profiler.start()
+    try:
+        game.start()
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.write(args.profile)
+        if args.metrics:
+            measured.write(args.metrics)
+        if log is not None:
+            log.close()
 
 
 if __name__ == "__main__":
-    game = Game()
-    game.start()
+    main()
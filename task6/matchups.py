@@ -0,0 +1,138 @@
+"""Weapon rules compiled into small integer ids.
+
+Every weapon name gets an id. Who wins is a matrix indexed by the ids of
+the player's and the enemy's weapons, and so are the messages, which are
+stored once in a table. Simulations can resolve whole arrays of fights at
+once with NumPy, which is only needed for `Matchups.resolve`.
+
+classes:
+    Matchups
+
+functions:
+    compile_rules
+"""
+from __future__ import annotations
+
+from array import array
+from typing import TYPE_CHECKING, Iterable
+
+from assets import DEATH_MESSAGES, KILL_MESSAGES, Weapon
+
+if TYPE_CHECKING:
+    import numpy
+
+
+class Matchups:
+    """The compiled weapon rules.
+
+    Attributes:
+        names (list[str]): The weapon names, indexed by their ids.
+        ids (dict[str, int]): The weapon ids by their names.
+        outcomes (bytearray): 1 where the player's weapon wins, indexed by
+            player id * number of weapons + enemy id.
+        messages (list[str]): The messages of the fights.
+        message_ids (array): The message id of every pair, indexed like outcomes.
+
+    Methods:
+        wins: Check if a weapon wins against an enemy's weapon.
+        message: Get the message of a fight.
+        resolve: Resolve arrays of fights at once.
+    """
+
+    def __init__(self, names: list[str]) -> None:
+        self.names: list[str] = names
+        self.ids: dict[str, int] = {name: i for i, name in enumerate(names)}
+        self.outcomes = bytearray(len(names) ** 2)
+        self.messages: list[str] = [""]
+        self.message_ids = array("H", bytes(2 * len(names) ** 2))
+
+    def wins(self, weapon: int, enemy_weapon: int) -> bool:
+        """Check if a weapon wins against an enemy's weapon.
+
+        Args:
+            weapon (int): The id of the player's weapon.
+            enemy_weapon (int): The id of the enemy's weapon.
+
+        Returns:
+            bool: True if the player wins, False otherwise.
+        """
+        return bool(self.outcomes[weapon * len(self.names) + enemy_weapon])
+
+    def message(self, weapon: int, enemy_weapon: int) -> str:
+        """Get the message of a fight.
+
+        Args:
+            weapon (int): The id of the player's weapon.
+            enemy_weapon (int): The id of the enemy's weapon.
+
+        Returns:
+            str: The message of winning or losing the fight.
+        """
+        return self.messages[self.message_ids[weapon * len(self.names) + enemy_weapon]]
+
+    def resolve(
+        self, weapons: numpy.ndarray, enemy_weapons: numpy.ndarray
+    ) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """Resolve arrays of fights at once.
+
+        Args:
+            weapons (numpy.ndarray): The ids of the player's weapons.
+            enemy_weapons (numpy.ndarray): The ids of the enemies' weapons.
+
+        Returns:
+            tuple[numpy.ndarray, numpy.ndarray]: Whether the player wins each
+                fight, and the ids of the messages in the messages table.
+        """
+        import numpy
+
+        size = len(self.names)
+        outcomes = numpy.frombuffer(bytes(self.outcomes), dtype=numpy.uint8)
+        message_ids = numpy.frombuffer(self.message_ids.tobytes(), dtype=numpy.uint16)
+        pairs = numpy.asarray(weapons, dtype=numpy.intp) * size + numpy.asarray(
+            enemy_weapons, dtype=numpy.intp
+        )
+        return outcomes[pairs].astype(bool), message_ids[pairs]
+
+
+def compile_rules(weapons: Iterable[Weapon]) -> Matchups:
+    """Compile the weapon rules.
+
+    A weapon wins against the enemy's weapon it can kill. The messages come
+    from KILL_MESSAGES and DEATH_MESSAGES.
+
+    Args:
+        weapons (Iterable[Weapon]): The weapons whose can_kill is the rule.
+            Weapons without can_kill only add their name.
+
+    Returns:
+        Matchups: The compiled rules.
+    """
+    weapons = list(weapons)
+    names: list[str] = []
+    for weapon in weapons:
+        for name in (weapon.name, weapon.can_kill):
+            if name and name not in names:
+                names.append(name)
+    matchups = Matchups(names)
+    size = len(names)
+    message_ids: dict[str, int] = {"": 0}
+
+    def add_message(message: str) -> int:
+        if message not in message_ids:
+            message_ids[message] = len(matchups.messages)
+            matchups.messages.append(message)
+        return message_ids[message]
+
+    for weapon in weapons:
+        if weapon.can_kill:
+            pair = matchups.ids[weapon.name] * size + matchups.ids[weapon.can_kill]
+            matchups.outcomes[pair] = 1
+    for name in names:
+        for enemy_name in names:
+            pair = matchups.ids[name] * size + matchups.ids[enemy_name]
+            if matchups.outcomes[pair]:
+                message = KILL_MESSAGES.get(enemy_name, "")
+            else:
+                message = DEATH_MESSAGES.get(f"{name}-{enemy_name}", "")
+            matchups.message_ids[pair] = add_message(message)
+    return matchups
@@ -0,0 +1,343 @@
+"""Opt-in instrumentation of games.
+
+A game is instrumented by wrapping its engine into an Instrumented
+engine, which times every command into a latency histogram and counts
+what happened. A game that is not wrapped runs exactly as before, so the
+instrumentation costs nothing when it is off.
+
+The metrics are exported in the Prometheus text format, to a file or on
+a local HTTP endpoint. A SamplingProfiler can additionally sample the
+stacks of the thread while it moves, enters rooms and fights.
+
+classes:
+    Metrics
+    Instrumented
+    SamplingProfiler
+
+functions:
+    instrument
+"""
+from __future__ import annotations
+
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING
+
+from engine import DENIED, FIGHT_LOST, FIGHT_WON, PICKED_UP, REJECTED, Engine, Event
+
+if TYPE_CHECKING:
+    from main import Map
+
+# The upper bounds of the latency buckets in seconds, from 1 us to 100 ms.
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2, 1e-1)
+
+COUNTERS = {
+    "moves_rejected": "Moves into a wall or after the game was over.",
+    "fights_rejected": "Fights and declines with no enemy waiting or after the game was over.",
+    "fights_won": "Fights the player won.",
+    "fights_lost": "Fights the player lost.",
+    "items_picked_up": "Items the player picked up.",
+    "end_room_denials": "Times the end room was entered before all the rooms were cleared.",
+}
+
+_COUNTED = {
+    FIGHT_WON: "fights_won",
+    FIGHT_LOST: "fights_lost",
+    PICKED_UP: "items_picked_up",
+    DENIED: "end_room_denials",
+}
+# The counters of the events of moves and of fights, which differ in what
+# a rejected command is.
+_MOVE_COUNTED = {**_COUNTED, REJECTED: "moves_rejected"}
+_FIGHT_COUNTED = {**_COUNTED, REJECTED: "fights_rejected"}
+
+
+class Metrics:
+    """Latency histograms and counters of commands.
+
+    It is updated under a lock, so the HTTP thread of serve reads a
+    consistent copy while the game loop or the event loop of the server
+    counts.
+
+    Attributes:
+        counters (dict[str, int]): The counters, by the names in COUNTERS.
+        buckets (dict[str, list[int]]): The number of commands in each
+            latency bucket by command, with one more bucket for the slower ones.
+        sums (dict[str, float]): The total seconds spent by command.
+
+    Methods:
+        observe: Count a command and its latency.
+        count: Increase a counter.
+        to_prometheus: Export the metrics in the Prometheus text format.
+        write: Write the metrics to a file.
+        serve: Serve the metrics over HTTP.
+    """
+
+    def __init__(self) -> None:
+        self.counters: dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.buckets: dict[str, list[int]] = {}
+        self.sums: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, command: str, seconds: float) -> None:
+        """Count a command and its latency.
+
+        Args:
+            command (str): The name of the command.
+            seconds (float): How long it took.
+        """
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            buckets = self.buckets.get(command)
+            if buckets is None:
+                buckets = self.buckets[command] = [0] * (len(BUCKETS) + 1)
+                self.sums[command] = 0.0
+            buckets[bucket] += 1
+            self.sums[command] += seconds
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Increase a counter.
+
+        Args:
+            name (str): The name of the counter, one of COUNTERS.
+            amount (int): How much to add.
+        """
+        with self._lock:
+            self.counters[name] += amount
+
+    def to_prometheus(self) -> str:
+        """Export the metrics in the Prometheus text format.
+
+        Returns:
+            str: The metrics.
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {command: list(buckets) for command, buckets in self.buckets.items()}
+            sums = dict(self.sums)
+        lines = [
+            "# HELP game_command_seconds The latency of the game commands.",
+            "# TYPE game_command_seconds histogram",
+        ]
+        for command, buckets in sorted(histograms.items()):
+            total = 0
+            for bound, amount in zip(BUCKETS + (float("inf"),), buckets):
+                total += amount
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f'game_command_seconds_bucket{{command="{command}",le="{le}"}} {total}'
+                )
+            lines.append(f'game_command_seconds_sum{{command="{command}"}} {sums[command]!r}')
+            lines.append(f'game_command_seconds_count{{command="{command}"}} {total}')
+        for name, help_text in COUNTERS.items():
+            lines.append(f"# HELP game_{name}_total {help_text}")
+            lines.append(f"# TYPE game_{name}_total counter")
+            lines.append(f"game_{name}_total {counters[name]}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Write the metrics to a file, replacing it at once.
+
+        Args:
+            path (str): The file, for example for the textfile collector.
+        """
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(temporary, path)
+
+    def serve(self, port: int = 9100, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve the metrics on /metrics from a background thread.
+
+        Args:
+            port (int): The port to listen on, 0 for any free port.
+            host (str): The address to listen on.
+
+        Returns:
+            ThreadingHTTPServer: The server, to shut it down.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_: object) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+
+class SamplingProfiler:
+    """A profiler that samples the stack of a thread inside hooked calls.
+
+    A background thread wakes up every interval and, if the profiled
+    thread is inside a hooked call, records its stack. The hooks only
+    change a counter, so they cost little.
+
+    Attributes:
+        interval (float): The seconds between samples.
+        stacks (Counter): The number of samples of each stack, as
+            "file:function;file:function" from the outermost call.
+
+    Methods:
+        enter: Mark the start of a hooked call.
+        exit: Mark the end of a hooked call.
+        start: Start sampling.
+        stop: Stop sampling.
+        write: Write the stacks in the collapsed format of flame graphs.
+    """
+
+    def __init__(self, interval: float = 0.001) -> None:
+        self.interval: float = interval
+        self.stacks: Counter[str] = Counter()
+        self._inside: int = 0
+        self._thread_id: int | None = None
+        self._stopped = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+    def enter(self) -> None:
+        """Mark the start of a hooked call in the current thread."""
+        self._inside += 1
+
+    def exit(self) -> None:
+        """Mark the end of a hooked call."""
+        self._inside -= 1
+
+    def start(self) -> None:
+        """Start sampling the current thread."""
+        self._thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._sampler = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        """Stop sampling."""
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _run(self) -> None:
+        """Take samples until stopped."""
+        while not self._stopped.wait(self.interval):
+            if not self._inside:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def write(self, path: str) -> None:
+        """Write the stacks in the collapsed format of flame graphs.
+
+        Args:
+            path (str): The file.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, samples in self.stacks.most_common():
+                file.write(f"{stack} {samples}\n")
+
+
+class Instrumented:
+    """An engine that measures the commands it is given.
+
+    Everything else is passed through to the measured engine, so it can
+    be used wherever the engine is.
+
+    Attributes:
+        engine (Engine): The measured game.
+        metrics (Metrics): Where to record the measurements.
+        profiler (SamplingProfiler | None): The profiler to sample moves,
+            entering rooms and fights with.
+
+    Methods:
+        move: Move in a direction.
+        enter: Enter a room.
+        fight: Fight the pending enemy.
+        decline: Decline to fight the pending enemy.
+    """
+
+    def __init__(
+        self, engine: Engine, metrics: Metrics, profiler: SamplingProfiler | None = None
+    ) -> None:
+        self.engine = engine
+        self.metrics: Metrics = metrics
+        self.profiler: SamplingProfiler | None = profiler
+
+    def __getattr__(self, name: str) -> object:
+        return getattr(self.engine, name)
+
+    def _measure(
+        self, command: str, profiled: bool, counted: dict[str, str], call, *args: object
+    ) -> list[Event]:
+        """Run a command of the engine, timing it and counting its events."""
+        profiler = self.profiler if profiled else None
+        if profiler is not None:
+            profiler.enter()
+        began = time.perf_counter()
+        try:
+            events = call(*args)
+        finally:
+            elapsed = time.perf_counter() - began
+            if profiler is not None:
+                profiler.exit()
+        metrics = self.metrics
+        metrics.observe(command, elapsed)
+        for event in events:
+            counter = counted.get(event.kind)
+            if counter is not None:
+                metrics.count(counter)
+        return events
+
+    def move(self, direction: str) -> list[Event]:
+        """Move in a direction, see Engine.move."""
+        return self._measure("move", True, _MOVE_COUNTED, self.engine.move, direction)
+
+    def enter(self, room_id: tuple[int, int]) -> list[Event]:
+        """Enter a room, see Engine.enter."""
+        return self._measure("enter", True, _MOVE_COUNTED, self.engine.enter, room_id)
+
+    def fight(self, weapon_id: int) -> list[Event]:
+        """Fight the pending enemy, see Engine.fight."""
+        return self._measure("fight", True, _FIGHT_COUNTED, self.engine.fight, weapon_id)
+
+    def decline(self) -> list[Event]:
+        """Decline to fight the pending enemy, see Engine.decline."""
+        return self._measure("decline", False, _FIGHT_COUNTED, self.engine.decline)
+
+
+def instrument(
+    game_map: Map, metrics: Metrics, profiler: SamplingProfiler | None = None
+) -> Instrumented:
+    """Start measuring the commands of a map's game.
+
+    Args:
+        game_map (Map): The map whose engine to wrap.
+        metrics (Metrics): Where to record the measurements.
+        profiler (SamplingProfiler | None): The profiler to sample entering
+            rooms and fights with.
+
+    Returns:
+        Instrumented: The engine the map uses from now on.
+    """
+    engine = Instrumented(game_map.engine, metrics, profiler)
+    game_map.engine = engine
+    return engine
@@ -0,0 +1,167 @@
+"""Recording games to replay them later.
+
+A recording holds everything a game depends on: the seed its map was
+shuffled with, the size of the map and every command in order. It also
+holds the outcome and a CRC of all the events, so a replay can check that
+it went exactly the same way.
+
+Recordings are JSON files:
+
+    {"version": 1, "seed": 42, "width": 3, "height": 3,
+     "commands": [["move", "south"], ["fight", 0], ["decline", null]],
+     "outcome": {"finished": true, "won": false, "position": [0, 1],
+                 "cleared": 2, "weapons": ["mosquitto"], "events": 5,
+                 "digest": 123456789}}
+
+classes:
+    Recorder
+
+functions:
+    digest
+    outcome
+    load
+"""
+from __future__ import annotations
+
+import json
+import zlib
+
+from engine import Engine, Event
+
+VERSION = 1
+
+
+def digest(events: list[Event], crc: int = 0) -> int:
+    """Add events to a CRC of the events of a game.
+
+    Args:
+        events (list[Event]): The events of a command.
+        crc (int): The CRC of the events before.
+
+    Returns:
+        int: The CRC with the events.
+    """
+    for event in events:
+        crc = zlib.crc32(f"{event.kind}\0{event.message}\0".encode(), crc)
+    return crc
+
+
+def outcome(engine: Engine, events: int, crc: int) -> dict:
+    """Describe how a game ended up.
+
+    Args:
+        engine (Engine): The game.
+        events (int): The number of events of the game.
+        crc (int): The CRC of the events of the game.
+
+    Returns:
+        dict: The outcome of a recording.
+    """
+    return {
+        "finished": engine.finished,
+        "won": engine.won,
+        "position": list(engine.player.current_room),
+        "cleared": engine.player.cleared_count(),
+        "weapons": [weapon.name for weapon in engine.player.weapons],
+        "events": events,
+        "digest": crc,
+    }
+
+
+class Recorder:
+    """An engine that records the commands it is given.
+
+    Everything else is passed through to the recorded engine, so it can
+    be used wherever the engine is.
+
+    Attributes:
+        engine (Engine): The recorded game.
+        seed (int): The seed the map was shuffled with.
+        commands (list[list]): The commands and their arguments.
+        events (int): The number of events so far.
+        crc (int): The CRC of the events so far.
+
+    Methods:
+        move: Move in a direction.
+        enter: Enter a room.
+        fight: Fight the pending enemy.
+        decline: Decline to fight the pending enemy.
+        recording: Get the recording of the game so far.
+        save: Write the recording to a file.
+    """
+
+    def __init__(self, engine: Engine, seed: int) -> None:
+        self.engine: Engine = engine
+        self.seed: int = seed
+        self.commands: list[list] = []
+        self.events: int = 0
+        self.crc: int = 0
+
+    def __getattr__(self, name: str) -> object:
+        return getattr(self.engine, name)
+
+    def _record(self, command: str, argument: object, events: list[Event]) -> list[Event]:
+        """Record a command and the events it caused."""
+        self.commands.append([command, argument])
+        self.events += len(events)
+        self.crc = digest(events, self.crc)
+        return events
+
+    def move(self, direction: str) -> list[Event]:
+        """Move in a direction, see Engine.move."""
+        return self._record("move", direction, self.engine.move(direction))
+
+    def enter(self, room_id: tuple[int, int]) -> list[Event]:
+        """Enter a room, see Engine.enter."""
+        return self._record("enter", list(room_id), self.engine.enter(room_id))
+
+    def fight(self, weapon_id: int) -> list[Event]:
+        """Fight the pending enemy, see Engine.fight."""
+        return self._record("fight", weapon_id, self.engine.fight(weapon_id))
+
+    def decline(self) -> list[Event]:
+        """Decline to fight the pending enemy, see Engine.decline."""
+        return self._record("decline", None, self.engine.decline())
+
+    def recording(self) -> dict:
+        """Get the recording of the game so far.
+
+        Returns:
+            dict: The seed, the map size, the commands and the outcome.
+        """
+        return {
+            "version": VERSION,
+            "seed": self.seed,
+            "width": self.engine.grid.width,
+            "height": self.engine.grid.height,
+            "commands": self.commands,
+            "outcome": outcome(self.engine, self.events, self.crc),
+        }
+
+    def save(self, path: str) -> None:
+        """Write the recording to a file.
+
+        Args:
+            path (str): The file.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.recording(), file, separators=(",", ":"))
+
+
+def load(path: str) -> dict:
+    """Read a recording.
+
+    Args:
+        path (str): The file.
+
+    Raises:
+        ValueError: If the file is not a recording of this version.
+
+    Returns:
+        dict: The recording.
+    """
+    with open(path, encoding="utf-8") as file:
+        recording = json.load(file)
+    if recording.get("version") != VERSION:
+        raise ValueError(f"{path} is not a recording of version {VERSION}.")
+    return recording
@@ -0,0 +1,171 @@
+"""A buffered map renderer for the game loop.
+
+A frame is built in one string and written with a single call. In the
+incremental mode only the cells that changed since the last frame and the
+directions are written, with ANSI escape codes to move the cursor, and the
+lines below the map are made a scrolling region, so the text of the game
+scrolls under the map without moving it. Big maps are shown through a
+viewport that follows the player.
+
+classes:
+    Renderer
+"""
+from __future__ import annotations
+
+import shutil
+import sys
+from typing import TextIO
+
+from engine import Engine
+
+PLAYER = "♙"
+CLEARED = "X"
+UNCLEARED = "O"
+# The lines kept for the directions: the blank line, the title and one per direction.
+DIRECTION_LINES = 6
+
+
+class Renderer:
+    """Draws the map of a game.
+
+    Attributes:
+        engine (Engine): The game to draw.
+        stream (TextIO): Where to write the frames.
+        view_width (int): The number of columns of the viewport.
+        view_height (int): The number of rows of the viewport.
+        top (int): The terminal line of the first row of the map in the
+            incremental mode, counting from 1.
+        origin (tuple[int, int]): The map cell in the top left corner of the viewport.
+
+    Methods:
+        symbol: Get the symbol of a cell.
+        frame: Build the whole frame.
+        render: Write the whole frame.
+        update: Write only what changed since the last frame.
+        close: Give the whole terminal back to the text.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        stream: TextIO | None = None,
+        view_width: int | None = None,
+        view_height: int | None = None,
+        top: int = 1,
+    ) -> None:
+        columns, lines = shutil.get_terminal_size()
+        grid = engine.grid
+        self.engine: Engine = engine
+        self.stream: TextIO = stream or sys.stdout
+        self.view_width: int = min(grid.width, view_width or max(1, columns // 2))
+        self.view_height: int = min(grid.height, view_height or max(1, lines - 8))
+        self.top: int = top
+        self.origin: tuple[int, int] = (0, 0)
+        self._lines: int = lines
+        self._drawn: tuple[int, int] | None = None
+        self._directions: list[str] = []
+        self._scrolling: bool = False
+
+    def symbol(self, x: int, y: int) -> str:
+        """Get the symbol of a cell.
+
+        Args:
+            x (int): The column.
+            y (int): The row.
+
+        Returns:
+            str: The player, a cleared or an uncleared room.
+        """
+        player = self.engine.player
+        if (x, y) == player.current_room:
+            return PLAYER
+        if player.has_cleared(self.engine.grid.index(x, y)):
+            return CLEARED
+        return UNCLEARED
+
+    def _follow(self) -> bool:
+        """Move the viewport so that the player is in it.
+
+        Returns:
+            bool: True if the viewport moved, False otherwise.
+        """
+        x, y = self.engine.player.current_room
+        left, top = self.origin
+        grid = self.engine.grid
+        if left <= x < left + self.view_width and top <= y < top + self.view_height:
+            return False
+        left = min(max(0, x - self.view_width // 2), grid.width - self.view_width)
+        top = min(max(0, y - self.view_height // 2), grid.height - self.view_height)
+        self.origin = (left, top)
+        return True
+
+    def frame(self) -> str:
+        """Build the whole frame: the map in the viewport and the directions.
+
+        Returns:
+            str: The frame.
+        """
+        self._follow()
+        left, top = self.origin
+        parts = ["\n"]
+        for y in range(top, top + self.view_height):
+            for x in range(left, left + self.view_width):
+                parts.append(self.symbol(x, y))
+                parts.append(" ")
+            parts.append("\n")
+        parts.append("\nYou can go to the following directions:\n")
+        self._directions = self.engine.directions()
+        for direction in self._directions:
+            parts.append(f"- {direction}\n")
+        self._drawn = self.engine.player.current_room
+        return "".join(parts)
+
+    def render(self) -> None:
+        """Write the whole frame at once."""
+        self.stream.write(self.frame())
+        self.stream.flush()
+
+    def update(self) -> None:
+        """Write only the cells and the directions that changed since the last frame.
+
+        The first frame, and every frame after the viewport has moved, clears
+        the screen and is drawn whole, and makes the lines below it the
+        scrolling region, where the cursor is left for the text of the game.
+        The map stays at its place on the screen, starting at the line top.
+        """
+        if self._drawn is None or self._follow():
+            text = self.top + self.view_height + DIRECTION_LINES
+            parts = [f"\x1b[{self.top}H\x1b[J", self.frame()[1:]]
+            if text < self._lines:
+                parts.append(f"\x1b[{text};{self._lines}r\x1b[{text}H")
+                self._scrolling = True
+            self.stream.write("".join(parts))
+            self.stream.flush()
+            return
+        left, top = self.origin
+        parts = ["\x1b7"]
+        # A room is only cleared when the player enters it, so only the
+        # cell the player left and the one they are in can change.
+        for x, y in {self._drawn, self.engine.player.current_room}:
+            row = self.top + y - top
+            column = 2 * (x - left) + 1
+            parts.append(f"\x1b[{row};{column}H{self.symbol(x, y)}")
+        directions = self.engine.directions()
+        if directions != self._directions:
+            row = self.top + self.view_height + 2
+            for line in range(DIRECTION_LINES - 2):
+                text = f"- {directions[line]}" if line < len(directions) else ""
+                parts.append(f"\x1b[{row + line}H\x1b[2K{text}")
+            self._directions = directions
+        parts.append("\x1b8")
+        self._drawn = self.engine.player.current_room
+        self.stream.write("".join(parts))
+        self.stream.flush()
+
+    def close(self) -> None:
+        """Give the whole terminal back to the text, after the incremental mode."""
+        if not self._scrolling:
+            return
+        self._scrolling = False
+        self.stream.write(f"\x1b[r\x1b[{self._lines}H\n")
+        self.stream.flush()
@@ -0,0 +1,165 @@
+"""Replaying recorded games as a regression and performance corpus.
+
+Every recording is played again headlessly on a map shuffled with its
+seed, and its outcome and the CRC of its events are compared against the
+recorded ones. A directory of recordings is replayed across a process
+pool.
+
+Usage:
+    python replay.py recordings --generate 10000
+    python replay.py recordings --processes 8
+
+functions:
+    replay
+    replay_directory
+    generate
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import time
+from random import Random
+
+import recorder
+from assets import Player
+from main import Map
+from simulate import POLICIES
+
+
+def replay(recording: dict) -> str | None:
+    """Play a recording again and compare the outcome.
+
+    Args:
+        recording (dict): The recording.
+
+    Returns:
+        str | None: What differs, None if the replay went the same way.
+    """
+    engine = Map(
+        Player("Replay"), Random(recording["seed"]), recording["width"], recording["height"]
+    ).engine
+    events = 0
+    crc = 0
+    for command, argument in recording["commands"]:
+        if command == "move":
+            result = engine.move(argument)
+        elif command == "enter":
+            result = engine.enter(tuple(argument))
+        elif command == "fight":
+            result = engine.fight(argument)
+        elif command == "decline":
+            result = engine.decline()
+        else:
+            return f"unknown command {command!r}"
+        events += len(result)
+        crc = recorder.digest(result, crc)
+    replayed = recorder.outcome(engine, events, crc)
+    different = [key for key, value in recording["outcome"].items() if replayed.get(key) != value]
+    if different:
+        return "different " + ", ".join(different)
+    return None
+
+
+def _replay_file(path: str) -> tuple[str, str | None, int]:
+    """Replay a recording file in a worker.
+
+    Returns:
+        tuple[str, str | None, int]: The file, what differs and the number of commands.
+    """
+    try:
+        recording = recorder.load(path)
+        return path, replay(recording), len(recording["commands"])
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        return path, f"unreadable: {error}", 0
+
+
+def replay_directory(directory: str, processes: int | None = None) -> dict:
+    """Replay all the recordings of a directory in parallel.
+
+    Args:
+        directory (str): The directory with the .json recordings.
+        processes (int | None): The number of worker processes, all the cores if not given.
+
+    Returns:
+        dict: The number of recordings and commands, the failures by file,
+            and the recordings and commands per second.
+    """
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")
+    )
+    processes = processes or os.cpu_count() or 1
+    failures = {}
+    commands = 0
+    began = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        chunk = max(1, len(paths) // (processes * 8))
+        for path, failure, count in pool.imap_unordered(_replay_file, paths, chunk):
+            commands += count
+            if failure is not None:
+                failures[path] = failure
+    elapsed = time.perf_counter() - began
+    return {
+        "recordings": len(paths),
+        "commands": commands,
+        "failures": failures,
+        "recordings_per_sec": len(paths) / elapsed,
+        "commands_per_sec": commands / elapsed,
+    }
+
+
+def generate(
+    directory: str, games: int, policy: str = "random", seed: int = 0, max_steps: int = 1000
+) -> None:
+    """Record games played by a bot policy.
+
+    Args:
+        directory (str): The directory to write the recordings to.
+        games (int): The number of games.
+        policy (str): The name of the bot policy, see simulate.POLICIES.
+        seed (int): The seed of the first game, the others follow it.
+        max_steps (int): The number of commands after which a game stops.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for game_seed in range(seed, seed + games):
+        rng = Random(game_seed)
+        engine = recorder.Recorder(Map(Player("Bot"), Random(game_seed)).engine, game_seed)
+        for _ in range(max_steps):
+            command, argument = POLICIES[policy](engine, rng)
+            if command == "move":
+                engine.move(argument)
+            elif command == "fight":
+                engine.fight(argument)
+            else:
+                engine.decline()
+            if engine.finished:
+                break
+        engine.save(os.path.join(directory, f"{game_seed}.json"))
+
+
+def main() -> None:
+    """Replay or generate recordings from the command line."""
+    parser = argparse.ArgumentParser(description="Replay recorded games.")
+    parser.add_argument("directory")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--generate", type=int, metavar="GAMES")
+    parser.add_argument("--policy", choices=POLICIES, default="random")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.generate:
+        generate(args.directory, args.generate, args.policy, args.seed)
+    stats = replay_directory(args.directory, args.processes)
+    for path, failure in sorted(stats["failures"].items()):
+        print(f"{path}: {failure}")
+    print(
+        f"{stats['recordings']} recordings, {len(stats['failures'])} failed, "
+        f"{stats['recordings_per_sec']:.0f} recordings/sec, "
+        f"{stats['commands_per_sec']:.0f} commands/sec"
+    )
+    if stats["failures"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+"""A tick-driven scheduler of the world: roaming characters and timed events.
+
+Timers are kept in a hierarchical timing wheel. Every level has 64 slots;
+a slot of level 0 is one tick, a slot of level 1 is 64 ticks, and so on.
+A timer goes into the level of the highest 6-bit group in which its
+deadline differs from the current tick, and it is moved down a level
+when the wheel gets to its slot. A tick therefore only touches the timers
+that fire or move down, never the ones that are still far away, and the
+cost of a tick does not grow with the number of actors.
+
+A World runs the wheel next to a game: characters roam to a neighbouring
+room every few ticks, defeated enemies come back after a while, and any
+function can be scheduled to run after a number of ticks. A Ticking
+engine advances the world after every command of the player.
+
+Usage:
+    python scheduler.py --actors 1000 10000 100000
+
+classes:
+    Timer
+    TimingWheel
+    World
+    Ticking
+
+functions:
+    bench
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from random import Random
+from typing import Callable
+
+from assets import Enemy, Player
+from engine import FIGHT_WON, Engine, Event
+from grid import NONE, Grid
+from main import Map
+
+BITS = 6
+SLOTS = 1 << BITS
+MASK = SLOTS - 1
+LEVELS = 4
+
+
+class Timer:
+    """A scheduled call.
+
+    Attributes:
+        deadline (int): The tick to run it at.
+        action (Callable[[], None]): The function to run.
+        cancelled (bool): Whether it was cancelled.
+    """
+
+    __slots__ = ("deadline", "action", "cancelled")
+
+    def __init__(self, deadline: int, action: Callable[[], None]) -> None:
+        self.deadline: int = deadline
+        self.action: Callable[[], None] = action
+        self.cancelled: bool = False
+
+
+class TimingWheel:
+    """A hierarchical timing wheel.
+
+    Timers further than the wheel can hold, 64 ** LEVELS ticks, wait in an
+    overflow list that is looked at once per turn of the top level.
+
+    Attributes:
+        now (int): The current tick.
+        pending (int): The number of timers that have not run yet.
+        moved (int): The number of times a timer was moved down a level.
+
+    Methods:
+        schedule: Run a function after a number of ticks.
+        cancel: Cancel a timer.
+        advance: Go to the next tick and run the timers due.
+    """
+
+    def __init__(self) -> None:
+        self.now: int = 0
+        self.pending: int = 0
+        self.moved: int = 0
+        self._slots: list[list[list[Timer]]] = [
+            [[] for _ in range(SLOTS)] for _ in range(LEVELS)
+        ]
+        self._overflow: list[Timer] = []
+
+    def _insert(self, timer: Timer) -> None:
+        """Put a timer into the slot of the highest group its deadline differs in."""
+        # A timer due now, moved down from a higher level, goes into level 0.
+        level = (((timer.deadline ^ self.now) | 1).bit_length() - 1) // BITS
+        if level >= LEVELS:
+            self._overflow.append(timer)
+        else:
+            self._slots[level][(timer.deadline >> (level * BITS)) & MASK].append(timer)
+
+    def schedule(self, delay: int, action: Callable[[], None]) -> Timer:
+        """Run a function after a number of ticks.
+
+        Args:
+            delay (int): The number of ticks, at least 1.
+            action (Callable[[], None]): The function to run.
+
+        Raises:
+            ValueError: If the delay is less than 1.
+
+        Returns:
+            Timer: The timer, to cancel it.
+        """
+        if delay < 1:
+            raise ValueError("A timer must be at least one tick away.")
+        timer = Timer(self.now + delay, action)
+        self._insert(timer)
+        self.pending += 1
+        return timer
+
+    def cancel(self, timer: Timer) -> None:
+        """Cancel a timer. It stays in its slot and is dropped when it is reached.
+
+        Args:
+            timer (Timer): The timer.
+        """
+        if not timer.cancelled:
+            timer.cancelled = True
+            self.pending -= 1
+
+    def advance(self) -> int:
+        """Go to the next tick and run the timers due.
+
+        Returns:
+            int: The number of timers run.
+        """
+        now = self.now = self.now + 1
+        if not now & ((1 << (LEVELS * BITS)) - 1):
+            overflow, self._overflow = self._overflow, []
+            for timer in overflow:
+                self._insert(timer)
+        # Move the timers of the slots the higher levels just got to down,
+        # from the top, so the ones due now land in the slot of this tick.
+        for level in range(LEVELS - 1, 0, -1):
+            if now & ((1 << (level * BITS)) - 1):
+                continue
+            slots = self._slots[level]
+            timers = slots[(now >> (level * BITS)) & MASK]
+            if timers:
+                slots[(now >> (level * BITS)) & MASK] = []
+                self.moved += len(timers)
+                for timer in timers:
+                    self._insert(timer)
+        # A timer scheduled by an action is at least a tick away, so it never
+        # goes into the slot being run.
+        timers = self._slots[0][now & MASK]
+        if not timers:
+            return 0
+        self._slots[0][now & MASK] = []
+        fired = 0
+        for timer in timers:
+            if not timer.cancelled:
+                fired += 1
+                timer.action()
+        self.pending -= fired
+        return fired
+
+
+class _Roamer:
+    """A character that moves to a random neighbouring room every period ticks."""
+
+    __slots__ = ("world", "index", "period")
+
+    def __init__(self, world: World, index: int, period: int) -> None:
+        self.world = world
+        self.index = index
+        self.period = period
+
+    def move(self) -> None:
+        """Move to a random neighbouring room, if it is free."""
+        world = self.world
+        grid, engine = world.grid, world.engine
+        index = self.index
+        if isinstance(grid.character(index), Enemy) and grid.defeated.get(index):
+            return
+        pending = engine.pending
+        if pending is not None and grid.index(*pending) == index:
+            return
+        x, y = grid.position(index)
+        dx, dy = world.rng.choice(_DELTAS)
+        if not grid.in_bounds(x + dx, y + dy):
+            return
+        target = grid.index(x + dx, y + dy)
+        if (
+            target == 0
+            or target == grid.end
+            or grid.character_ids[target] != NONE
+            or target == grid.index(*engine.player.current_room)
+        ):
+            return
+        grid.move_character(index, target)
+        self.index = target
+        world.moves += 1
+
+    def step(self) -> None:
+        """Move and schedule the next move."""
+        self.move()
+        self.world.wheel.schedule(self.period, self.step)
+
+
+_DELTAS = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+
+
+class World:
+    """The things that happen in a game between the player's commands.
+
+    Attributes:
+        engine (Engine): The game.
+        grid (Grid): The grid of the game.
+        wheel (TimingWheel): The timers.
+        rng (Random): The random generator of the roaming characters.
+        respawn (int): The ticks after which a defeated enemy comes back, 0
+            for never.
+        moves (int): The number of times a character moved.
+
+    Methods:
+        after: Run a function after a number of ticks.
+        roam: Make a character roam.
+        roam_all: Make every character roam.
+        defeated: Schedule the return of a defeated enemy.
+        tick: Advance the world.
+    """
+
+    def __init__(self, engine: Engine, seed: int = 0, respawn: int = 0) -> None:
+        if not isinstance(engine.grid, Grid):
+            # A chunked world generates its characters again, it cannot move them.
+            raise TypeError("The characters can only roam on the Grid of a fixed map.")
+        self.engine = engine
+        self.grid: Grid = engine.grid
+        self.wheel = TimingWheel()
+        self.rng = Random(seed)
+        self.respawn: int = respawn
+        self.moves: int = 0
+
+    def after(self, delay: int, action: Callable[[], None]) -> Timer:
+        """Run a function after a number of ticks.
+
+        Args:
+            delay (int): The number of ticks, at least 1.
+            action (Callable[[], None]): The function to run.
+
+        Returns:
+            Timer: The timer, to cancel it.
+        """
+        return self.wheel.schedule(delay, action)
+
+    def roam(self, index: int, period: int) -> None:
+        """Make the character of a cell move to a neighbouring room every period ticks.
+
+        Args:
+            index (int): The index of the cell of the character.
+            period (int): The ticks between two moves.
+        """
+        roamer = _Roamer(self, index, period)
+        self.wheel.schedule(1 + self.rng.randrange(period), roamer.step)
+
+    def roam_all(self, shortest: int = 5, longest: int = 20, limit: int | None = None) -> int:
+        """Make the characters roam, each with its own period.
+
+        Args:
+            shortest (int): The shortest period.
+            longest (int): The longest period.
+            limit (int | None): The number of characters, all if not given.
+
+        Returns:
+            int: The number of characters made to roam.
+        """
+        grid = self.grid
+        count = 0
+        for index in range(len(grid)):
+            if limit is not None and count >= limit:
+                break
+            if grid.character_ids[index] != NONE:
+                self.roam(index, self.rng.randint(shortest, longest))
+                count += 1
+        return count
+
+    def defeated(self, index: int) -> None:
+        """Schedule the return of the enemy defeated in a cell.
+
+        Args:
+            index (int): The index of the cell.
+        """
+        if self.respawn:
+            self.wheel.schedule(self.respawn, lambda: self.grid.revive(index))
+
+    def tick(self, ticks: int = 1) -> int:
+        """Advance the world.
+
+        Args:
+            ticks (int): The number of ticks.
+
+        Returns:
+            int: The number of timers run.
+        """
+        advance = self.wheel.advance
+        return sum(advance() for _ in range(ticks))
+
+
+class Ticking:
+    """An engine that advances a world after every command.
+
+    Everything else is passed through to the engine, so it can be used
+    wherever the engine is.
+
+    Attributes:
+        engine (Engine): The game.
+        world (World): The world to advance.
+        ticks (int): The ticks per command.
+
+    Methods:
+        move: Move in a direction.
+        enter: Enter a room.
+        fight: Fight the pending enemy.
+        decline: Decline to fight the pending enemy.
+    """
+
+    def __init__(self, engine: Engine, world: World, ticks: int = 1) -> None:
+        self.engine = engine
+        self.world: World = world
+        self.ticks: int = ticks
+
+    def __getattr__(self, name: str) -> object:
+        return getattr(self.engine, name)
+
+    def _advance(self, events: list[Event]) -> list[Event]:
+        """Schedule the return of a defeated enemy and advance the world."""
+        for event in events:
+            if event.kind == FIGHT_WON:
+                self.world.defeated(self.engine.grid.index(*event.data["room_id"]))
+        self.world.tick(self.ticks)
+        return events
+
+    def move(self, direction: str) -> list[Event]:
+        """Move in a direction, see Engine.move."""
+        return self._advance(self.engine.move(direction))
+
+    def enter(self, room_id: tuple[int, int]) -> list[Event]:
+        """Enter a room, see Engine.enter."""
+        return self._advance(self.engine.enter(room_id))
+
+    def fight(self, weapon_id: int) -> list[Event]:
+        """Fight the pending enemy, see Engine.fight."""
+        return self._advance(self.engine.fight(weapon_id))
+
+    def decline(self) -> list[Event]:
+        """Decline to fight the pending enemy, see Engine.decline."""
+        return self._advance(self.engine.decline())
+
+
+def bench(
+    actors: list[int],
+    ticks: int = 2000,
+    shortest: int = 50,
+    longest: int = 500,
+    seed: int = 0,
+) -> list[dict[str, float]]:
+    """Measure the cost of a tick as the number of roaming characters grows.
+
+    The same characters are also moved by checking every one of them on
+    every tick, for comparison.
+
+    Args:
+        actors (list[int]): The numbers of characters.
+        ticks (int): The number of ticks to run.
+        shortest (int): The shortest period of a character.
+        longest (int): The longest period of a character.
+        seed (int): The seed of the map.
+
+    Returns:
+        list[dict[str, float]]: For every number of characters, the
+            microseconds of a tick with the wheel and with polling, and the
+            timers run per tick.
+    """
+    side = 2
+    while side * side * 4 // 7 < max(actors):
+        side *= 2
+    results = []
+    for count in actors:
+        engine = Map(Player("Bench"), Random(seed), side, side).engine
+        world = World(engine, seed)
+        world.roam_all(shortest, longest, count)
+        began = time.perf_counter()
+        fired = world.tick(ticks)
+        wheel = (time.perf_counter() - began) / ticks
+        engine = Map(Player("Bench"), Random(seed), side, side).engine
+        world = World(engine, seed)
+        grid = world.grid
+        rng = Random(seed)
+        roamers = [
+            _Roamer(world, index, rng.randint(shortest, longest))
+            for index in range(len(grid))
+            if grid.character_ids[index] != NONE
+        ][:count]
+        due = [1 + rng.randrange(roamer.period) for roamer in roamers]
+        polled_ticks = max(1, ticks // 10)
+        began = time.perf_counter()
+        for now in range(1, polled_ticks + 1):
+            for i, roamer in enumerate(roamers):
+                if due[i] <= now:
+                    roamer.move()
+                    due[i] = now + roamer.period
+        polling = (time.perf_counter() - began) / polled_ticks
+        results.append(
+            {
+                "actors": count,
+                "wheel_us_per_tick": wheel * 1e6,
+                "polling_us_per_tick": polling * 1e6,
+                "fired_per_tick": fired / ticks,
+            }
+        )
+    return results
+
+
+def main() -> None:
+    """Measure the cost of a tick for growing numbers of roaming characters."""
+    parser = argparse.ArgumentParser(description="Benchmark the world scheduler.")
+    parser.add_argument("--actors", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--shortest", type=int, default=50, help="the shortest period")
+    parser.add_argument("--longest", type=int, default=500, help="the longest period")
+    args = parser.parse_args()
+    print(f"{'actors':>8} {'wheel us/tick':>14} {'polling us/tick':>16} {'fired/tick':>11}")
+    for result in bench(args.actors, args.ticks, args.shortest, args.longest):
+        print(
+            f"{result['actors']:>8} {result['wheel_us_per_tick']:>14.1f} "
+            f"{result['polling_us_per_tick']:>16.1f} {result['fired_per_tick']:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
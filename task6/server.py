@@ -0,0 +1,337 @@
+"""An asyncio server hosting many independent games over a line protocol.
+
+Every connection gets its own session with its own map. A client sends one
+command per line and gets back one line per event, followed by a line with
+a single dot:
+
+    move <direction>    Move in a direction (north, south, east, west).
+    fight <weapon id>   Fight the pending enemy with a weapon.
+    decline             Decline the fight.
+    look                Show the map and the directions.
+    sync [<version>]    Acknowledge a version of the state and get what
+                        changed since it, or the full state without one,
+                        as base64 of a sync.py delta.
+    stats               Show the number of sessions and the CPU time used.
+    quit                Close the session.
+
+An event line is its kind and its message, with new lines written as "\\n".
+The first response of a session also has a "seed" line with the seed its
+map was shuffled with, so the same map can be built again.
+A line longer than the stream limit gets an "error" line back.
+
+Usage:
+    python server.py --port 8765 --max-sessions 10000
+
+classes:
+    Session
+    GameServer
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import time
+from random import Random
+
+from assets import Player
+from engine import Engine, Event
+from eventlog import EventLog, log_events
+from main import Map
+from metrics import Metrics, instrument
+from sync import StateSync
+
+END = "."
+
+
+class Session:
+    """A game of one client.
+
+    Attributes:
+        session_id (int): The id of the session.
+        engine (Engine): The rules of the session's game.
+        seed (int | None): The seed the map was shuffled with, None if unknown.
+        commands (int): The number of commands handled.
+        last_active (float): The monotonic time of the last command.
+        state (StateSync | None): The versions of the state sent to the
+            client, None until it asks for them.
+
+    Methods:
+        handle: Handle a command line.
+        sync: Send what changed since a version of the state.
+        look: Describe the map and the directions.
+    """
+
+    def __init__(self, session_id: int, engine: Engine, seed: int | None = None) -> None:
+        self.session_id: int = session_id
+        self.engine: Engine = engine
+        self.seed: int | None = seed
+        self.commands: int = 0
+        self.last_active: float = time.monotonic()
+        self.state: StateSync | None = None
+
+    def handle(self, line: str) -> list[Event]:
+        """Handle a command line.
+
+        Args:
+            line (str): The command and its argument.
+
+        Returns:
+            list[Event]: The events caused by the command.
+        """
+        self.commands += 1
+        self.last_active = time.monotonic()
+        command, _, argument = line.strip().partition(" ")
+        if command == "move":
+            return self.engine.move(argument)
+        if command == "fight":
+            return self.engine.fight(int(argument) if argument.isdigit() else -1)
+        if command == "decline":
+            return self.engine.decline()
+        if command == "look":
+            return [self.look()]
+        if command == "sync":
+            return [self.sync(int(argument) if argument.isdigit() else None)]
+        return [Event("error", f"Unknown command {command!r}.")]
+
+    def sync(self, version: int | None) -> Event:
+        """Acknowledge a version of the state and send what changed since it.
+
+        Args:
+            version (int | None): The version the client has, None for the
+                full state.
+
+        Returns:
+            Event: The event with the base64 delta in its message.
+        """
+        if self.state is None:
+            self.state = StateSync(self.engine)
+        if version is None:
+            data = self.state.snapshot()
+        else:
+            self.state.ack(version)
+            data = self.state.delta(version)
+        return Event("sync", base64.b64encode(data).decode())
+
+    def look(self) -> Event:
+        """Describe the map and the directions.
+
+        Returns:
+            Event: The event with the map drawn in its message.
+        """
+        grid = self.engine.grid
+        player = self.engine.player
+        lines = []
+        for i in range(grid.height):
+            line = []
+            for j in range(grid.width):
+                if (j, i) == player.current_room:
+                    line.append("♙")
+                elif player.has_cleared(grid.index(j, i)):
+                    line.append("X")
+                else:
+                    line.append("O")
+            lines.append(" ".join(line))
+        lines.append("You can go to: " + ", ".join(self.engine.directions()))
+        return Event("look", "\n".join(lines))
+
+
+def _format(event: Event) -> str:
+    """Write an event as a protocol line."""
+    return f"{event.kind} {event.message}".rstrip().replace("\n", "\\n") + "\n"
+
+
+class GameServer:
+    """A server of many game sessions.
+
+    Attributes:
+        host (str): The address to listen on.
+        port (int): The port to listen on, 0 for any free port.
+        max_sessions (int): The number of sessions that can be open at once.
+        idle_timeout (float): Seconds without a command after which a session closes.
+        write_timeout (float): Seconds a slow client may take to read a response.
+        write_buffer (int): Bytes buffered for a client before the server waits.
+        width (int): The number of columns of the maps.
+        height (int): The number of rows of the maps.
+        metrics (Metrics | None): Where to measure the commands of all the
+            sessions, None to not measure them.
+        log (EventLog | None): Where to append the events of all the
+            sessions, None to not log them.
+        seed (int | None): The seed of the seeds of the sessions' maps, so a
+            run of the server can be repeated; a random one if None.
+        sessions (dict[int, Session]): The open sessions.
+
+    Methods:
+        start: Start listening.
+        close: Stop the server.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        max_sessions: int = 10000,
+        idle_timeout: float = 300.0,
+        write_timeout: float = 10.0,
+        write_buffer: int = 64 * 1024,
+        width: int = 3,
+        height: int = 3,
+        metrics: Metrics | None = None,
+        log: EventLog | None = None,
+        seed: int | None = None,
+    ) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.max_sessions: int = max_sessions
+        self.idle_timeout: float = idle_timeout
+        self.write_timeout: float = write_timeout
+        self.write_buffer: int = write_buffer
+        self.width: int = width
+        self.height: int = height
+        self.metrics: Metrics | None = metrics
+        self.log: EventLog | None = log
+        self.seed: int | None = seed
+        self._seeds: Random = Random(seed)
+        self.sessions: dict[int, Session] = {}
+        self._next_id: int = 0
+        self._server: asyncio.AbstractServer | None = None
+        self._flusher: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        """Start listening. The port is updated if it was 0."""
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.log is not None:
+            self._flusher = asyncio.create_task(self._flush(self.log))
+
+    async def close(self) -> None:
+        """Stop the server."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _flush(self, log: EventLog) -> None:
+        """Write the buffered events of the log every flush interval, even when no one plays."""
+        while True:
+            await asyncio.sleep(log.flush_interval)
+            log.flush()
+
+    async def _send(self, writer: asyncio.StreamWriter, lines: list[str]) -> None:
+        """Send lines, waiting for a slow client until the write timeout."""
+        writer.write("".join(lines).encode())
+        await asyncio.wait_for(writer.drain(), self.write_timeout)
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Run a session for a connection."""
+        writer.transport.set_write_buffer_limits(high=self.write_buffer)
+        if len(self.sessions) >= self.max_sessions:
+            writer.write(b"full The server is full.\n.\n")
+            writer.close()
+            return
+        session_id = self._next_id
+        self._next_id += 1
+        player = Player(f"Player {session_id}")
+        seed = self._seeds.getrandbits(64)
+        game_map = Map(player, Random(seed), self.width, self.height)
+        if self.metrics is not None:
+            instrument(game_map, self.metrics)
+        if self.log is not None:
+            log_events(game_map, self.log, session_id)
+        session = Session(session_id, game_map.engine, seed)
+        self.sessions[session_id] = session
+        try:
+            await self._send(
+                writer,
+                [
+                    _format(Event("welcome", game_map.starting_room.description)),
+                    _format(Event("seed", str(seed))),
+                    END + "\n",
+                ],
+            )
+            while not session.engine.finished:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    await self._send(writer, ["timeout The session was idle.\n", END + "\n"])
+                    break
+                except ValueError:
+                    # The line was longer than the limit of the stream, which
+                    # has dropped it.
+                    await self._send(writer, ["error The line is too long.\n", END + "\n"])
+                    continue
+                if not line or line.strip() == b"quit":
+                    break
+                if line.strip() == b"stats":
+                    events = [
+                        Event(
+                            "stats",
+                            f"sessions={len(self.sessions)} cpu={time.process_time():.6f}",
+                        )
+                    ]
+                else:
+                    events = session.handle(line.decode(errors="replace"))
+                await self._send(writer, [_format(event) for event in events] + [END + "\n"])
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            del self.sessions[session_id]
+            writer.close()
+
+
+async def serve(server: GameServer) -> None:
+    """Run a server until it is cancelled.
+
+    Args:
+        server (GameServer): The server to run.
+    """
+    await server.start()
+    print(f"Listening on {server.host}:{server.port}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main() -> None:
+    """Run the server from the command line."""
+    parser = argparse.ArgumentParser(description="Host many games over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--idle-timeout", type=float, default=300.0)
+    parser.add_argument("--width", type=int, default=3)
+    parser.add_argument("--height", type=int, default=3)
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on /metrics")
+    parser.add_argument("--log", metavar="DIR", help="append the events of all games to a log")
+    parser.add_argument("--seed", type=int, help="seed the maps of the sessions")
+    args = parser.parse_args()
+    metrics = None
+    if args.metrics_port is not None:
+        metrics = Metrics()
+        metrics.serve(args.metrics_port, args.host)
+    server = GameServer(
+        args.host,
+        args.port,
+        args.max_sessions,
+        args.idle_timeout,
+        width=args.width,
+        height=args.height,
+        metrics=metrics,
+        log=EventLog(args.log) if args.log else None,
+        seed=args.seed,
+    )
+    try:
+        asyncio.run(serve(server))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server.log is not None:
+            server.log.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+"""A dungeon shared by many players moving at the same time.
+
+Every player has an engine of their own over the same grid, so the
+enemies one player defeats and the items one player picks up are gone for
+the others. The engines can be used from many threads at once.
+
+The only state the players share is whether each enemy is defeated and
+each item picked up. It is kept one byte per cell and changed only under
+the lock of the cell, one of a fixed number of locks the cells are spread
+over, so players in different rooms do not wait for each other. The flags
+are only ever set, never cleared, so a room whose enemy is defeated and
+whose item is picked up cannot change any more and is entered without a
+lock.
+
+The engines do not wait for anything but the locks, so they can also be
+used from asyncio tasks of one event loop, where they never contend.
+
+The threads run the game under the GIL, so more players give no more
+commands per second of CPU work; the room locks only pay off when a lock
+is held across something that releases the GIL, which the benchmark
+simulates with --hold.
+
+Usage:
+    python shared.py --players 1 2 4 8 16 --moves 2000 --think 0.0005
+    python shared.py --players 1 4 16 --moves 300 --hold 0.0002
+
+classes:
+    Flags
+    SharedWorld
+    SharedEngine
+
+functions:
+    bench
+"""
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from random import Random
+
+from assets import Enemy, Player, Weapon
+from engine import ENTERED, Engine, Event
+from grid import NONE, copy_item
+from main import Map
+from simulate import greedy_policy
+
+
+# Maps the bytes of the flags to the digits of a binary number.
+_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+
+
+class Flags:
+    """A set of cell indices stored one byte per cell, with the interface of Bitmap.
+
+    Unlike a Bitmap, changing a flag writes only the byte of its cell and
+    no running count, so cells under different locks never share a write.
+    The count is taken when it is read instead.
+
+    Attributes:
+        size (int): The number of cells.
+        count (int): The number of flags that are set.
+
+    Methods:
+        get: Check a flag.
+        set: Set a flag.
+        discard: Clear a flag.
+        copy: Copy the flags.
+        shares: Check if a copy still shares the bytes of the flags.
+        to_bytes: Get the flags packed as the bytes of a Bitmap.
+        as_int: Get the flags as an integer.
+    """
+
+    __slots__ = ("_bytes",)
+
+    def __init__(self, size: int) -> None:
+        self._bytes = bytearray(size)
+
+    @property
+    def size(self) -> int:
+        """Get the number of cells."""
+        return len(self._bytes)
+
+    @property
+    def count(self) -> int:
+        """Count the flags that are set."""
+        return len(self._bytes) - self._bytes.count(0)
+
+    def get(self, index: int) -> bool:
+        """Check a flag.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            bool: True if the flag is set, False otherwise.
+        """
+        return bool(self._bytes[index])
+
+    def set(self, index: int) -> bool:
+        """Set a flag.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            bool: True if the flag was not set before, False otherwise.
+        """
+        if self._bytes[index]:
+            return False
+        self._bytes[index] = 1
+        return True
+
+    def discard(self, index: int) -> bool:
+        """Clear a flag.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            bool: True if the flag was set before, False otherwise.
+        """
+        if not self._bytes[index]:
+            return False
+        self._bytes[index] = 0
+        return True
+
+    def copy(self) -> Flags:
+        """Copy the flags.
+
+        Returns:
+            Flags: The copy, with bytes of its own.
+        """
+        flags = Flags(0)
+        flags._bytes = bytearray(self._bytes)
+        return flags
+
+    def shares(self, other: Flags) -> bool:
+        """Check if a copy still shares the bytes of the flags.
+
+        Copies never do, so a copy is always compared again.
+
+        Args:
+            other (Flags): A copy of the flags.
+
+        Returns:
+            bool: True if both are the same flags.
+        """
+        return self._bytes is other._bytes
+
+    def as_int(self) -> int:
+        """Get the flags as an integer, bit i of it being the flag of cell i.
+
+        Returns:
+            int: The integer.
+        """
+        if not self._bytes:
+            return 0
+        return int(self._bytes[::-1].translate(_DIGITS), 2)
+
+    def to_bytes(self, length: int | None = None) -> bytes:
+        """Get the flags packed as the bytes of a Bitmap, see Bitmap.to_bytes.
+
+        Args:
+            length (int | None): The number of bytes, cut or padded with
+                zeros. Enough for all the cells if not given.
+
+        Returns:
+            bytes: The bytes.
+        """
+        if length is None:
+            length = (len(self._bytes) + 7) >> 3
+        return (self.as_int() & ((1 << 8 * length) - 1)).to_bytes(length, "little")
+
+
+class SharedWorld:
+    """A generated map shared by many players.
+
+    Attributes:
+        grid (Grid): The shared grid, with Flags for its defeated enemies
+            and picked up items.
+        matchups (Matchups): The compiled weapon rules.
+        engines (list[SharedEngine]): The engines of the players who joined.
+        hold (float): The seconds a lock is kept after its room was used.
+
+    Methods:
+        join: Add a player.
+        lock: Get the lock of a cell.
+        settled: Check if a cell can still change.
+    """
+
+    def __init__(
+        self, width: int = 3, height: int = 3, seed: int = 0, locks: int = 64, hold: float = 0.0
+    ) -> None:
+        """Generate the map.
+
+        Args:
+            width (int): The number of columns.
+            height (int): The number of rows.
+            seed (int): The seed of the map.
+            locks (int): The number of locks the cells are spread over, 1
+                for a single global lock.
+            hold (float): The seconds a lock is kept after the room under it
+                was read or changed, like a game that writes the room to a
+                store would. Only the benchmark sets it.
+        """
+        game_map = Map(Player("Host"), Random(seed), width, height)
+        grid = self.grid = game_map.rooms
+        self.matchups = game_map.engine.matchups
+        size = len(grid)
+        for name in ("defeated", "picked_up"):
+            flags = Flags(size)
+            bits = getattr(grid, name)
+            for index in range(size):
+                if bits.get(index):
+                    flags.set(index)
+            setattr(grid, name, flags)
+        self._enemies = bytearray(isinstance(grid.character(i), Enemy) for i in range(size))
+        self._items = bytearray(grid.item_ids[i] != NONE for i in range(size))
+        self._locks = [threading.Lock() for _ in range(min(locks, size))]
+        self.engines: list[SharedEngine] = []
+        self._joining = threading.Lock()
+        self.hold: float = hold
+
+    def join(self, name: str) -> SharedEngine:
+        """Add a player in the starting room, with the starting weapon.
+
+        Args:
+            name (str): The name of the player.
+
+        Returns:
+            SharedEngine: The engine of the player.
+        """
+        player = Player(name)
+        weapon = copy_item(self.grid.item(0))
+        assert isinstance(weapon, Weapon)
+        player.weapons.append(weapon)
+        engine = SharedEngine(self, player)
+        with self._joining:
+            self.engines.append(engine)
+        return engine
+
+    def lock(self, index: int) -> threading.Lock:
+        """Get the lock of a cell.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            threading.Lock: The lock.
+        """
+        return self._locks[index % len(self._locks)]
+
+    def settled(self, index: int) -> bool:
+        """Check if a cell can still change.
+
+        Args:
+            index (int): The index of the cell.
+
+        Returns:
+            bool: True if its enemy, if any, is defeated and its item, if
+                any, is picked up.
+        """
+        grid = self.grid
+        return (not self._enemies[index] or grid.defeated.get(index)) and (
+            not self._items[index] or grid.picked_up.get(index)
+        )
+
+
+class SharedEngine(Engine):
+    """The engine of one player of a shared world.
+
+    Entering a room and fighting its enemy hold the lock of the room while
+    they read and change it. An enemy defeated by someone else while the
+    player was deciding is not fought again: the player just walks in.
+
+    Attributes:
+        world (SharedWorld): The shared world.
+        waits (int): The times the player waited for a lock.
+        conflicts (int): The times another player got there first.
+
+    Methods:
+        restart: Start again from the starting room.
+    """
+
+    def __init__(self, world: SharedWorld, player: Player) -> None:
+        super().__init__(world.grid, player, world.matchups)
+        self.world: SharedWorld = world
+        self.waits: int = 0
+        self.conflicts: int = 0
+
+    def restart(self) -> None:
+        """Start again from the starting room, keeping the weapons.
+
+        The world is not reset: what the players have done stays done.
+        """
+        self.pending = None
+        self.finished = self.won = False
+        self.player.current_room = (0, 0)
+
+    def _acquire(self, index: int) -> threading.Lock:
+        """Take the lock of a cell, counting the times it was held by another player."""
+        lock = self.world.lock(index)
+        if not lock.acquire(blocking=False):
+            self.waits += 1
+            lock.acquire()
+        return lock
+
+    def _release(self, lock: threading.Lock) -> None:
+        """Release the lock of a cell, after the hold of the world."""
+        if self.world.hold:
+            time.sleep(self.world.hold)
+        lock.release()
+
+    def enter(self, room_id: tuple[int, int]) -> list[Event]:
+        """Enter a room, see Engine.enter."""
+        grid = self.grid
+        if self.finished or self.pending is not None or not grid.in_bounds(*room_id):
+            return super().enter(room_id)
+        index = grid.index(*room_id)
+        if self.world.settled(index):
+            return super().enter(room_id)
+        lock = self._acquire(index)
+        try:
+            return super().enter(room_id)
+        finally:
+            self._release(lock)
+
+    def fight(self, weapon_id: int) -> list[Event]:
+        """Fight the pending enemy, see Engine.fight."""
+        if self.pending is None:
+            return super().fight(weapon_id)
+        room_id = self.pending
+        index = self.grid.index(*room_id)
+        lock = self._acquire(index)
+        try:
+            if not self.grid.defeated.get(index):
+                return super().fight(weapon_id)
+            self.conflicts += 1
+            self.pending = None
+            events = [Event(ENTERED, "Someone has defeated the enemy already.", room_id=room_id)]
+            self._finish(room_id, events)
+            return events
+        finally:
+            self._release(lock)
+
+
+def _play(engine: SharedEngine, moves: int, seed: int, think: float) -> None:
+    """Play a shared game with the greedy bot, starting again when it is over."""
+    rng = Random(seed)
+    for _ in range(moves):
+        if think:
+            time.sleep(think)
+        if engine.finished:
+            engine.restart()
+        command, argument = greedy_policy(engine, rng)
+        getattr(engine, command)(*([] if argument is None else [argument]))
+
+
+def bench(
+    players: int,
+    moves: int,
+    width: int = 30,
+    height: int = 30,
+    locks: int = 64,
+    think: float = 0.0,
+    hold: float = 0.0,
+) -> dict[str, float]:
+    """Play a shared world with many threads at once.
+
+    Args:
+        players (int): The number of players, one thread each.
+        moves (int): The number of commands of each player.
+        width (int): The number of columns.
+        height (int): The number of rows.
+        locks (int): The number of locks, 1 for a single global lock.
+        think (float): The seconds each player waits before a command, like
+            a client on the network would.
+        hold (float): The seconds a lock is kept after a room has changed,
+            like a game that writes the room to a store would.
+
+    Raises:
+        AssertionError: If an item was picked up by more than one player.
+
+    Returns:
+        dict[str, float]: The commands per second of all the players, the
+            waits for a lock and the conflicts per thousand commands.
+    """
+    world = SharedWorld(width, height, 0, locks, hold)
+    engines = [world.join(f"Player {i}") for i in range(players)]
+    threads = [
+        threading.Thread(target=_play, args=(engine, moves, i, think)) for i, engine in enumerate(engines)
+    ]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    grid = world.grid
+    picked = sum(
+        1
+        for index in range(1, len(grid))
+        if isinstance(grid.item(index), Weapon) and grid.picked_up.get(index)
+    )
+    assert picked == sum(len(engine.player.weapons) - 1 for engine in engines)
+    commands = players * moves
+    return {
+        "commands_per_sec": commands / elapsed,
+        "waits_per_1000": sum(engine.waits for engine in engines) / commands * 1000,
+        "conflicts_per_1000": sum(engine.conflicts for engine in engines) / commands * 1000,
+    }
+
+
+def main() -> None:
+    """Compare the room locks with a global lock as players are added."""
+    parser = argparse.ArgumentParser(description="Benchmark a shared world.")
+    parser.add_argument("--players", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--moves", type=int, default=2000)
+    parser.add_argument("--width", type=int, default=30)
+    parser.add_argument("--height", type=int, default=30)
+    parser.add_argument("--locks", type=int, default=64)
+    parser.add_argument("--think", type=float, default=0.0005, help="seconds between commands")
+    parser.add_argument("--hold", type=float, default=0.0, help="seconds a lock is kept")
+    args = parser.parse_args()
+    print(f"{'players':>8} {'locks':>6} {'commands/s':>12} {'waits/1k':>9} {'conflicts/1k':>13}")
+    for players in args.players:
+        for locks in (1, args.locks):
+            result = bench(
+                players, args.moves, args.width, args.height, locks, args.think, args.hold
+            )
+            print(
+                f"{players:>8} {locks:>6} {result['commands_per_sec']:>12.0f} "
+                f"{result['waits_per_1000']:>9.2f} {result['conflicts_per_1000']:>13.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""A Monte Carlo simulator of the game balance.
+
+Plays many seeded maps with a bot policy across a process pool. The
+workers write the results into shared fixed-width arrays, so nothing but
+the timings is pickled back.
+
+Usage:
+    python simulate.py --games 100000 --policy greedy
+
+functions:
+    random_policy
+    greedy_policy
+    play_game
+    simulate
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import time
+from random import Random
+from typing import Callable
+
+from assets import Enemy, Player
+from engine import MOVED, Engine
+from main import Map
+
+OUTCOME_WON = 0
+OUTCOME_LOST = 1
+OUTCOME_TIMEOUT = 2
+
+Command = tuple[str, object]
+Policy = Callable[[Engine, Random], Command]
+
+
+def random_policy(engine: Engine, rng: Random) -> Command:
+    """Move in a random direction and fight with a random weapon.
+
+    Args:
+        engine (Engine): The game to choose a command for.
+        rng (Random): The random generator of the game.
+
+    Returns:
+        Command: The command name and its argument.
+    """
+    if engine.pending is not None:
+        return "fight", rng.randrange(len(engine.player.weapons))
+    return "move", rng.choice(engine.directions())
+
+
+def _can_beat(player: Player, enemy: Enemy) -> int | None:
+    """Find a weapon of the player that wins against the enemy.
+
+    Args:
+        player (Player): The player character.
+        enemy (Enemy): The enemy to fight.
+
+    Returns:
+        int | None: The index of the weapon, None if there is no such weapon.
+    """
+    for i, weapon in enumerate(player.weapons):
+        if weapon.can_kill == enemy.weapon.name:
+            return i
+    return None
+
+
+def greedy_policy(engine: Engine, rng: Random) -> Command:
+    """Fight only when a weapon wins, prefer the rooms worth entering.
+
+    Args:
+        engine (Engine): The game to choose a command for.
+        rng (Random): The random generator of the game.
+
+    Returns:
+        Command: The command name and its argument.
+    """
+    player = engine.player
+    if engine.pending is not None:
+        enemy = engine.grid.character(engine.grid.index(*engine.pending))
+        assert isinstance(enemy, Enemy)
+        weapon_id = _can_beat(player, enemy)
+        return ("decline", None) if weapon_id is None else ("fight", weapon_id)
+    grid = engine.grid
+    neighbours = grid.neighbours(*player.current_room)
+    fresh = []
+    for direction, room_id in neighbours.items():
+        index = grid.index(*room_id)
+        if player.has_cleared(index):
+            continue
+        if index == grid.end and not grid.room(*room_id).can_enter(player):
+            continue
+        character = grid.character(index)
+        if isinstance(character, Enemy) and _can_beat(player, character) is None:
+            continue
+        fresh.append(direction)
+    return "move", rng.choice(fresh or list(neighbours))
+
+
+POLICIES: dict[str, Policy] = {"random": random_policy, "greedy": greedy_policy}
+
+
+def play_game(seed: int, policy: Policy, max_steps: int = 1000) -> tuple[int, int]:
+    """Play one seeded game with a bot policy.
+
+    Args:
+        seed (int): The seed of the map and the policy.
+        policy (Policy): The bot policy.
+        max_steps (int): The number of commands after which the game times out.
+
+    Returns:
+        tuple[int, int]: The outcome and the number of rooms the player moved to.
+    """
+    rng = Random(seed)
+    engine = Map(Player("Bot"), rng).engine
+    moves = 0
+    for _ in range(max_steps):
+        command, argument = policy(engine, rng)
+        if command == "move":
+            events = engine.move(argument)
+        elif command == "fight":
+            events = engine.fight(argument)
+        else:
+            events = engine.decline()
+        moves += any(event.kind == MOVED for event in events)
+        if engine.finished:
+            return (OUTCOME_WON if engine.won else OUTCOME_LOST), moves
+    return OUTCOME_TIMEOUT, moves
+
+
+_outcomes = None
+_moves = None
+
+
+def _init_worker(outcomes, moves) -> None:
+    """Keep the shared result arrays in the worker process."""
+    global _outcomes, _moves
+    _outcomes, _moves = outcomes, moves
+
+
+def _run_chunk(args: tuple[int, int, int, str, int]) -> float:
+    """Play a range of games and write their results to the shared arrays.
+
+    Args:
+        args (tuple): The first and the last game, the base seed, the policy
+            name and the step limit.
+
+    Returns:
+        float: The time spent on the chunk in seconds.
+    """
+    start, stop, seed, policy_name, max_steps = args
+    policy = POLICIES[policy_name]
+    began = time.perf_counter()
+    for i in range(start, stop):
+        _outcomes[i], _moves[i] = play_game(seed + i, policy, max_steps)
+    return time.perf_counter() - began
+
+
+def simulate(
+    games: int,
+    policy: str = "greedy",
+    processes: int | None = None,
+    seed: int = 0,
+    max_steps: int = 1000,
+    chunk: int = 1000,
+) -> dict[str, float]:
+    """Play many games across a process pool and aggregate the results.
+
+    Args:
+        games (int): The number of games to play.
+        policy (str): The name of the policy in POLICIES.
+        processes (int | None): The number of worker processes, all cores by default.
+        seed (int): The seed of the first game, game i uses seed + i.
+        max_steps (int): The number of commands after which a game times out.
+        chunk (int): The number of games given to a worker at once.
+
+    Returns:
+        dict[str, float]: The aggregated statistics and the throughput.
+    """
+    processes = processes or os.cpu_count() or 1
+    outcomes = multiprocessing.Array("b", games, lock=False)
+    moves = multiprocessing.Array("i", games, lock=False)
+    tasks = [
+        (start, min(start + chunk, games), seed, policy, max_steps)
+        for start in range(0, games, chunk)
+    ]
+    began = time.perf_counter()
+    with multiprocessing.Pool(processes, _init_worker, (outcomes, moves)) as pool:
+        busy = sum(pool.imap_unordered(_run_chunk, tasks))
+    elapsed = time.perf_counter() - began
+    won = [moves[i] for i in range(games) if outcomes[i] == OUTCOME_WON]
+    lost = sum(1 for i in range(games) if outcomes[i] == OUTCOME_LOST)
+    return {
+        "games": games,
+        "win_rate": len(won) / games if games else 0.0,
+        "loss_rate": lost / games if games else 0.0,
+        "timeout_rate": (games - len(won) - lost) / games if games else 0.0,
+        "mean_path": sum(won) / len(won) if won else 0.0,
+        "min_path": min(won, default=0),
+        "max_path": max(won, default=0),
+        "seconds": elapsed,
+        "games_per_sec": games / elapsed if elapsed else 0.0,
+        "games_per_sec_per_core": games / busy if busy else 0.0,
+    }
+
+
+def main() -> None:
+    """Run the simulator from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--policy", choices=POLICIES, default="greedy")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-steps", type=int, default=1000)
+    args = parser.parse_args()
+    stats = simulate(args.games, args.policy, args.processes, args.seed, args.max_steps)
+    for name, value in stats.items():
+        print(f"{name}: {value:.4g}" if isinstance(value, float) else f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
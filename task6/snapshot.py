@@ -0,0 +1,460 @@
+"""A fixed-layout binary format for saved games.
+
+A snapshot file holds many sessions of maps of one size. It starts with a
+header, followed by records of the same size, one per slot, so a session
+is read or written at a known offset of the memory-mapped file.
+
+Header, little-endian:
+    magic (4s), version (H), width (H), height (H), slots (I), tables (I)
+
+Record, for a map of n cells:
+    flags (B): 1 used, 2 finished, 4 won, 8 waiting for a fight
+    current room (2 H), pending room (2 H), number of weapons (H), name (32s)
+    room kinds (n H), characters (n i), items (n i)
+    defeated, picked up and cleared bitmaps ((n + 7) // 8 bytes each)
+    weapons as item ids (n B)
+
+The cells are stored as the Grid stores them, so they are copied as
+whole blocks of bytes. The room kinds, characters and items are ids into
+the tables that every Map registers in the same order; tables is a
+checksum of them, so files written by an incompatible version of the game
+are rejected. Only the games of fixed maps are saved, a chunked world has
+no cells to copy.
+
+Usage:
+    python snapshot.py --sessions 10000
+
+classes:
+    SnapshotFile
+
+functions:
+    dumps
+    loads
+    game_of
+"""
+from __future__ import annotations
+
+import argparse
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+import zlib
+from array import array
+from functools import lru_cache
+from random import Random
+
+from assets import Bitmap, Enemy, Friend, Player, Weapon
+from engine import Engine
+from grid import CHANGE, Grid
+from main import Game, Map
+from matchups import Matchups
+
+MAGIC = b"S6GM"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHII")
+HEAD = struct.Struct("<BHHHHH32s")
+
+USED = 1
+FINISHED = 2
+WON = 4
+PENDING = 8
+
+BIG_ENDIAN = sys.byteorder == "big"
+
+
+class _Tables:
+    """The templates shared by every map of one size."""
+
+    __slots__ = ("room_kinds", "characters", "items", "matchups", "weapon_ids", "checksum")
+
+    def __init__(self, width: int, height: int) -> None:
+        game_map = Map(Player(""), Random(0), width, height)
+        grid = game_map.rooms
+        self.room_kinds = grid.room_kinds
+        self.characters = grid.characters
+        self.items = grid.items
+        self.matchups: Matchups = game_map.engine.matchups
+        self.weapon_ids: dict[str, int] = {}
+        for item_id, item in enumerate(self.items):
+            if isinstance(item, Weapon):
+                self.weapon_ids.setdefault(item.name, item_id)
+        described = [repr(kind) for kind in self.room_kinds]
+        for character in self.characters:
+            weapon = character.weapon.name if isinstance(character, Enemy) else ""
+            dialogue = character.dialogue if isinstance(character, Friend) else ""
+            described.append(f"{type(character).__name__}:{character.name}:{weapon}:{dialogue}")
+        for item in self.items:
+            described.append(f"{type(item).__name__}:{item.name}:{getattr(item, 'can_kill', '')}")
+        self.checksum: int = zlib.crc32("\n".join(described).encode())
+
+
+@lru_cache(maxsize=None)
+def _tables(width: int, height: int) -> _Tables:
+    """Get the templates of the maps of a size, building them once."""
+    return _Tables(width, height)
+
+
+def _record_size(width: int, height: int) -> int:
+    """Get the bytes of one record of a map of a size."""
+    size = width * height
+    return HEAD.size + 11 * size + 3 * ((size + 7) >> 3)
+
+
+def _cells(cells: array) -> bytes:
+    """Get the little-endian bytes of an array of cells."""
+    if BIG_ENDIAN:
+        cells = array(cells.typecode, cells)
+        cells.byteswap()
+    return cells.tobytes()
+
+
+def _array(typecode: str, data: bytes) -> array:
+    """Create an array of cells from its little-endian bytes."""
+    cells = array(typecode, data)
+    if BIG_ENDIAN:
+        cells.byteswap()
+    return cells
+
+
+def _pack_into(buffer, offset: int, engine: Engine, tables: _Tables) -> None:
+    """Write the record of a game at an offset of a buffer."""
+    grid = engine.grid
+    player = engine.player
+    size = len(grid)
+    if len(player.weapons) > size:
+        raise ValueError("The player has more weapons than the record can hold.")
+    flags = USED
+    if engine.finished:
+        flags |= FINISHED
+    if engine.won:
+        flags |= WON
+    pending = engine.pending or (0, 0)
+    if engine.pending is not None:
+        flags |= PENDING
+    HEAD.pack_into(
+        buffer,
+        offset,
+        flags,
+        *player.current_room,
+        *pending,
+        len(player.weapons),
+        # Cut at a character, so that the name can be decoded again.
+        player.name.encode()[:32].decode(errors="ignore").encode(),
+    )
+    offset += HEAD.size
+    bitmap_length = (size + 7) >> 3
+    for data in (
+        _cells(grid.kind_ids),
+        _cells(grid.character_ids),
+        _cells(grid.item_ids),
+        grid.defeated.to_bytes(bitmap_length),
+        grid.picked_up.to_bytes(bitmap_length),
+        player.cleared_rooms.to_bytes(bitmap_length),
+        bytes(tables.weapon_ids[weapon.name] for weapon in player.weapons).ljust(size, b"\0"),
+    ):
+        buffer[offset : offset + len(data)] = data
+        offset += len(data)
+
+
+def _unpack_from(buffer, offset: int, width: int, height: int, tables: _Tables) -> Engine:
+    """Read the record of a game at an offset of a buffer."""
+    size = width * height
+    flags, x, y, pending_x, pending_y, weapons, name = HEAD.unpack_from(buffer, offset)
+    if not flags & USED:
+        raise KeyError("The slot is empty.")
+    offset += HEAD.size
+    bitmap_length = (size + 7) >> 3
+
+    def take(length: int) -> bytes:
+        nonlocal offset
+        offset += length
+        return bytes(buffer[offset - length : offset])
+
+    grid = Grid.__new__(Grid)
+    grid.width = width
+    grid.height = height
+    grid.room_kinds = tables.room_kinds
+    grid.characters = tables.characters
+    grid.items = tables.items
+    grid.kind_ids = _array("H", take(2 * size))
+    grid.character_ids = _array("i", take(4 * size))
+    grid.item_ids = _array("i", take(4 * size))
+    grid.defeated = Bitmap.from_bytes(take(bitmap_length), size)
+    grid.picked_up = Bitmap.from_bytes(take(bitmap_length), size)
+    grid.end = size - 1
+    grid.cleared_rooms_needed = size - 1
+    grid._views = {}
+    grid._owns_characters = True
+    player = Player(name.rstrip(b"\0").decode(), (x, y))
+    player.cleared_rooms = Bitmap.from_bytes(take(bitmap_length), size)
+    for item_id in take(size)[:weapons]:
+        template = tables.items[item_id]
+        assert isinstance(template, Weapon)
+        weapon = Weapon(template.name, template.can_kill)
+        weapon.picked_up = True
+        player.weapons.append(weapon)
+    engine = Engine(grid, player, tables.matchups)
+    engine.pending = (pending_x, pending_y) if flags & PENDING else None
+    engine.finished = bool(flags & FINISHED)
+    engine.won = bool(flags & WON)
+    return engine
+
+
+def _check_header(data, width: int | None = None, height: int | None = None) -> tuple:
+    """Read a header and check that this version of the game can use it.
+
+    The map size is only checked against the width and the height given.
+    """
+    magic, version, file_width, file_height, slots, checksum = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a snapshot file.")
+    if version != VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}.")
+    if width not in (None, file_width) or height not in (None, file_height):
+        raise ValueError(f"The snapshots are of {file_width}x{file_height} maps.")
+    if checksum != _tables(file_width, file_height).checksum:
+        raise ValueError("The snapshots were written by an incompatible game.")
+    return file_width, file_height, slots
+
+
+def dumps(engine: Engine) -> bytes:
+    """Save one game.
+
+    Args:
+        engine (Engine): The game, built by a Map.
+
+    Raises:
+        TypeError: If the game is played on a chunked world.
+
+    Returns:
+        bytes: The header and the record of the game.
+    """
+    if not isinstance(engine.grid, Grid):
+        raise TypeError("Only the games of fixed maps can be saved.")
+    width, height = engine.grid.width, engine.grid.height
+    tables = _tables(width, height)
+    data = bytearray(HEADER.size + _record_size(width, height))
+    HEADER.pack_into(data, 0, MAGIC, VERSION, width, height, 1, tables.checksum)
+    _pack_into(data, HEADER.size, engine, tables)
+    return bytes(data)
+
+
+def loads(data: bytes) -> Engine:
+    """Restore one game saved by dumps.
+
+    Args:
+        data (bytes): The saved game.
+
+    Raises:
+        ValueError: If the data is not a snapshot this game can read.
+
+    Returns:
+        Engine: The game.
+    """
+    width, height, _ = _check_header(data)
+    return _unpack_from(data, HEADER.size, width, height, _tables(width, height))
+
+
+def game_of(engine: Engine) -> Game:
+    """Wrap a restored game into a Game to play it in the terminal.
+
+    Args:
+        engine (Engine): The game.
+
+    Returns:
+        Game: The game with its map.
+    """
+    game_map = Map.__new__(Map)
+    game_map.rooms = engine.grid
+    game_map.player = engine.player
+    game_map.starting_room = engine.grid.room(0, 0)
+    game_map.engine = engine
+    game_map.autosave = None
+    game_map.slot = 0
+    game = Game.__new__(Game)
+    game.player = engine.player
+    game.seed = None
+    game.record = None
+    game.recorder = None
+    game.map = game_map
+    return game
+
+
+class SnapshotFile:
+    """Many saved games of one map size in a memory-mapped file.
+
+    Attributes:
+        path (str): The file.
+        width (int): The number of columns of the maps.
+        height (int): The number of rows of the maps.
+        slots (int): The number of sessions the file can hold.
+        record_size (int): The bytes of one session.
+
+    Methods:
+        save: Save a game into a slot.
+        restore: Restore the game of a slot.
+        used: Check if a slot holds a game.
+        clear: Empty a slot.
+        flush: Write the changes to the disk.
+        close: Close the file.
+    """
+
+    def __init__(
+        self, path: str, width: int | None = None, height: int | None = None, slots: int = 1024
+    ) -> None:
+        """Open a snapshot file, creating it if it does not exist.
+
+        An existing file keeps the map size of its header; a width or a
+        height given must match it.
+
+        Args:
+            path (str): The file.
+            width (int | None): The number of columns of the maps, 3 for a
+                new file if not given.
+            height (int | None): The number of rows of the maps, 3 for a
+                new file if not given.
+            slots (int): The number of sessions of a new file.
+
+        Raises:
+            ValueError: If an existing file can not be used.
+        """
+        self.path: str = path
+        if not os.path.exists(path):
+            width = 3 if width is None else width
+            height = 3 if height is None else height
+            tables = _tables(width, height)
+            with open(path, "wb") as file:
+                file.write(HEADER.pack(MAGIC, VERSION, width, height, slots, tables.checksum))
+                file.truncate(HEADER.size + slots * _record_size(width, height))
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        try:
+            self.width, self.height, self.slots = _check_header(self._map, width, height)
+        except ValueError:
+            self.close()
+            raise
+        self.record_size: int = _record_size(self.width, self.height)
+        self._tables = _tables(self.width, self.height)
+
+    def _offset(self, slot: int) -> int:
+        """Get the offset of the record of a slot."""
+        if not 0 <= slot < self.slots:
+            raise IndexError(f"There is no slot {slot}.")
+        return HEADER.size + slot * self.record_size
+
+    def save(self, slot: int, engine: Engine) -> None:
+        """Save a game into a slot.
+
+        Args:
+            slot (int): The slot.
+            engine (Engine): The game, built by a Map of the file's size.
+        """
+        if (engine.grid.width, engine.grid.height) != (self.width, self.height):
+            raise ValueError(f"The snapshots are of {self.width}x{self.height} maps.")
+        _pack_into(self._map, self._offset(slot), engine, self._tables)
+
+    def restore(self, slot: int) -> Engine:
+        """Restore the game of a slot.
+
+        Args:
+            slot (int): The slot.
+
+        Raises:
+            KeyError: If the slot is empty.
+
+        Returns:
+            Engine: The game.
+        """
+        return _unpack_from(self._map, self._offset(slot), self.width, self.height, self._tables)
+
+    def used(self, slot: int) -> bool:
+        """Check if a slot holds a game."""
+        return bool(self._map[self._offset(slot)] & USED)
+
+    def clear(self, slot: int) -> None:
+        """Empty a slot."""
+        self._map[self._offset(slot)] = 0
+
+    def flush(self) -> None:
+        """Write the changes to the disk."""
+        self._map.flush()
+
+    def close(self) -> None:
+        """Close the file."""
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> SnapshotFile:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+
+def _played(seed: int, width: int, height: int, moves: int) -> Engine:
+    """Play a few random moves of a new game, fighting with the first weapon."""
+    rng = Random(seed)
+    engine = Map(Player("Bench"), rng, width, height).engine
+    for _ in range(moves):
+        if engine.finished:
+            break
+        engine.move(rng.choice(list(CHANGE)))
+        if engine.pending is not None:
+            engine.fight(rng.randrange(len(engine.player.weapons)))
+    return engine
+
+
+def bench(sessions: int, width: int = 3, height: int = 3) -> dict[str, float]:
+    """Compare saving and restoring games with a snapshot file and with pickle.
+
+    Args:
+        sessions (int): The number of games.
+        width (int): The number of columns of the maps.
+        height (int): The number of rows of the maps.
+
+    Returns:
+        dict[str, float]: The saves and restores per second and the bytes per game.
+    """
+    engines = [_played(seed, width, height, 10) for seed in range(sessions)]
+    path = f"bench-{os.getpid()}.snapshots"
+    stats = {}
+    try:
+        with SnapshotFile(path, width, height, sessions) as snapshots:
+            began = time.perf_counter()
+            for slot, engine in enumerate(engines):
+                snapshots.save(slot, engine)
+            stats["snapshot_saves_per_sec"] = sessions / (time.perf_counter() - began)
+            began = time.perf_counter()
+            for slot in range(sessions):
+                snapshots.restore(slot)
+            stats["snapshot_restores_per_sec"] = sessions / (time.perf_counter() - began)
+            stats["snapshot_bytes"] = snapshots.record_size
+    finally:
+        os.remove(path)
+    began = time.perf_counter()
+    pickled = [pickle.dumps(engine, pickle.HIGHEST_PROTOCOL) for engine in engines]
+    stats["pickle_saves_per_sec"] = sessions / (time.perf_counter() - began)
+    began = time.perf_counter()
+    for data in pickled:
+        pickle.loads(data)
+    stats["pickle_restores_per_sec"] = sessions / (time.perf_counter() - began)
+    stats["pickle_bytes"] = sum(map(len, pickled)) / sessions
+    return stats
+
+
+def main() -> None:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark saving games.")
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--width", type=int, default=3)
+    parser.add_argument("--height", type=int, default=3)
+    args = parser.parse_args()
+    for name, value in bench(args.sessions, args.width, args.height).items():
+        print(f"{name}: {value:.0f}")
+
+
+if __name__ == "__main__":
+    main()
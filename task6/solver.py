@@ -0,0 +1,387 @@
+"""A solver of the game: is a map winnable, and by which route.
+
+Clearing rooms and picking up weapons can only add to what the player can
+do, so the rooms that can ever be cleared are found by flooding the map
+again each time the player gets a new weapon. If the end room is still
+out of reach, that is the proof the map is not winnable.
+
+The shortest route is found by a breadth-first search over (position,
+cleared rooms) with the weapons derived from the cleared rooms, memoizing
+every visited state. It is exponential in the number of rooms, so bigger
+maps get the route of the flood instead, which is valid but not the
+shortest.
+
+Usage:
+    python solver.py --width 3 --height 3 --seed 1
+
+classes:
+    Solution
+
+functions:
+    solve
+    solvable
+"""
+from __future__ import annotations
+
+import argparse
+from collections import deque
+from random import Random
+
+from assets import Enemy, Player, Weapon
+from engine import Engine
+from grid import CHANGE, Grid
+from main import Map
+
+Command = tuple[str, object]
+
+DIRECTIONS = {change: direction for direction, change in CHANGE.items()}
+
+
+class Solution:
+    """The result of solving a game.
+
+    Attributes:
+        solvable (bool): Whether the game can be won.
+        commands (list[Command]): The commands that win the game, empty if it
+            cannot be won.
+        moves (int): The number of moves in the commands.
+        optimal (bool): Whether no route has fewer moves.
+        blocked (list[tuple[int, int]]): The rooms that can never be cleared.
+    """
+
+    def __init__(
+        self,
+        solvable: bool,
+        commands: list[Command],
+        optimal: bool,
+        blocked: list[tuple[int, int]],
+    ) -> None:
+        self.solvable: bool = solvable
+        self.commands: list[Command] = commands
+        self.moves: int = sum(1 for command, _ in commands if command == "move")
+        self.optimal: bool = optimal
+        self.blocked: list[tuple[int, int]] = blocked
+
+    def __repr__(self) -> str:
+        return (
+            f"Solution(solvable={self.solvable}, moves={self.moves}, "
+            f"optimal={self.optimal}, blocked={len(self.blocked)})"
+        )
+
+
+class _Rules:
+    """The map compiled into flat lists for the search."""
+
+    def __init__(self, grid: Grid, player: Player) -> None:
+        self.grid = grid
+        self.size = len(grid)
+        kinds: dict[tuple[str, str], int] = {}
+
+        def kind(weapon: Weapon) -> int:
+            return 1 << kinds.setdefault((weapon.name, weapon.can_kill), len(kinds))
+
+        self.held = 0
+        for weapon in player.weapons:
+            self.held |= kind(weapon)
+        self.cleared = bytearray(
+            player.has_cleared(index) for index in range(self.size)
+        )
+        self.gives = [0] * self.size
+        self.enemy: list[str | None] = [None] * self.size
+        self.cake = bytearray(self.size)
+        for index in range(self.size):
+            item = grid.item(index)
+            if item is not None and not grid.picked_up.get(index):
+                if isinstance(item, Weapon):
+                    self.gives[index] = kind(item)
+                elif item.name == "cake":
+                    self.cake[index] = 1
+            character = grid.character(index)
+            if isinstance(character, Enemy) and not grid.defeated.get(index):
+                self.enemy[index] = character.weapon.name
+        self.beats: dict[str, int] = {}
+        for (_, can_kill), bit in kinds.items():
+            self.beats[can_kill] = self.beats.get(can_kill, 0) | 1 << bit
+        self.needs = [
+            0 if name is None else self.beats.get(name, 0) for name in self.enemy
+        ]
+
+    def neighbours(self, index: int) -> list[int]:
+        """Get the indices of the neighbouring cells."""
+        width = self.grid.width
+        x = index % width
+        cells = []
+        if index >= width:
+            cells.append(index - width)
+        if index + width < self.size:
+            cells.append(index + width)
+        if x > 0:
+            cells.append(index - 1)
+        if x < width - 1:
+            cells.append(index + 1)
+        return cells
+
+    def can_enter(self, index: int, weapons: int, cleared_count: int) -> bool:
+        """Check if an uncleared cell can be entered."""
+        if index == self.grid.end and cleared_count < self.grid.cleared_rooms_needed:
+            return False
+        return self.enemy[index] is None or bool(self.needs[index] & weapons)
+
+
+def _flood(rules: _Rules, start: int) -> tuple[list[int], bool]:
+    """Clear every room that can ever be cleared, walking depth-first.
+
+    Args:
+        rules (_Rules): The compiled map.
+        start (int): The cell of the player.
+
+    Returns:
+        tuple[list[int], bool]: The walk through the cells and whether it
+            ends by winning.
+    """
+    cleared = bytearray(rules.cleared)
+    count = sum(cleared)
+    weapons = rules.held
+    walk: list[int] = []
+    while True:
+        before = weapons
+        seen = bytearray(rules.size)
+        seen[start] = 1
+        stack = [(start, rules.neighbours(start))]
+        while stack:
+            cell, cells = stack[-1]
+            if not cells:
+                stack.pop()
+                if stack:
+                    walk.append(stack[-1][0])
+                continue
+            near = cells.pop()
+            if seen[near]:
+                continue
+            if not cleared[near]:
+                if near == rules.grid.end or not rules.can_enter(near, weapons, count):
+                    continue
+                cleared[near] = 1
+                count += 1
+                weapons |= rules.gives[near]
+            seen[near] = 1
+            walk.append(near)
+            if rules.cake[near]:
+                return walk, True
+            stack.append((near, rules.neighbours(near)))
+        if weapons == before:
+            break
+    end = rules.grid.end
+    rules.cleared = cleared
+    if cleared[end] or not rules.can_enter(end, weapons, count):
+        return walk, False
+    parents = {start: start}
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        if end in rules.neighbours(cell):
+            path = [end]
+            while cell != start:
+                path.append(cell)
+                cell = parents[cell]
+            walk.extend(reversed(path))
+            return walk, bool(rules.cake[end])
+        for near in rules.neighbours(cell):
+            if cleared[near] and near not in parents:
+                parents[near] = cell
+                queue.append(near)
+    return walk, False
+
+
+def _shortest(rules: _Rules, start: int) -> list[int] | None:
+    """Find the shortest walk that wins, searching (position, cleared rooms).
+
+    Args:
+        rules (_Rules): The compiled map.
+        start (int): The cell of the player.
+
+    Returns:
+        list[int] | None: The cells to move to, None if the game cannot be won.
+    """
+    size = rules.size
+    mask = 0
+    for index in range(size):
+        if rules.cleared[index]:
+            mask |= 1 << index
+    neighbours = [rules.neighbours(index) for index in range(size)]
+    enemy, needs, gives, cake = rules.enemy, rules.needs, rules.gives, rules.cake
+    end, needed = rules.grid.end, rules.grid.cleared_rooms_needed
+    first = mask * size + start
+    parents = {first: -1}
+    queue = deque([(mask, start, rules.held, bin(mask).count("1"))])
+    while queue:
+        mask, cell, weapons, count = queue.popleft()
+        key = mask * size + cell
+        for near in neighbours[cell]:
+            bit = 1 << near
+            if mask & bit:
+                state = key - cell + near
+                if state not in parents:
+                    parents[state] = key
+                    queue.append((mask, near, weapons, count))
+                continue
+            if near == end and count < needed:
+                continue
+            if enemy[near] is not None and not needs[near] & weapons:
+                continue
+            if cake[near]:
+                path = [near]
+                while key != first:
+                    path.append(key % size)
+                    key = parents[key]
+                return path[::-1]
+            state = (mask | bit) * size + near
+            if state not in parents:
+                parents[state] = key
+                queue.append((mask | bit, near, weapons | gives[near], count + 1))
+    return None
+
+
+def _commands(rules: _Rules, player: Player, start: int, walk: list[int]) -> list[Command]:
+    """Turn a walk into the commands for the engine.
+
+    Args:
+        rules (_Rules): The compiled map.
+        player (Player): The player character.
+        start (int): The cell of the player.
+        walk (list[int]): The cells to move to.
+
+    Returns:
+        list[Command]: The moves and the fights.
+    """
+    grid = rules.grid
+    weapons = [weapon.can_kill for weapon in player.weapons]
+    cleared = set()
+    commands: list[Command] = []
+    x, y = grid.position(start)
+    for cell in walk:
+        near_x, near_y = grid.position(cell)
+        commands.append(("move", DIRECTIONS[(near_x - x, near_y - y)]))
+        x, y = near_x, near_y
+        if player.has_cleared(cell) or cell in cleared:
+            continue
+        cleared.add(cell)
+        if rules.enemy[cell] is not None:
+            commands.append(("fight", weapons.index(rules.enemy[cell])))
+        item = grid.item(cell)
+        if isinstance(item, Weapon) and not grid.picked_up.get(cell):
+            weapons.append(item.can_kill)
+    return commands
+
+
+def solve(engine: Engine, exact_limit: int = 12) -> Solution:
+    """Solve the game from its current state.
+
+    Args:
+        engine (Engine): The game to solve. It is not changed.
+        exact_limit (int): The biggest number of rooms to find the shortest
+            route for. Bigger maps get a valid route that may be longer.
+
+    Returns:
+        Solution: Whether the game can be won, and how.
+    """
+    grid = engine.grid
+    player = engine.player
+    rules = _Rules(grid, player)
+    start = grid.index(*player.current_room)
+    commands: list[Command] = [("decline", None)] if engine.pending else []
+    if len(grid) <= exact_limit:
+        walk = _shortest(rules, start)
+        if walk is not None:
+            return Solution(True, commands + _commands(rules, player, start, walk), True, [])
+    walk, won = _flood(rules, start)
+    blocked = [
+        grid.position(index)
+        for index in range(len(grid))
+        if not rules.cleared[index] and index != grid.end
+    ]
+    if not won:
+        return Solution(False, [], True, blocked)
+    return Solution(True, commands + _commands(rules, player, start, walk), False, blocked)
+
+
+def solvable(engine: Engine) -> bool:
+    """Check if the game can be won from its current state, without a route.
+
+    The rooms are flooded once, like in the route of the flood, but a room
+    whose enemy can not be beaten yet waits until a new weapon is picked up
+    instead of flooding the map again, so the check is linear in the rooms.
+
+    Args:
+        engine (Engine): The game to check. It is not changed.
+
+    Returns:
+        bool: True if the game can be won, False otherwise.
+    """
+    grid = engine.grid
+    rules = _Rules(grid, engine.player)
+    cleared = rules.cleared
+    count = sum(cleared)
+    weapons = tried = rules.held
+    start = grid.index(*engine.player.current_room)
+    seen = bytearray(rules.size)
+    seen[start] = 1
+    stack = [start]
+    waiting: list[int] = []
+    while True:
+        while stack:
+            for near in rules.neighbours(stack.pop()):
+                if seen[near] or near == grid.end:
+                    continue
+                if not cleared[near]:
+                    if not rules.can_enter(near, weapons, count):
+                        waiting.append(near)
+                        continue
+                    cleared[near] = 1
+                    count += 1
+                    weapons |= rules.gives[near]
+                    if rules.cake[near]:
+                        return True
+                seen[near] = 1
+                stack.append(near)
+        if weapons == tried:
+            break
+        tried = weapons
+        # The waiting rooms are next to seen ones, so they are tried again.
+        blocked, waiting = waiting, []
+        for cell in blocked:
+            if not seen[cell] and rules.can_enter(cell, weapons, count):
+                seen[cell] = 1
+                cleared[cell] = 1
+                count += 1
+                weapons |= rules.gives[cell]
+                if rules.cake[cell]:
+                    return True
+                stack.append(cell)
+            elif not seen[cell]:
+                waiting.append(cell)
+    end = grid.end
+    return (
+        bool(rules.cake[end])
+        and not cleared[end]
+        and rules.can_enter(end, weapons, count)
+        and any(seen[near] for near in rules.neighbours(end))
+    )
+
+
+def main() -> None:
+    """Solve a generated map from the command line."""
+    parser = argparse.ArgumentParser(description="Solve a generated map.")
+    parser.add_argument("--width", type=int, default=3)
+    parser.add_argument("--height", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    engine = Map(Player("Solver"), Random(args.seed), args.width, args.height).engine
+    solution = solve(engine)
+    print(solution)
+    if solution.solvable and len(solution.commands) <= 50:
+        print(" ".join(f"{command} {argument}" for command, argument in solution.commands))
+
+
+if __name__ == "__main__":
+    main()
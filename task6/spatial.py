@@ -0,0 +1,427 @@
+"""A spatial index of a map answering "nearest" queries without a search.
+
+The index keeps a distance field for every kind of target: the undefeated
+enemies, the unpicked weapons of each name and the end room. A field
+holds, for every cell, the number of moves to the nearest target and
+which target that is, so the nearest target is a lookup and the shortest
+path to it is a walk down the field.
+
+The fields are built once with a breadth-first search from all the
+targets at the same time. When an enemy is defeated or an item picked
+up, only the cells whose nearest target it was are searched again, from
+the cells around them.
+
+Usage:
+    python spatial.py --width 100 --height 100 --seed 1
+
+classes:
+    Field
+    SpatialIndex
+    Indexed
+
+functions:
+    track
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import time
+from array import array
+from collections import deque
+from random import Random
+
+from assets import Enemy, Player, Weapon
+from engine import FIGHT_WON, PICKED_UP, Engine, Event
+from grid import CHANGE, NONE, Grid
+from main import Map
+
+ENEMY = "enemy"
+END = "end"
+
+DIRECTIONS = {change: direction for direction, change in CHANGE.items()}
+
+
+class Field:
+    """The distances from every cell to the nearest of a set of targets.
+
+    Attributes:
+        distance (array): The moves from each cell to its nearest target,
+            NONE if no target can be reached.
+        nearest (array): The index of the nearest target of each cell, NONE
+            if no target can be reached.
+        targets (set[int]): The indices of the targets.
+    """
+
+    __slots__ = ("distance", "nearest", "targets")
+
+    def __init__(self, size: int) -> None:
+        self.distance = array("i", [NONE]) * size
+        self.nearest = array("i", [NONE]) * size
+        self.targets: set[int] = set()
+
+
+class SpatialIndex:
+    """Distance fields of the enemies, the weapons and the end room of a grid.
+
+    Attributes:
+        grid (Grid): The indexed grid.
+        fields (dict[str, Field]): The fields by kind of target: ENEMY, END
+            and the name of every weapon.
+        updated (int): The number of cells searched again by updates.
+
+    Methods:
+        distance: Get the moves to the nearest target of a kind.
+        nearest: Get the position of the nearest target of a kind.
+        path: Get the directions to the nearest target of a kind.
+        nearest_enemy: Get the nearest undefeated enemy.
+        nearest_weapon: Get the nearest unpicked weapon of a name.
+        path_to_end: Get the directions to the end room.
+        refresh: Drop the targets of a cell that are gone.
+    """
+
+    def __init__(self, grid: Grid) -> None:
+        self.grid = grid
+        self.updated: int = 0
+        width, size = grid.width, len(grid)
+        self._neighbours: list[tuple[int, ...]] = [
+            tuple(
+                near
+                for near, inside in (
+                    (index - width, index >= width),
+                    (index + width, index + width < size),
+                    (index - 1, index % width > 0),
+                    (index + 1, index % width < width - 1),
+                )
+                if inside
+            )
+            for index in range(size)
+        ]
+        targets: dict[str, list[int]] = {ENEMY: [], END: [grid.end]}
+        for index in range(size):
+            character = grid.character(index)
+            if isinstance(character, Enemy) and not grid.defeated.get(index):
+                targets[ENEMY].append(index)
+            item = grid.item(index)
+            if isinstance(item, Weapon) and not grid.picked_up.get(index):
+                targets.setdefault(item.name, []).append(index)
+        self.fields: dict[str, Field] = {}
+        for kind, cells in targets.items():
+            self.fields[kind] = field = Field(size)
+            self._build(field, cells)
+
+    def _build(self, field: Field, targets: list[int]) -> None:
+        """Fill a field with a breadth-first search from all its targets."""
+        distance, nearest, neighbours = field.distance, field.nearest, self._neighbours
+        queue = deque(targets)
+        for target in targets:
+            distance[target] = 0
+            nearest[target] = target
+            field.targets.add(target)
+        while queue:
+            cell = queue.popleft()
+            step = distance[cell] + 1
+            for near in neighbours[cell]:
+                if distance[near] == NONE:
+                    distance[near] = step
+                    nearest[near] = nearest[cell]
+                    queue.append(near)
+
+    def _remove(self, field: Field, target: int) -> None:
+        """Drop a target and search again the cells it was the nearest of.
+
+        Those cells are connected, since each one got the target from a
+        neighbour. They are emptied and filled again from the cells around
+        them, nearest first.
+        """
+        distance, nearest, neighbours = field.distance, field.nearest, self._neighbours
+        field.targets.discard(target)
+        orphans = [target]
+        nearest[target] = NONE
+        for cell in orphans:
+            for near in neighbours[cell]:
+                if nearest[near] == target:
+                    nearest[near] = NONE
+                    orphans.append(near)
+        heap = []
+        for cell in orphans:
+            distance[cell] = NONE
+            for near in neighbours[cell]:
+                if nearest[near] != NONE:
+                    heap.append((distance[near] + 1, cell, nearest[near]))
+        heapq.heapify(heap)
+        while heap:
+            step, cell, source = heapq.heappop(heap)
+            if distance[cell] != NONE:
+                continue
+            distance[cell] = step
+            nearest[cell] = source
+            for near in neighbours[cell]:
+                if distance[near] == NONE:
+                    heapq.heappush(heap, (step + 1, near, source))
+        self.updated += len(orphans)
+
+    def distance(self, kind: str, x: int, y: int) -> int | None:
+        """Get the moves to the nearest target of a kind.
+
+        Args:
+            kind (str): ENEMY, END or the name of a weapon.
+            x (int): The column to measure from.
+            y (int): The row to measure from.
+
+        Returns:
+            int | None: The number of moves, None if there is no such target.
+        """
+        field = self.fields.get(kind)
+        if field is None:
+            return None
+        moves = field.distance[self.grid.index(x, y)]
+        return None if moves == NONE else moves
+
+    def nearest(self, kind: str, x: int, y: int) -> tuple[int, int] | None:
+        """Get the position of the nearest target of a kind.
+
+        Args:
+            kind (str): ENEMY, END or the name of a weapon.
+            x (int): The column to look from.
+            y (int): The row to look from.
+
+        Returns:
+            tuple[int, int] | None: The position, None if there is no such target.
+        """
+        field = self.fields.get(kind)
+        if field is None:
+            return None
+        target = field.nearest[self.grid.index(x, y)]
+        return None if target == NONE else self.grid.position(target)
+
+    def path(self, kind: str, x: int, y: int) -> list[str] | None:
+        """Get the directions to the nearest target of a kind.
+
+        Args:
+            kind (str): ENEMY, END or the name of a weapon.
+            x (int): The column to start from.
+            y (int): The row to start from.
+
+        Returns:
+            list[str] | None: The directions to move in, None if there is
+                no such target.
+        """
+        field = self.fields.get(kind)
+        if field is None:
+            return None
+        grid, distance, neighbours = self.grid, field.distance, self._neighbours
+        cell = grid.index(x, y)
+        if distance[cell] == NONE:
+            return None
+        directions = []
+        while distance[cell]:
+            cell_x, cell_y = grid.position(cell)
+            cell = next(near for near in neighbours[cell] if distance[near] == distance[cell] - 1)
+            near_x, near_y = grid.position(cell)
+            directions.append(DIRECTIONS[(near_x - cell_x, near_y - cell_y)])
+        return directions
+
+    def nearest_enemy(self, x: int, y: int) -> tuple[tuple[int, int], int] | None:
+        """Get the nearest undefeated enemy.
+
+        Args:
+            x (int): The column to look from.
+            y (int): The row to look from.
+
+        Returns:
+            tuple[tuple[int, int], int] | None: The position of the enemy
+                and the moves to it, None if every enemy is defeated.
+        """
+        position = self.nearest(ENEMY, x, y)
+        return None if position is None else (position, self.distance(ENEMY, x, y))
+
+    def nearest_weapon(self, name: str, x: int, y: int) -> tuple[tuple[int, int], int] | None:
+        """Get the nearest unpicked weapon of a name.
+
+        Args:
+            name (str): The name of the weapon.
+            x (int): The column to look from.
+            y (int): The row to look from.
+
+        Returns:
+            tuple[tuple[int, int], int] | None: The position of the weapon
+                and the moves to it, None if there is no such weapon left.
+        """
+        position = self.nearest(name, x, y)
+        return None if position is None else (position, self.distance(name, x, y))
+
+    def path_to_end(self, x: int, y: int) -> list[str]:
+        """Get the directions of a shortest path to the end room.
+
+        Args:
+            x (int): The column to start from.
+            y (int): The row to start from.
+
+        Returns:
+            list[str]: The directions to move in.
+        """
+        return self.path(END, x, y) or []
+
+    def refresh(self, index: int) -> None:
+        """Drop the targets of a cell whose enemy was defeated or item picked up.
+
+        Args:
+            index (int): The index of the cell.
+        """
+        grid = self.grid
+        field = self.fields[ENEMY]
+        if index in field.targets and grid.defeated.get(index):
+            self._remove(field, index)
+        item = grid.item(index)
+        if isinstance(item, Weapon) and grid.picked_up.get(index):
+            field = self.fields[item.name]
+            if index in field.targets:
+                self._remove(field, index)
+
+
+class Indexed:
+    """An engine that keeps a spatial index up to date with its game.
+
+    Everything else is passed through to the engine, so it can be used
+    wherever the engine is.
+
+    Attributes:
+        engine (Engine): The game.
+        spatial (SpatialIndex): The index of the game's grid.
+
+    Methods:
+        move: Move in a direction.
+        enter: Enter a room.
+        fight: Fight the pending enemy.
+    """
+
+    def __init__(self, engine: Engine, spatial: SpatialIndex) -> None:
+        self.engine = engine
+        self.spatial: SpatialIndex = spatial
+
+    def __getattr__(self, name: str) -> object:
+        return getattr(self.engine, name)
+
+    def _update(self, events: list[Event]) -> list[Event]:
+        """Refresh the cell of the player if something was defeated or picked up."""
+        for event in events:
+            if event.kind == FIGHT_WON or event.kind == PICKED_UP:
+                self.spatial.refresh(self.engine.grid.index(*self.engine.player.current_room))
+                break
+        return events
+
+    def move(self, direction: str) -> list[Event]:
+        """Move in a direction, see Engine.move."""
+        return self._update(self.engine.move(direction))
+
+    def enter(self, room_id: tuple[int, int]) -> list[Event]:
+        """Enter a room, see Engine.enter."""
+        return self._update(self.engine.enter(room_id))
+
+    def fight(self, weapon_id: int) -> list[Event]:
+        """Fight the pending enemy, see Engine.fight."""
+        return self._update(self.engine.fight(weapon_id))
+
+
+def track(game_map: Map) -> SpatialIndex:
+    """Index a map's grid and keep the index up to date as the game goes on.
+
+    Args:
+        game_map (Map): The map whose engine to wrap.
+
+    Returns:
+        SpatialIndex: The index.
+    """
+    spatial = SpatialIndex(game_map.engine.grid)
+    game_map.engine = Indexed(game_map.engine, spatial)
+    return spatial
+
+
+def _search(grid: Grid, x: int, y: int, kind: str) -> int | None:
+    """Find the moves to the nearest target with a fresh breadth-first search."""
+    start = grid.index(x, y)
+    seen = {start: 0}
+    queue = deque([(x, y)])
+    while queue:
+        x, y = queue.popleft()
+        index = grid.index(x, y)
+        character, item = grid.character(index), grid.item(index)
+        if (
+            (kind == ENEMY and isinstance(character, Enemy) and not grid.defeated.get(index))
+            or (kind == END and index == grid.end)
+            or (isinstance(item, Weapon) and item.name == kind and not grid.picked_up.get(index))
+        ):
+            return seen[index]
+        for near in grid.neighbours(x, y).values():
+            near_index = grid.index(*near)
+            if near_index not in seen:
+                seen[near_index] = seen[index] + 1
+                queue.append(near)
+    return None
+
+
+def bench(width: int, height: int, seed: int = 0, queries: int = 1000) -> dict[str, float]:
+    """Compare the queries of the index with fresh searches.
+
+    Args:
+        width (int): The number of columns of the map.
+        height (int): The number of rows of the map.
+        seed (int): The seed of the map.
+        queries (int): The number of queries of each kind.
+
+    Returns:
+        dict[str, float]: The microseconds of building the index, of a
+            query, of a fresh search and of an update.
+    """
+    grid = Map(Player("Bench"), Random(seed), width, height).rooms
+    began = time.perf_counter()
+    spatial = SpatialIndex(grid)
+    build = time.perf_counter() - began
+    rng = Random(seed)
+    cells = [(rng.randrange(width), rng.randrange(height)) for _ in range(queries)]
+    kinds = [ENEMY, END, *(kind for kind in spatial.fields if kind not in (ENEMY, END))]
+    began = time.perf_counter()
+    for kind in kinds:
+        for x, y in cells:
+            spatial.distance(kind, x, y)
+    indexed = (time.perf_counter() - began) / (len(kinds) * queries)
+    searched_cells = cells[: max(1, queries // 100)]
+    began = time.perf_counter()
+    for kind in kinds:
+        for x, y in searched_cells:
+            assert _search(grid, x, y, kind) == spatial.distance(kind, x, y)
+    searched = (time.perf_counter() - began) / (len(kinds) * len(searched_cells))
+    enemies = list(spatial.fields[ENEMY].targets)
+    rng.shuffle(enemies)
+    enemies = enemies[: max(1, len(enemies) // 10)]
+    began = time.perf_counter()
+    for index in enemies:
+        grid.defeat(index)
+        spatial.refresh(index)
+    update = (time.perf_counter() - began) / max(1, len(enemies))
+    for x, y in searched_cells:
+        assert _search(grid, x, y, ENEMY) == spatial.distance(ENEMY, x, y)
+    return {
+        "build_us": build * 1e6,
+        "query_us": indexed * 1e6,
+        "search_us": searched * 1e6,
+        "update_us": update * 1e6,
+        "cells_per_update": spatial.updated / max(1, len(enemies)),
+    }
+
+
+def main() -> None:
+    """Compare the index with fresh searches on a generated map."""
+    parser = argparse.ArgumentParser(description="Benchmark the spatial index.")
+    parser.add_argument("--width", type=int, default=100)
+    parser.add_argument("--height", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+    for name, value in bench(args.width, args.height, args.seed, args.queries).items():
+        print(f"{name}: {value:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,516 @@
+"""Compact deltas of the state of a game for remote clients.
+
+A client that shows a game played somewhere else does not need the whole
+map after every command: only the player's room and the few cells that
+changed. A StateSync numbers the versions of the state of one session and
+keeps the cells each version changed, so it can tell a client everything
+that changed since the last version the client acknowledged. A delta
+holds the player's room, the flags of the game, the cells whose cleared,
+defeated and picked up bits flipped and the new weapons. When the client
+is further behind than the kept history, or a delta would not be smaller,
+the full state is sent instead.
+
+The bitmaps of the game are compared with copies taken at the last
+version. A copy shares the bytes until the game changes them, so a
+command that changes nothing costs no comparison at all.
+
+Deltas are binary, with the numbers as unsigned LEB128 varints and the
+cells of a bitmap as gaps between their sorted indices:
+
+    kind (B), base version (I), version (I)
+    flags (varint): 1 waiting for a fight, 2 finished, 4 won
+    room (2 varints), the pending room (2 varints) if waiting for a fight
+    a delta: for cleared, defeated and picked up, the number of flipped
+        cells and their gaps
+    a full state: the width and the height, and the three bitmaps as
+        (width * height + 7) // 8 bytes each
+    the number of weapons and their names, as a length and UTF-8 bytes
+
+Usage:
+    python sync.py --sizes 3 10 30 100 --turns 2000
+
+classes:
+    StateSync
+    Mirror
+
+functions:
+    bench
+"""
+from __future__ import annotations
+
+import argparse
+import struct
+import time
+from collections import deque
+from io import StringIO
+from random import Random
+
+from assets import Bitmap, Player
+from engine import Engine
+from grid import CHANGE, Grid
+from main import Map
+from renderer import CLEARED, PLAYER, UNCLEARED, Renderer
+from simulate import greedy_policy
+
+FULL = 0
+DELTA = 1
+FRAME = struct.Struct("<BII")
+
+PENDING = 1
+FINISHED = 2
+WON = 4
+
+
+def _put(out: bytearray, value: int) -> None:
+    """Write an unsigned varint."""
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get(data: bytes, offset: int) -> tuple[int, int]:
+    """Read an unsigned varint, returning it and the offset after it."""
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _size(value: int) -> int:
+    """Get the bytes of an unsigned varint."""
+    return max(1, (value.bit_length() + 6) // 7)
+
+
+def _indices(mask: int) -> list[int]:
+    """Get the indices of the set bits of a mask, lowest first."""
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+
+class _Change:
+    """The cells and weapons one version of a game changed."""
+
+    __slots__ = ("version", "flipped", "weapons")
+
+    def __init__(self, version: int, flipped: list[int], weapons: list[str]) -> None:
+        self.version: int = version
+        self.flipped: list[int] = flipped
+        self.weapons: list[str] = weapons
+
+
+class StateSync:
+    """The versions of the state of one game, for a remote client.
+
+    Attributes:
+        engine (Engine): The game.
+        version (int): The version of the state, 0 for the state it started with.
+        acked (int): The last version the client acknowledged.
+        history (deque[_Change]): The changes of the versions after the
+            acknowledged one, at most as many as the history size.
+
+    Methods:
+        commit: Number the changes since the last version.
+        ack: Acknowledge that the client has a version.
+        delta: Get the changes since a version.
+        snapshot: Get the full state.
+    """
+
+    def __init__(self, engine: Engine, history: int = 64) -> None:
+        """Start the versions at the current state of a game.
+
+        Args:
+            engine (Engine): The game.
+            history (int): The number of versions to keep the changes of.
+                A client further behind gets the full state.
+
+        Raises:
+            TypeError: If the game is played on a chunked world.
+        """
+        if not isinstance(engine.grid, Grid):
+            raise TypeError("Only the states of games of fixed maps can be sent.")
+        self.engine: Engine = engine
+        self.version: int = 0
+        self.acked: int = 0
+        self.history: deque[_Change] = deque(maxlen=history)
+        bitmaps = self._bitmaps()
+        self._seen: list[Bitmap] = [bitmap.copy() for bitmap in bitmaps]
+        self._bits: list[int] = [bitmap.as_int() for bitmap in bitmaps]
+        self._weapons: int = 0
+        self._names: int = 0
+        self._add([weapon.name for weapon in engine.player.weapons])
+        self._head: tuple = self._state()
+
+    def _bitmaps(self) -> tuple[Bitmap, Bitmap, Bitmap]:
+        """Get the cleared, defeated and picked up bitmaps of the game."""
+        engine = self.engine
+        return engine.player.cleared_rooms, engine.grid.defeated, engine.grid.picked_up
+
+    def _add(self, names: list[str]) -> None:
+        """Count new weapons and the bytes of their names in the full state."""
+        self._weapons += len(names)
+        for name in names:
+            length = len(name.encode())
+            self._names += _size(length) + length
+
+    def _state(self) -> tuple:
+        """Get the flags, the room and the pending room of the game."""
+        engine = self.engine
+        flags = (
+            (PENDING if engine.pending is not None else 0)
+            | (FINISHED if engine.finished else 0)
+            | (WON if engine.won else 0)
+        )
+        return flags, engine.player.current_room, engine.pending
+
+    def commit(self) -> int:
+        """Number the changes since the last version as a new version.
+
+        Returns:
+            int: The current version, the same as before if nothing changed.
+        """
+        flipped = [0, 0, 0]
+        for i, bitmap in enumerate(self._bitmaps()):
+            # The copy shares the bytes until the game changes the bitmap.
+            if bitmap.shares(self._seen[i]):
+                continue
+            bits = bitmap.as_int()
+            flipped[i] = bits ^ self._bits[i]
+            self._bits[i] = bits
+            self._seen[i] = bitmap.copy()
+        weapons = self.engine.player.weapons
+        head = self._state()
+        if len(weapons) < self._weapons:
+            # A delta only adds weapons, so every client needs the full state.
+            self._weapons = self._names = 0
+            self._add([weapon.name for weapon in weapons])
+            self._head = head
+            self.version += 1
+            self.history.clear()
+            return self.version
+        added = [weapon.name for weapon in weapons[self._weapons :]]
+        self._add(added)
+        if head == self._head and not added and not any(flipped):
+            return self.version
+        self._head = head
+        self.version += 1
+        self.history.append(_Change(self.version, flipped, added))
+        return self.version
+
+    def ack(self, version: int) -> None:
+        """Acknowledge that the client has a version, forgetting the changes before it.
+
+        Args:
+            version (int): The version; older and unknown ones are ignored.
+        """
+        if not self.acked < version <= self.version:
+            return
+        self.acked = version
+        while self.history and self.history[0].version <= version:
+            self.history.popleft()
+
+    def _base(self) -> int:
+        """Get the oldest version a delta can start from."""
+        return self.history[0].version - 1 if self.history else self.version
+
+    def _head_bytes(self, out: bytearray) -> None:
+        """Write the flags, the room and the pending room."""
+        flags, (x, y), pending = self._head
+        _put(out, flags)
+        _put(out, x)
+        _put(out, y)
+        if pending is not None:
+            _put(out, pending[0])
+            _put(out, pending[1])
+
+    def delta(self, since: int | None = None) -> bytes:
+        """Get the changes since a version, or the full state.
+
+        Args:
+            since (int | None): The version the client has, the acknowledged
+                one if not given.
+
+        Returns:
+            bytes: A delta, or the full state if the version is not in the
+                history or the delta would not be smaller.
+        """
+        self.commit()
+        since = self.acked if since is None else since
+        if not self._base() <= since <= self.version:
+            return self.snapshot()
+        masks = [0, 0, 0]
+        weapons: list[str] = []
+        for change in self.history:
+            if change.version > since:
+                for i in range(3):
+                    masks[i] ^= change.flipped[i]
+                weapons += change.weapons
+        grid = self.engine.grid
+        # What the full state has instead of the flipped cells and new weapons.
+        full = (
+            _size(grid.width)
+            + _size(grid.height)
+            + 3 * ((len(grid) + 7) >> 3)
+            + _size(self._weapons)
+            + self._names
+        )
+        # Every flipped cell takes at least a byte of the delta.
+        if sum(mask.bit_count() for mask in masks) >= full:
+            return self.snapshot()
+        out = bytearray(FRAME.pack(DELTA, since, self.version))
+        self._head_bytes(out)
+        head = len(out)
+        for mask in masks:
+            indices = _indices(mask)
+            _put(out, len(indices))
+            previous = 0
+            for index in indices:
+                _put(out, index - previous)
+                previous = index
+        _weapons(out, weapons)
+        if len(out) - head >= full:
+            return self.snapshot()
+        return bytes(out)
+
+    def snapshot(self) -> bytes:
+        """Get the full state.
+
+        Returns:
+            bytes: The full state at the current version.
+        """
+        self.commit()
+        grid = self.engine.grid
+        out = bytearray(FRAME.pack(FULL, 0, self.version))
+        self._head_bytes(out)
+        _put(out, grid.width)
+        _put(out, grid.height)
+        length = (len(grid) + 7) >> 3
+        for bitmap in self._bitmaps():
+            out += bitmap.to_bytes(length)
+        _weapons(out, [weapon.name for weapon in self.engine.player.weapons])
+        return bytes(out)
+
+
+def _weapons(out: bytearray, names: list[str]) -> None:
+    """Write a list of weapon names."""
+    _put(out, len(names))
+    for name in names:
+        data = name.encode()
+        _put(out, len(data))
+        out += data
+
+
+class Mirror:
+    """The copy of the state of a game a client builds from the deltas.
+
+    Attributes:
+        version (int): The version of the state, -1 before the full state.
+        width (int): The number of columns.
+        height (int): The number of rows.
+        current_room (tuple[int, int]): The player's room.
+        pending (tuple[int, int] | None): The room of the enemy the player
+            waits to fight, None if none.
+        finished (bool): True if the game is over.
+        won (bool): True if the player won.
+        cleared (int): The cleared cells as bits of an integer.
+        defeated (int): The cells of the defeated enemies as bits.
+        picked_up (int): The cells of the picked up items as bits.
+        weapons (list[str]): The names of the player's weapons.
+
+    Methods:
+        apply: Apply a delta or a full state.
+        symbol: Get the symbol of a cell.
+        look: Describe the map and the directions.
+    """
+
+    def __init__(self) -> None:
+        self.version: int = -1
+        self.width: int = 0
+        self.height: int = 0
+        self.current_room: tuple[int, int] = (0, 0)
+        self.pending: tuple[int, int] | None = None
+        self.finished: bool = False
+        self.won: bool = False
+        self.cleared: int = 0
+        self.defeated: int = 0
+        self.picked_up: int = 0
+        self.weapons: list[str] = []
+
+    def apply(self, data: bytes) -> int:
+        """Apply a delta or a full state.
+
+        Args:
+            data (bytes): What StateSync.delta or StateSync.snapshot returned.
+
+        Raises:
+            ValueError: If the data is a delta from another version.
+
+        Returns:
+            int: The new version, to acknowledge.
+        """
+        kind, base, version = FRAME.unpack_from(data)
+        if kind == DELTA and base != self.version:
+            raise ValueError(f"The delta is from version {base}, not {self.version}.")
+        offset = FRAME.size
+        flags, offset = _get(data, offset)
+        x, offset = _get(data, offset)
+        y, offset = _get(data, offset)
+        self.current_room = (x, y)
+        self.pending = None
+        if flags & PENDING:
+            pending_x, offset = _get(data, offset)
+            pending_y, offset = _get(data, offset)
+            self.pending = (pending_x, pending_y)
+        self.finished = bool(flags & FINISHED)
+        self.won = bool(flags & WON)
+        masks = []
+        if kind == FULL:
+            self.width, offset = _get(data, offset)
+            self.height, offset = _get(data, offset)
+            length = (self.width * self.height + 7) >> 3
+            for _ in range(3):
+                masks.append(int.from_bytes(data[offset : offset + length], "little"))
+                offset += length
+            self.cleared, self.defeated, self.picked_up = masks
+            self.weapons = []
+        else:
+            for _ in range(3):
+                count, offset = _get(data, offset)
+                mask = index = 0
+                for _ in range(count):
+                    gap, offset = _get(data, offset)
+                    index += gap
+                    mask |= 1 << index
+                masks.append(mask)
+            self.cleared ^= masks[0]
+            self.defeated ^= masks[1]
+            self.picked_up ^= masks[2]
+        count, offset = _get(data, offset)
+        for _ in range(count):
+            length, offset = _get(data, offset)
+            self.weapons.append(data[offset : offset + length].decode())
+            offset += length
+        self.version = version
+        return version
+
+    def symbol(self, x: int, y: int) -> str:
+        """Get the symbol of a cell, as the Renderer draws it.
+
+        Args:
+            x (int): The column.
+            y (int): The row.
+
+        Returns:
+            str: The player, a cleared or an uncleared room.
+        """
+        if (x, y) == self.current_room:
+            return PLAYER
+        if self.cleared >> (y * self.width + x) & 1:
+            return CLEARED
+        return UNCLEARED
+
+    def look(self) -> str:
+        """Describe the map and the directions, as the server's look does.
+
+        Returns:
+            str: The map, a row per line, and the directions.
+        """
+        lines = [
+            " ".join(self.symbol(x, y) for x in range(self.width)) for y in range(self.height)
+        ]
+        x, y = self.current_room
+        directions = [
+            direction
+            for direction, (dx, dy) in CHANGE.items()
+            if 0 <= x + dx < self.width and 0 <= y + dy < self.height
+        ]
+        lines.append("You can go to: " + ", ".join(directions))
+        return "\n".join(lines)
+
+
+def bench(size: int, turns: int, ack_every: int = 1, seed: int = 0) -> dict[str, float]:
+    """Play games with the greedy bot and send their state after every turn.
+
+    The state is sent three ways: the frame the game prints every turn, the
+    full binary state and a delta since the last acknowledged version. Only
+    every ack_every-th delta reaches the client, which applies it and
+    acknowledges it; the others are lost. New games are started until the
+    turns are played.
+
+    Args:
+        size (int): The width and the height of the maps.
+        turns (int): The number of turns.
+        ack_every (int): The turns between the acknowledgements.
+        seed (int): The seed of the first map.
+
+    Returns:
+        dict[str, float]: The bytes and the microseconds per turn of each way.
+    """
+    sent = {"frame": 0, "full": 0, "delta": 0}
+    spent = {"frame": 0.0, "full": 0.0, "delta": 0.0}
+    fulls = 0
+    played = 0
+    while played < turns:
+        rng = Random(seed)
+        engine = Map(Player("Bench"), rng, size, size).engine
+        renderer = Renderer(engine, StringIO(), size, size)
+        state = StateSync(engine)
+        mirror = Mirror()
+        mirror.apply(state.snapshot())
+        while played < turns and not engine.finished:
+            command, argument = greedy_policy(engine, rng)
+            getattr(engine, command)(*([] if argument is None else [argument]))
+            played += 1
+            began = time.perf_counter()
+            frame = renderer.frame().encode()
+            spent["frame"] += time.perf_counter() - began
+            began = time.perf_counter()
+            delta = state.delta()
+            spent["delta"] += time.perf_counter() - began
+            began = time.perf_counter()
+            full = state.snapshot()
+            spent["full"] += time.perf_counter() - began
+            sent["frame"] += len(frame)
+            sent["full"] += len(full)
+            sent["delta"] += len(delta)
+            fulls += FRAME.unpack_from(delta)[0] == FULL
+            if played % ack_every == 0:
+                state.ack(mirror.apply(delta))
+        seed += 1
+    result = {f"{way}_bytes_per_turn": sent[way] / played for way in sent}
+    result.update({f"{way}_us_per_turn": spent[way] / played * 1e6 for way in spent})
+    result["full_fallbacks"] = fulls
+    return result
+
+
+def main() -> None:
+    """Compare the bytes and the time of deltas with resending the state."""
+    parser = argparse.ArgumentParser(description="Benchmark state deltas.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 10, 30, 100])
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--ack-every", type=int, default=1, help="turns per delta that arrives")
+    args = parser.parse_args()
+    print(
+        f"{'size':>5} {'frame B':>8} {'full B':>8} {'delta B':>8} "
+        f"{'frame us':>9} {'full us':>8} {'delta us':>9} {'fallbacks':>10}"
+    )
+    for size in args.sizes:
+        result = bench(size, args.turns, args.ack_every)
+        print(
+            f"{size:>5} {result['frame_bytes_per_turn']:>8.1f} "
+            f"{result['full_bytes_per_turn']:>8.1f} {result['delta_bytes_per_turn']:>8.1f} "
+            f"{result['frame_us_per_turn']:>9.1f} {result['full_us_per_turn']:>8.1f} "
+            f"{result['delta_us_per_turn']:>9.1f} {result['full_fallbacks']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
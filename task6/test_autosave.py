@@ -0,0 +1,83 @@
+"""Tests of autosave.py: saved games come back, and a torn copy falls back to the other one."""
+from __future__ import annotations
+
+import os
+
+import pytest
+
+import snapshot
+from autosave import COPY, HEADER, Autosaver
+from test_snapshot import assert_same_game
+
+
+def _damage(path: str, offset: int) -> None:
+    """Flip a byte of a file."""
+    with open(path, "r+b") as file:
+        file.seek(offset)
+        byte = file.read(1)[0]
+        file.seek(offset)
+        file.write(bytes([byte ^ 0xFF]))
+
+
+def test_saved_games_are_restored_after_reopening(tmp_path) -> None:
+    path = str(tmp_path / "games.autosave")
+    engines = [snapshot._played(seed, 3, 3, seed) for seed in range(3)]
+    with Autosaver(path, slots=4, interval=60) as saver:
+        for slot, engine in enumerate(engines):
+            saver.save(slot, engine)
+        # Handed over but not yet written.
+        assert_same_game(saver.restore(1), engines[1])
+    with Autosaver(path, interval=60) as saver:
+        assert saver.slots == 4
+        for slot, engine in enumerate(engines):
+            assert_same_game(saver.restore(slot), engine)
+        with pytest.raises(KeyError):
+            saver.restore(3)
+
+
+def test_a_corrupted_copy_falls_back_to_the_other_one(tmp_path) -> None:
+    path = str(tmp_path / "games.autosave")
+    first = snapshot._played(0, 3, 3, 1)
+    second = snapshot._played(1, 3, 3, 4)
+    with Autosaver(path, slots=1, interval=60) as saver:
+        saver.save(0, first)
+        saver.flush()
+        saver.save(0, second)
+        saver.flush()
+        record = saver._record
+    # The second save went to the copy of sequence 2, the first of the slot.
+    _damage(path, HEADER.size + COPY.size + record // 2)
+    with Autosaver(path, interval=60) as saver:
+        assert_same_game(saver.restore(0), first)
+        # The next save overwrites the torn copy, not the intact one.
+        saver.save(0, second)
+        saver.flush()
+    with Autosaver(path, interval=60) as saver:
+        assert_same_game(saver.restore(0), second)
+
+
+def test_a_slot_with_both_copies_corrupted_is_empty(tmp_path) -> None:
+    path = str(tmp_path / "games.autosave")
+    with Autosaver(path, slots=1, interval=60) as saver:
+        saver.save(0, snapshot._played(0, 3, 3, 1))
+        saver.flush()
+        saver.save(0, snapshot._played(1, 3, 3, 2))
+        record = saver._record
+    for copy in (0, 1):
+        _damage(path, HEADER.size + copy * (COPY.size + record) + COPY.size)
+    with Autosaver(path, interval=60) as saver:
+        with pytest.raises(KeyError):
+            saver.restore(0)
+        assert saver.resume(0) is None
+
+
+def test_a_file_of_other_maps_is_refused(tmp_path) -> None:
+    path = str(tmp_path / "games.autosave")
+    Autosaver(path, slots=1, interval=60).close()
+    with pytest.raises(ValueError):
+        Autosaver(path, 4, 4)
+    with open(path, "r+b") as file:
+        file.write(b"XXXX")
+    with pytest.raises(ValueError):
+        Autosaver(path)
+    assert os.path.getsize(path) > HEADER.size
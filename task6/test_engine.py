@@ -0,0 +1,133 @@
+"""Tests of engine.py: the events of every command, on a small map built by hand."""
+from __future__ import annotations
+
+from assets import Enemy, Item, Player, Weapon
+from engine import (
+    BUSY,
+    DECLINED,
+    DENIED,
+    ENEMY,
+    ENTERED,
+    FIGHT_LOST,
+    FIGHT_WON,
+    INVALID_WEAPON,
+    MOVED,
+    PICKED_UP,
+    REJECTED,
+    WON,
+    Engine,
+)
+from grid import Grid
+
+
+def _engine() -> Engine:
+    """Build a 3x2 map.
+
+    West is towards the higher columns. The cat west of the start is beaten
+    by the mosquito the player holds, the milk south of the start only by
+    the cat weapon two rooms west, and the cake is in the last room.
+    """
+    grid = Grid(3, 2)
+    room = grid.add_kind("A room", "An empty room.")
+    grid.place(0, room)
+    grid.place(1, room, grid.add_character(Enemy("Cat", Weapon("cat"))))
+    grid.place(2, room, item_id=grid.add_item(Weapon("cat", "milk")))
+    grid.place(3, room, grid.add_character(Enemy("Milk", Weapon("milk"))))
+    grid.place(4, room)
+    cake = grid.add_item(Item("cake"))
+    grid.place(grid.end, grid.add_kind("The last room.", "Here is a cake"), item_id=cake)
+    player = Player("Test")
+    player.weapons.append(Weapon("mosquito", "cat"))
+    return Engine(grid, player)
+
+
+def _kinds(events: list) -> list[str]:
+    return [event.kind for event in events]
+
+
+def test_moves_off_the_map_are_rejected() -> None:
+    engine = _engine()
+    assert _kinds(engine.move("north")) == [REJECTED]
+    assert _kinds(engine.move("up")) == [REJECTED]
+    assert engine.player.current_room == (0, 0)
+    assert sorted(engine.directions()) == ["south", "west"]
+
+
+def test_an_enemy_waits_for_a_fight_or_a_decline() -> None:
+    engine = _engine()
+    assert _kinds(engine.move("west")) == [ENTERED, ENEMY]
+    assert engine.pending == (1, 0)
+    assert _kinds(engine.move("south")) == [BUSY]
+    assert _kinds(engine.decline()) == [DECLINED]
+    assert engine.pending is None
+    assert engine.player.current_room == (0, 0)
+    assert not engine.player.has_cleared(1)
+    assert _kinds(engine.decline()) == [REJECTED]
+    assert _kinds(engine.fight(0)) == [REJECTED]
+
+
+def test_a_fight_with_no_such_weapon_ends_the_wait() -> None:
+    engine = _engine()
+    engine.move("west")
+    assert _kinds(engine.fight(5)) == [INVALID_WEAPON]
+    assert engine.pending is None
+    assert not engine.finished
+
+
+def test_a_won_fight_clears_the_room_for_good() -> None:
+    engine = _engine()
+    engine.move("west")
+    events = engine.fight(0)
+    assert _kinds(events) == [FIGHT_WON, MOVED]
+    assert events[0].data["weapon"] == "mosquito"
+    assert engine.player.current_room == (1, 0)
+    assert engine.grid.defeated.get(1) and engine.player.has_cleared(1)
+    engine.move("east")
+    assert _kinds(engine.move("west")) == [ENTERED, MOVED]
+
+
+def test_a_lost_fight_ends_the_game() -> None:
+    engine = _engine()
+    engine.move("south")
+    assert _kinds(engine.fight(0)) == [FIGHT_LOST]
+    assert engine.finished and not engine.won
+    assert _kinds(engine.move("west")) == [REJECTED]
+
+
+def test_the_end_room_needs_the_other_rooms_cleared() -> None:
+    engine = _engine()
+    engine.move("west")
+    engine.fight(0)
+    engine.move("south")
+    assert _kinds(engine.move("west")) == [ENTERED, DENIED]
+    assert engine.player.current_room == (1, 1)
+
+
+def test_the_game_is_won_with_the_cake() -> None:
+    engine = _engine()
+    engine.move("west")
+    engine.fight(0)
+    events = engine.move("west")
+    assert _kinds(events) == [ENTERED, MOVED, PICKED_UP]
+    assert events[-1].data["item"] == "cat"
+    assert [weapon.name for weapon in engine.player.weapons] == ["mosquito", "cat"]
+    for direction in ("east", "east", "south"):
+        engine.move(direction)
+    assert _kinds(engine.fight(1)) == [FIGHT_WON, MOVED]
+    engine.move("west")
+    assert _kinds(engine.move("west")) == [ENTERED, MOVED, WON]
+    assert engine.finished and engine.won
+
+
+def test_a_fork_is_played_apart_from_the_game() -> None:
+    engine = _engine()
+    engine.move("west")
+    fork = engine.fork()
+    fork.fight(0)
+    fork.move("west")
+    assert engine.pending == (1, 0)
+    assert engine.player.current_room == (0, 0)
+    assert not engine.grid.defeated.get(1)
+    assert not engine.grid.picked_up.get(2)
+    assert [weapon.name for weapon in engine.player.weapons] == ["mosquito"]
+    assert _kinds(engine.fight(0)) == [FIGHT_WON, MOVED]
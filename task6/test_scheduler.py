@@ -0,0 +1,105 @@
+"""Tests of the timing wheel of scheduler.py and of moving characters on a forked grid."""
+from __future__ import annotations
+
+from random import Random
+
+import pytest
+
+from assets import Player
+from chunks import ChunkedMap
+from grid import NONE
+from main import Map
+from scheduler import BITS, LEVELS, SLOTS, TimingWheel, World
+
+
+def _run(wheel: TimingWheel) -> None:
+    """Advance the wheel until no timer is left."""
+    while wheel.pending:
+        wheel.advance()
+
+
+def test_timers_run_at_their_deadline() -> None:
+    wheel = TimingWheel()
+    rng = Random(0)
+    delays = [1, 2, SLOTS - 1, SLOTS, SLOTS + 1, SLOTS**2 - 1, SLOTS**2, SLOTS**3 + 3]
+    delays += [rng.randrange(1, SLOTS**3) for _ in range(200)]
+    fired: list[tuple[int, int]] = []
+    for delay in delays:
+        wheel.schedule(delay, lambda delay=delay: fired.append((delay, wheel.now)))
+    assert wheel.pending == len(delays)
+    _run(wheel)
+    assert sorted(fired) == sorted((delay, delay) for delay in delays)
+
+
+def test_timers_scheduled_by_a_timer_run_at_their_deadline() -> None:
+    wheel = TimingWheel()
+    fired: list[int] = []
+
+    def again() -> None:
+        fired.append(wheel.now)
+        if len(fired) < 5:
+            wheel.schedule(SLOTS + 1, again)
+
+    wheel.schedule(SLOTS - 1, again)
+    _run(wheel)
+    assert fired == [SLOTS - 1 + i * (SLOTS + 1) for i in range(5)]
+
+
+def test_a_cancelled_timer_does_not_run() -> None:
+    wheel = TimingWheel()
+    fired: list[str] = []
+    kept = wheel.schedule(3, lambda: fired.append("kept"))
+    cancelled = wheel.schedule(3, lambda: fired.append("cancelled"))
+    far = wheel.schedule(SLOTS**2 + 7, lambda: fired.append("far"))
+    wheel.cancel(cancelled)
+    wheel.cancel(cancelled)
+    wheel.cancel(far)
+    assert wheel.pending == 1
+    for _ in range(SLOTS**2 + 10):
+        wheel.advance()
+    assert fired == ["kept"]
+    assert wheel.pending == 0
+    assert not kept.cancelled
+
+
+def test_timers_past_the_top_level_wait_in_the_overflow() -> None:
+    wheel = TimingWheel()
+    top = 1 << (LEVELS * BITS)
+    # Right before a turn of the top level, so a short delay crosses it.
+    wheel.now = top - 10
+    fired: list[int] = []
+    wheel.schedule(20, lambda: fired.append(wheel.now))
+    wheel.schedule(5, lambda: fired.append(wheel.now))
+    _run(wheel)
+    assert fired == [top - 5, top + 10]
+
+
+def test_a_fork_does_not_see_the_characters_moved() -> None:
+    engine = Map(Player("Test"), Random(0), 5, 5).engine
+    grid = engine.grid
+    source = next(
+        index for index in range(1, grid.end) if grid.character_ids[index] != NONE
+    )
+    target = next(
+        index
+        for index in range(1, grid.end)
+        if grid.character_ids[index] == NONE and index != source
+    )
+    character_id = grid.character_ids[source]
+    fork = engine.fork()
+    grid.move_character(source, target)
+    assert (grid.character_ids[source], grid.character_ids[target]) == (NONE, character_id)
+    assert (fork.grid.character_ids[source], fork.grid.character_ids[target]) == (
+        character_id,
+        NONE,
+    )
+    # And the other way round, with a fork of the fork.
+    other = fork.fork()
+    other.grid.move_character(source, target)
+    assert fork.grid.character_ids[source] == character_id
+    assert other.grid.character_ids[target] == character_id
+
+
+def test_characters_do_not_roam_in_a_chunked_world() -> None:
+    with pytest.raises(TypeError):
+        World(ChunkedMap(Player("Test"), 0).engine)
@@ -0,0 +1,99 @@
+"""Tests of snapshot.py: a restored game has the state of the saved one."""
+from __future__ import annotations
+
+from random import Random
+
+import pytest
+
+import snapshot
+from assets import Player
+from chunks import ChunkedMap
+from engine import Engine
+from main import Map
+from snapshot import SnapshotFile
+
+
+def assert_same_game(restored: Engine, engine: Engine) -> None:
+    """Check that a restored game has the state of a game."""
+    grid, other = restored.grid, engine.grid
+    assert (grid.width, grid.height, grid.end) == (other.width, other.height, other.end)
+    assert grid.kind_ids == other.kind_ids
+    assert grid.character_ids == other.character_ids
+    assert grid.item_ids == other.item_ids
+    cells = range(len(grid))
+    for bits, kept in ((grid.defeated, other.defeated), (grid.picked_up, other.picked_up)):
+        assert [bits.get(index) for index in cells] == [kept.get(index) for index in cells]
+    player, saved = restored.player, engine.player
+    assert player.name == saved.name
+    assert player.current_room == saved.current_room
+    assert [player.has_cleared(index) for index in cells] == [
+        saved.has_cleared(index) for index in cells
+    ]
+    assert [weapon.name for weapon in player.weapons] == [weapon.name for weapon in saved.weapons]
+    assert restored.pending == engine.pending
+    assert (restored.finished, restored.won) == (engine.finished, engine.won)
+
+
+@pytest.mark.parametrize("size", [2, 3, 6])
+def test_loads_restores_what_dumps_saved(size: int) -> None:
+    for seed in range(10):
+        engine = snapshot._played(seed, size, size, 3 * seed)
+        assert_same_game(snapshot.loads(snapshot.dumps(engine)), engine)
+
+
+def test_a_restored_game_plays_on_like_the_saved_one() -> None:
+    engine = snapshot._played(3, 4, 4, 5)
+    restored = snapshot.loads(snapshot.dumps(engine))
+    for direction in ("south", "east", "north", "west", "south"):
+        if engine.finished:
+            break
+        assert [event.kind for event in restored.move(direction)] == [
+            event.kind for event in engine.move(direction)
+        ]
+        if engine.pending is not None:
+            engine.decline()
+            restored.decline()
+    assert_same_game(restored, engine)
+
+
+def test_a_snapshot_file_keeps_the_games_of_its_slots(tmp_path) -> None:
+    path = str(tmp_path / "games.snapshot")
+    engines = [snapshot._played(seed, 3, 3, seed) for seed in range(4)]
+    with SnapshotFile(path, 3, 3, slots=8) as file:
+        for slot, engine in enumerate(engines):
+            file.save(slot, engine)
+        file.clear(2)
+        file.flush()
+    with SnapshotFile(path) as file:
+        assert (file.width, file.height, file.slots) == (3, 3, 8)
+        assert [file.used(slot) for slot in range(5)] == [True, True, False, True, False]
+        for slot in (0, 1, 3):
+            assert_same_game(file.restore(slot), engines[slot])
+        with pytest.raises(KeyError):
+            file.restore(2)
+        with pytest.raises(IndexError):
+            file.used(8)
+
+
+def test_a_file_of_other_maps_is_refused(tmp_path) -> None:
+    path = str(tmp_path / "games.snapshot")
+    SnapshotFile(path, 3, 3, slots=1).close()
+    with pytest.raises(ValueError):
+        SnapshotFile(path, 4, 3)
+    with SnapshotFile(path) as file, pytest.raises(ValueError):
+        file.save(0, Map(Player("Test"), Random(0), 4, 4).engine)
+
+
+def test_a_damaged_header_is_refused() -> None:
+    data = bytearray(snapshot.dumps(snapshot._played(0, 3, 3, 2)))
+    with pytest.raises(ValueError):
+        snapshot.loads(b"XXXX" + bytes(data[4:]))
+    # The checksum of the tables.
+    data[snapshot.HEADER.size - 1] ^= 0xFF
+    with pytest.raises(ValueError):
+        snapshot.loads(bytes(data))
+
+
+def test_a_game_of_a_chunked_world_is_not_saved() -> None:
+    with pytest.raises(TypeError):
+        snapshot.dumps(ChunkedMap(Player("Test"), 0).engine)
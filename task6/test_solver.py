@@ -0,0 +1,122 @@
+"""Tests of solver.py against a search of every game on small maps."""
+from __future__ import annotations
+
+from collections import deque
+from random import Random
+
+import pytest
+
+from assets import Player
+from engine import Engine
+from grid import CHANGE, NONE
+from main import Map
+from solver import solvable, solve
+
+SIZES = [(2, 2), (2, 3), (3, 2), (3, 3), (4, 2)]
+
+
+def _key(engine: Engine) -> tuple:
+    """Get what tells two states of a game apart."""
+    cells = range(len(engine.grid))
+    return (
+        engine.player.current_room,
+        engine.pending,
+        engine.finished,
+        tuple(engine.player.has_cleared(index) for index in cells),
+        tuple(engine.grid.defeated.get(index) for index in cells),
+        tuple(engine.grid.picked_up.get(index) for index in cells),
+        tuple(weapon.name for weapon in engine.player.weapons),
+    )
+
+
+def _brute_force(engine: Engine) -> int | None:
+    """Play every command in every state, breadth-first.
+
+    Returns:
+        int | None: The fewest moves that win, None if the game cannot be won.
+    """
+    queue = deque([(engine.fork(), 0)])
+    seen = {_key(engine)}
+    while queue:
+        state, moves = queue.popleft()
+        if state.pending is not None:
+            commands = [("fight", i, 0) for i in range(len(state.player.weapons))]
+            commands.append(("decline", None, 0))
+        else:
+            commands = [("move", direction, 1) for direction in CHANGE]
+        for command, argument, step in commands:
+            fork = state.fork()
+            getattr(fork, command)(*([] if argument is None else [argument]))
+            if fork.won:
+                return moves + step
+            key = _key(fork)
+            if not fork.finished and key not in seen:
+                seen.add(key)
+                queue.append((fork, moves + step))
+    return None
+
+
+def _shuffled(width: int, height: int, seed: int) -> Engine:
+    """Build a map, shuffle its rooms and drop about half its items, so many cannot be won."""
+    rng = Random(seed)
+    engine = Map(Player("Test"), rng, width, height).engine
+    grid = engine.grid
+    cells = list(range(1, grid.end))
+    rooms = [(grid.kind_ids[i], grid.character_ids[i], grid.item_ids[i]) for i in cells]
+    rng.shuffle(rooms)
+    for index, (kind_id, character_id, item_id) in zip(cells, rooms):
+        grid.place(index, kind_id, character_id, NONE if rng.random() < 0.5 else item_id)
+    return engine
+
+
+def _play(engine: Engine, commands: list) -> Engine:
+    """Play the commands of a solution on a fork of the game."""
+    fork = engine.fork()
+    for command, argument in commands:
+        getattr(fork, command)(*([] if argument is None else [argument]))
+    return fork
+
+
+@pytest.mark.parametrize("width, height", SIZES)
+def test_the_solver_agrees_with_every_game_played(width: int, height: int) -> None:
+    outcomes = set()
+    for seed in range(30):
+        engine = _shuffled(width, height, seed)
+        fewest = _brute_force(engine)
+        outcomes.add(fewest is not None)
+        assert solvable(engine) == (fewest is not None)
+        solution = solve(engine)
+        assert solution.solvable == (fewest is not None)
+        if fewest is None:
+            assert solution.commands == []
+            continue
+        assert solution.optimal and solution.moves == fewest
+        assert _play(engine, solution.commands).won
+        # The route of the flood wins too, if not by the fewest moves.
+        flood = solve(engine, exact_limit=0)
+        assert flood.solvable and flood.moves >= fewest
+        assert _play(engine, flood.commands).won
+    if width * height > 4:
+        assert outcomes == {True, False}
+
+
+@pytest.mark.parametrize("width, height", SIZES)
+def test_every_map_can_be_won(width: int, height: int) -> None:
+    for seed in range(30):
+        engine = Map(Player("Test"), Random(seed), width, height).engine
+        assert _brute_force(engine) is not None
+
+
+def test_a_game_in_progress_is_solved_from_where_it_is() -> None:
+    engine = Map(Player("Test"), Random(4), 3, 3).engine
+    engine.move("south")
+    if engine.pending is not None:
+        engine.decline()
+    engine.move("east")
+    fewest = _brute_force(engine)
+    assert solvable(engine) == (fewest is not None)
+    solution = solve(engine)
+    assert solution.solvable == (fewest is not None)
+    if fewest is not None:
+        assert solution.moves == fewest
+        assert _play(engine, solution.commands).won
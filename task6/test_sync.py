@@ -0,0 +1,108 @@
+"""Tests of the deltas of sync.py: a mirror built from them has the state of the game."""
+from __future__ import annotations
+
+from random import Random
+
+import pytest
+
+from assets import Bitmap, Player
+from chunks import ChunkedMap
+from engine import Engine
+from main import Map
+from simulate import greedy_policy
+from sync import DELTA, FRAME, FULL, Mirror, StateSync
+
+
+def _assert_mirrors(mirror: Mirror, engine: Engine) -> None:
+    """Check that a mirror has the state of a game."""
+    grid = engine.grid
+    assert mirror.current_room == engine.player.current_room
+    assert mirror.pending == engine.pending
+    assert (mirror.finished, mirror.won) == (engine.finished, engine.won)
+    assert mirror.cleared == engine.player.cleared_rooms.as_int()
+    assert mirror.defeated == grid.defeated.as_int()
+    assert mirror.picked_up == grid.picked_up.as_int()
+    assert mirror.weapons == [weapon.name for weapon in engine.player.weapons]
+
+
+def _step(engine: Engine, rng: Random) -> None:
+    """Play one command of the greedy bot."""
+    command, argument = greedy_policy(engine, rng)
+    getattr(engine, command)(*([] if argument is None else [argument]))
+
+
+@pytest.mark.parametrize("size", [3, 10])
+@pytest.mark.parametrize("ack_every", [1, 3])
+def test_deltas_rebuild_the_game(size: int, ack_every: int) -> None:
+    for seed in range(5):
+        rng = Random(seed)
+        engine = Map(Player("Test"), rng, size, size).engine
+        state = StateSync(engine)
+        mirror = Mirror()
+        state.ack(mirror.apply(state.snapshot()))
+        _assert_mirrors(mirror, engine)
+        turn = 0
+        while not engine.finished:
+            _step(engine, rng)
+            turn += 1
+            delta = state.delta()
+            # The deltas between the acknowledgements are lost on the way.
+            if turn % ack_every == 0:
+                state.ack(mirror.apply(delta))
+                _assert_mirrors(mirror, engine)
+        state.ack(mirror.apply(state.delta()))
+        _assert_mirrors(mirror, engine)
+
+
+def test_a_client_behind_the_history_gets_the_full_state() -> None:
+    rng = Random(0)
+    engine = Map(Player("Test"), rng, 10, 10).engine
+    state = StateSync(engine, history=2)
+    mirror = Mirror()
+    mirror.apply(state.snapshot())
+    for _ in range(10):
+        _step(engine, rng)
+        state.commit()
+    assert state.version > 2
+    data = state.delta(since=0)
+    assert FRAME.unpack_from(data)[0] == FULL
+    mirror.apply(data)
+    _assert_mirrors(mirror, engine)
+
+
+def test_a_delta_from_another_version_is_refused() -> None:
+    engine = Map(Player("Test"), Random(0), 3, 3).engine
+    state = StateSync(engine)
+    mirror = Mirror()
+    mirror.apply(state.snapshot())
+    engine.move("south")
+    first = state.delta()
+    engine.move("east")
+    # Nothing was acknowledged, so both deltas start from the full state.
+    second = state.delta()
+    assert FRAME.unpack_from(second)[:2] == (DELTA, 0)
+    mirror.apply(first)
+    with pytest.raises(ValueError):
+        mirror.apply(second)
+
+
+def test_bitmap_bytes_round_trip() -> None:
+    bitmap = Bitmap(20)
+    for index in (0, 3, 8, 19):
+        bitmap.set(index)
+    copy = bitmap.copy()
+    assert copy.shares(bitmap)
+    copy.set(5)
+    assert not copy.shares(bitmap)
+    assert bitmap.as_int() == 1 | 1 << 3 | 1 << 8 | 1 << 19
+    assert bitmap.to_bytes(2) == bitmap.to_bytes()[:2]
+    assert bitmap.to_bytes(5)[3:] == bytes(2)
+    restored = Bitmap.from_bytes(bitmap.to_bytes(), 20)
+    assert restored.as_int() == bitmap.as_int()
+    assert restored.count == 4
+    assert [restored.get(i) for i in range(20)] == [bitmap.get(i) for i in range(20)]
+
+
+def test_the_state_of_a_chunked_world_is_not_sent() -> None:
+    with pytest.raises(TypeError):
+        StateSync(ChunkedMap(Player("Test"), 0).engine)
@@ -0,0 +1,422 @@
+"""Many games stepped at once with NumPy, for training and evaluating bots.
+
+VectorEnv holds N games as arrays: the player's cell, the weapons held as
+a bitmask of weapon ids, the pending enemy, and per cell the cleared,
+defeated and picked up flags next to the enemy and the item of every cell.
+An array of actions is applied to all the games in one batched step, with
+the rules of Engine.enter, Player.fight and EndRoom.can_enter:
+
+    0-3        move north, south, east or west, see DIRECTIONS
+    4 + id     fight the pending enemy with the weapon of that id, see names
+    4 + len(names)
+               decline to fight
+
+The maps are generated by Map, so a game seeded with s is the same game as
+Map(player, Random(s), width, height). Needs NumPy.
+
+Usage:
+    python vecenv.py --envs 4096 --width 10 --height 10
+    python vecenv.py --check
+
+classes:
+    VectorEnv
+
+functions:
+    check
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from random import Random
+
+import numpy
+
+from assets import Enemy, Player, Weapon
+from engine import (
+    BUSY,
+    DECLINED,
+    DENIED,
+    ENEMY,
+    FIGHT_LOST,
+    FIGHT_WON,
+    INVALID_WEAPON,
+    MOVED,
+    REJECTED,
+    WON,
+)
+from grid import CHANGE, NONE
+from main import Map
+
+DIRECTIONS = list(CHANGE)
+
+# The outcome of a step in every game, indexed by info["outcome"].
+OUTCOMES = [
+    REJECTED, BUSY, DENIED, ENEMY, MOVED, DECLINED, INVALID_WEAPON, FIGHT_WON, FIGHT_LOST, WON
+]
+_CODES = {kind: code for code, kind in enumerate(OUTCOMES)}
+
+
+def _bits(bitmap, size: int) -> numpy.ndarray:
+    """Unpack a Bitmap into an array of flags."""
+    flags = numpy.zeros(size, dtype=bool)
+    bits = numpy.unpackbits(
+        numpy.frombuffer(bitmap.to_bytes(), dtype=numpy.uint8), bitorder="little"
+    )
+    length = min(size, len(bits))
+    flags[:length] = bits[:length]
+    return flags
+
+
+class VectorEnv:
+    """N games of the same size stepped in lockstep.
+
+    The arrays are the environment's own: they change with the next step.
+    A finished game stays finished, and rejects every action, until it is
+    reset.
+
+    Attributes:
+        num_envs (int): The number of games.
+        width (int): The number of columns of the maps.
+        height (int): The number of rows of the maps.
+        names (list[str]): The weapon names, indexed by their ids.
+        action_count (int): The number of actions.
+        seeds (numpy.ndarray): The seed of every game.
+        position (numpy.ndarray): The cell of the player.
+        weapons (numpy.ndarray): The weapons held, bit id set for weapon id.
+        pending (numpy.ndarray): The cell of the enemy waiting for a fight
+            or a decline, NONE if there is none.
+        cleared (numpy.ndarray): The cleared cells, N x cells.
+        cleared_count (numpy.ndarray): The number of cleared cells.
+        defeated (numpy.ndarray): The cells whose enemy is defeated.
+        picked_up (numpy.ndarray): The cells whose item is picked up.
+        enemy (numpy.ndarray): The weapon id of the enemy of every cell,
+            NONE if there is no enemy.
+        item (numpy.ndarray): The weapon id of the item of every cell, NONE
+            if it is not a weapon.
+        has_item (numpy.ndarray): The cells with an item.
+        cake (numpy.ndarray): The cells with the cake.
+        end (numpy.ndarray): The end room cell.
+        cleared_rooms_needed (numpy.ndarray): The cleared rooms needed to
+            enter the end room.
+        finished (numpy.ndarray): The games that are over.
+        won (numpy.ndarray): The games that were won.
+
+    Methods:
+        reset: Start new games.
+        step: Apply an action to every game.
+        observe: Get the observations of the games.
+    """
+
+    def __init__(self, num_envs: int, width: int = 3, height: int = 3, seed: int = 0) -> None:
+        self.num_envs: int = num_envs
+        self.width: int = width
+        self.height: int = height
+        self.size: int = width * height
+        matchups = Map(Player(""), Random(0), width, height).engine.matchups
+        self.names: list[str] = matchups.names
+        self.action_count: int = 4 + len(self.names) + 1
+        count = len(self.names)
+        outcomes = numpy.frombuffer(bytes(matchups.outcomes), dtype=numpy.uint8)
+        self._wins = outcomes.reshape(count, count).astype(bool)
+        self._next_seed: int = seed
+        shape = (num_envs, self.size)
+        self.seeds = numpy.zeros(num_envs, dtype=numpy.int64)
+        self.position = numpy.zeros(num_envs, dtype=numpy.int64)
+        self.weapons = numpy.zeros(num_envs, dtype=numpy.int64)
+        self.pending = numpy.full(num_envs, NONE, dtype=numpy.int64)
+        self.cleared = numpy.zeros(shape, dtype=bool)
+        self.cleared_count = numpy.zeros(num_envs, dtype=numpy.int64)
+        self.defeated = numpy.zeros(shape, dtype=bool)
+        self.picked_up = numpy.zeros(shape, dtype=bool)
+        self.enemy = numpy.full(shape, NONE, dtype=numpy.int8)
+        self.item = numpy.full(shape, NONE, dtype=numpy.int8)
+        self.has_item = numpy.zeros(shape, dtype=bool)
+        self.cake = numpy.zeros(shape, dtype=bool)
+        self.end = numpy.zeros(num_envs, dtype=numpy.int64)
+        self.cleared_rooms_needed = numpy.zeros(num_envs, dtype=numpy.int64)
+        self.finished = numpy.zeros(num_envs, dtype=bool)
+        self.won = numpy.zeros(num_envs, dtype=bool)
+        self.reset()
+
+    def _load(self, env: int, game_map: Map) -> None:
+        """Copy a generated map and its player into the arrays of a game."""
+        grid, player = game_map.rooms, game_map.player
+        ids = {name: i for i, name in enumerate(self.names)}
+        # The templates with a NONE entry last, so NONE ids index it.
+        enemies = numpy.array(
+            [ids[c.weapon.name] if isinstance(c, Enemy) else NONE for c in grid.characters]
+            + [NONE],
+            dtype=numpy.int8,
+        )
+        weapons = numpy.array(
+            [ids[i.name] if isinstance(i, Weapon) else NONE for i in grid.items] + [NONE],
+            dtype=numpy.int8,
+        )
+        cakes = numpy.array([i.name == "cake" for i in grid.items] + [False])
+        character_ids = numpy.frombuffer(grid.character_ids.tobytes(), dtype=numpy.int32)
+        item_ids = numpy.frombuffer(grid.item_ids.tobytes(), dtype=numpy.int32)
+        self.enemy[env] = enemies[character_ids]
+        self.item[env] = weapons[item_ids]
+        self.has_item[env] = item_ids != NONE
+        self.cake[env] = cakes[item_ids]
+        self.defeated[env] = _bits(grid.defeated, self.size)
+        self.picked_up[env] = _bits(grid.picked_up, self.size)
+        self.cleared[env] = _bits(player.cleared_rooms, self.size)
+        self.cleared_count[env] = player.cleared_count()
+        self.position[env] = grid.index(*player.current_room)
+        mask = 0
+        for weapon in player.weapons:
+            mask |= 1 << ids[weapon.name]
+        self.weapons[env] = mask
+        self.pending[env] = NONE
+        self.end[env] = grid.end
+        self.cleared_rooms_needed[env] = grid.cleared_rooms_needed
+        self.finished[env] = False
+        self.won[env] = False
+
+    def reset(
+        self, envs: list[int] | None = None, seeds: list[int] | None = None
+    ) -> dict[str, numpy.ndarray]:
+        """Start new games.
+
+        Args:
+            envs (list[int] | None): The games to start again, all if not given.
+            seeds (list[int] | None): Their seeds. The next unused seeds of
+                the environment if not given.
+
+        Returns:
+            dict[str, numpy.ndarray]: The observations of all the games.
+        """
+        envs = range(self.num_envs) if envs is None else envs
+        if seeds is None:
+            seeds = range(self._next_seed, self._next_seed + len(envs))
+            self._next_seed += len(envs)
+        for env, seed in zip(envs, seeds):
+            self.seeds[env] = seed
+            game_map = Map(Player("Bot"), Random(seed), self.width, self.height)
+            self._load(env, game_map)
+        return self.observe()
+
+    def observe(self) -> dict[str, numpy.ndarray]:
+        """Get the observations of the games.
+
+        Returns:
+            dict[str, numpy.ndarray]: The player's cell, the weapons held,
+                the pending enemy's cell, the cleared cells and their number.
+        """
+        return {
+            "position": self.position,
+            "weapons": self.weapons,
+            "pending": self.pending,
+            "cleared": self.cleared,
+            "cleared_count": self.cleared_count,
+        }
+
+    def _finish(
+        self,
+        rows: numpy.ndarray,
+        cells: numpy.ndarray,
+        outcome: numpy.ndarray,
+        reward: numpy.ndarray,
+    ) -> None:
+        """Clear entered cells, move the players there and pick up the items.
+
+        See Engine._finish.
+        """
+        self.cleared_count[rows] += ~self.cleared[rows, cells]
+        self.cleared[rows, cells] = True
+        self.position[rows] = cells
+        fresh = self.has_item[rows, cells] & ~self.picked_up[rows, cells]
+        cake = fresh & self.cake[rows, cells]
+        won = rows[cake]
+        self.finished[won] = True
+        self.won[won] = True
+        outcome[won] = _CODES[WON]
+        reward[won] = 1.0
+        fresh &= ~cake
+        rows, cells = rows[fresh], cells[fresh]
+        self.picked_up[rows, cells] = True
+        item = self.item[rows, cells].astype(numpy.int64)
+        weapon = item != NONE
+        self.weapons[rows[weapon]] |= 1 << item[weapon]
+
+    def step(
+        self, actions: numpy.ndarray
+    ) -> tuple[dict[str, numpy.ndarray], numpy.ndarray, numpy.ndarray, dict[str, numpy.ndarray]]:
+        """Apply an action to every game.
+
+        Args:
+            actions (numpy.ndarray): An action for every game.
+
+        Returns:
+            tuple: The observations, the rewards (1 for winning, -1 for
+                losing a fight), whether each game is over, and the info with
+                the index of each game's outcome in OUTCOMES.
+        """
+        actions = numpy.asarray(actions, dtype=numpy.int64)
+        outcome = numpy.full(self.num_envs, _CODES[REJECTED], dtype=numpy.int8)
+        reward = numpy.zeros(self.num_envs, dtype=numpy.float32)
+        live = ~self.finished
+        waiting = self.pending != NONE
+        width, fights = self.width, 4 + len(self.names)
+
+        move = live & (actions >= 0) & (actions < 4)
+        outcome[move & waiting] = _CODES[BUSY]
+        rows = numpy.flatnonzero(move & ~waiting)
+        delta = numpy.array([CHANGE[direction] for direction in DIRECTIONS])[actions[rows]]
+        x = self.position[rows] % width + delta[:, 0]
+        y = self.position[rows] // width + delta[:, 1]
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < self.height)
+        rows, cells = rows[inside], (y * width + x)[inside]
+        end = cells == self.end[rows]
+        denied = end & (self.cleared_count[rows] < self.cleared_rooms_needed[rows])
+        outcome[rows[denied]] = _CODES[DENIED]
+        rows, cells, end = rows[~denied], cells[~denied], end[~denied]
+        # The end room is cleared as soon as it is entered, before any fight.
+        self.cleared_count[rows[end]] += ~self.cleared[rows[end], cells[end]]
+        self.cleared[rows[end], cells[end]] = True
+        enemy = (self.enemy[rows, cells] != NONE) & ~self.defeated[rows, cells]
+        self.pending[rows[enemy]] = cells[enemy]
+        outcome[rows[enemy]] = _CODES[ENEMY]
+        rows, cells = rows[~enemy], cells[~enemy]
+        outcome[rows] = _CODES[MOVED]
+        self._finish(rows, cells, outcome, reward)
+
+        fight = live & waiting & (actions >= 4) & (actions < fights)
+        rows = numpy.flatnonzero(fight)
+        cells = self.pending[rows]
+        self.pending[rows] = NONE
+        weapon = actions[rows] - 4
+        held = (self.weapons[rows] >> weapon) & 1 == 1
+        outcome[rows[~held]] = _CODES[INVALID_WEAPON]
+        rows, cells, weapon = rows[held], cells[held], weapon[held]
+        wins = self._wins[weapon, self.enemy[rows, cells]]
+        lost = rows[~wins]
+        self.finished[lost] = True
+        outcome[lost] = _CODES[FIGHT_LOST]
+        reward[lost] = -1.0
+        rows, cells = rows[wins], cells[wins]
+        self.defeated[rows, cells] = True
+        outcome[rows] = _CODES[FIGHT_WON]
+        self._finish(rows, cells, outcome, reward)
+
+        decline = live & waiting & (actions == fights)
+        self.pending[decline] = NONE
+        outcome[decline] = _CODES[DECLINED]
+        return self.observe(), reward, self.finished.copy(), {"outcome": outcome}
+
+
+def _engine_step(engine, action: int, names: list[str]) -> None:
+    """Apply an action of VectorEnv to an Engine."""
+    if action < 4:
+        engine.move(DIRECTIONS[action])
+    elif action < 4 + len(names):
+        name = names[action - 4]
+        weapon_ids = [i for i, weapon in enumerate(engine.player.weapons) if weapon.name == name]
+        engine.fight(weapon_ids[0] if weapon_ids else len(engine.player.weapons))
+    else:
+        engine.decline()
+
+
+def check(
+    num_envs: int = 64, steps: int = 500, width: int = 4, height: int = 4, seed: int = 0
+) -> tuple[int, int]:
+    """Play the same random actions on a VectorEnv and on Engines and compare them.
+
+    Args:
+        num_envs (int): The number of games.
+        steps (int): The number of steps.
+        width (int): The number of columns of the maps.
+        height (int): The number of rows of the maps.
+        seed (int): The seed of the games and the actions.
+
+    Raises:
+        AssertionError: If a game differs.
+
+    Returns:
+        tuple[int, int]: The number of games over and of games won.
+    """
+    env = VectorEnv(num_envs, width, height, seed)
+    engines = [
+        Map(Player("Bot"), Random(int(s)), width, height).engine for s in env.seeds
+    ]
+    rng = numpy.random.default_rng(seed)
+    for _ in range(steps):
+        # Moves, and when an enemy is waiting mostly the winning weapon, so
+        # that games get far enough to be won.
+        actions = rng.integers(0, 4, num_envs)
+        rows = numpy.flatnonzero(env.pending != NONE)
+        enemy = env.enemy[rows, env.pending[rows]]
+        winning = numpy.argmax(env._wins[:, enemy], axis=0)
+        guess = rng.integers(4, env.action_count, len(rows))
+        actions[rows] = numpy.where(rng.random(len(rows)) < 0.75, 4 + winning, guess)
+        env.step(actions)
+        for i, engine in enumerate(engines):
+            _engine_step(engine, int(actions[i]), env.names)
+            player = engine.player
+            assert env.position[i] == engine.grid.index(*player.current_room), i
+            assert env.cleared_count[i] == player.cleared_count(), i
+            assert env.finished[i] == engine.finished and env.won[i] == engine.won, i
+            pending = NONE if engine.pending is None else engine.grid.index(*engine.pending)
+            assert env.pending[i] == pending, i
+            assert env.weapons[i] == sum({1 << env.names.index(w.name) for w in player.weapons}), i
+    return int(env.finished.sum()), int(env.won.sum())
+
+
+def bench(num_envs: int, width: int, height: int, steps: int) -> dict[str, float]:
+    """Compare stepping a VectorEnv with stepping Engines one by one.
+
+    Args:
+        num_envs (int): The number of games.
+        width (int): The number of columns of the maps.
+        height (int): The number of rows of the maps.
+        steps (int): The number of steps.
+
+    Returns:
+        dict[str, float]: The game steps per second of both.
+    """
+    env = VectorEnv(num_envs, width, height)
+    rng = numpy.random.default_rng(0)
+    actions = rng.integers(0, 4, (steps, num_envs))
+    began = time.perf_counter()
+    for row in actions:
+        waiting = env.pending != NONE
+        row[waiting] = env.action_count - 1
+        env.step(row)
+    vector = num_envs * steps / (time.perf_counter() - began)
+    engines = [Map(Player("Bot"), Random(s), width, height).engine for s in range(num_envs)]
+    began = time.perf_counter()
+    for row in actions:
+        for engine, action in zip(engines, row.tolist()):
+            if engine.pending is not None:
+                engine.decline()
+            else:
+                engine.move(DIRECTIONS[action])
+    engine = num_envs * steps / (time.perf_counter() - began)
+    return {
+        "vector_steps_per_sec": vector,
+        "engine_steps_per_sec": engine,
+        "speedup": vector / engine,
+    }
+
+
+def main() -> None:
+    """Benchmark or check the vectorized environment."""
+    parser = argparse.ArgumentParser(description="Step many games at once.")
+    parser.add_argument("--envs", type=int, default=4096)
+    parser.add_argument("--width", type=int, default=10)
+    parser.add_argument("--height", type=int, default=10)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--check", action="store_true", help="compare the rules with Engine")
+    args = parser.parse_args()
+    if args.check:
+        over, won = check(width=args.width, height=args.height)
+        print(f"The games match, {over} of them are over and {won} won.")
+        return
+    for name, value in bench(args.envs, args.width, args.height, args.steps).items():
+        print(f"{name}: {value:.1f}")
+
+
+if __name__ == "__main__":
+    main()